@@ -0,0 +1,128 @@
+# bench_api_latency.py
+#
+# /predict latency percentiles under many concurrent keep-alive connections, against a
+# single API process started in a scratch directory. Every request carries a different
+# amount, so the prediction cache does not hide the scoring cost.
+#
+# Pass --project-root to start the API from another checkout (e.g. an older commit in a
+# git worktree) and compare before/after with the same load.
+#
+# How to run (from the project root, next to fraud_detection_model.joblib):
+#     python benchmarks/bench_api_latency.py [--connections 500] [--seconds 15] [--project-root PATH]
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- Configuration ---
+MODEL_FILENAME = "fraud_detection_model.joblib"
+HOST = "127.0.0.1"
+PORT = 8796
+
+SAMPLE_TRANSACTION = {
+    'customer': 'C1093826151', 'step': 20, 'age': '3', 'gender': 'M', 'zipcodeOri': '28007',
+    'merchant': 'M348934600', 'zipMerchant': '28007', 'category': 'es_transportation', 'amount': 2500.0,
+}
+
+
+def request_bytes(path, body):
+    return (f"POST {path} HTTP/1.1\r\nHost: {HOST}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+async def connection(deadline, latencies, errors):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            body = json.dumps(dict(SAMPLE_TRANSACTION, amount=round(rng.uniform(1, 5000), 2))).encode()
+            started = time.perf_counter()
+            writer.write(request_bytes("/predict", body))
+            status = await read_response(reader)
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors.append(status)
+    except (OSError, asyncio.IncompleteReadError) as e:
+        errors.append(type(e).__name__)
+    finally:
+        writer.close()
+
+
+async def run_load(connections, seconds):
+    latencies, errors = [], []
+    deadline = time.perf_counter() + seconds
+    started = time.perf_counter()
+    await asyncio.gather(*[connection(deadline, latencies, errors) for _ in range(connections)])
+    return latencies, errors, time.perf_counter() - started
+
+
+def wait_until_ready(timeout=120.0):
+    import http.client
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, PORT, timeout=5)
+            conn.request("POST", "/predict", json.dumps(SAMPLE_TRANSACTION), {"Content-Type": "application/json"})
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("The API did not come up")
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures /predict latency under concurrent connections.")
+    parser.add_argument("--connections", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=15.0)
+    parser.add_argument("--project-root", default=PROJECT_ROOT, help="checkout to start the API from")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(MODEL_FILENAME, os.path.join(directory, MODEL_FILENAME))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "prediction_service.main:app", "--host", HOST, "--port", str(PORT),
+             "--log-level", "warning", "--backlog", "4096"],
+            cwd=directory, env=dict(os.environ, PYTHONPATH=os.path.abspath(args.project_root)),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready()
+            latencies, errors, elapsed = asyncio.run(run_load(args.connections, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+
+    latencies.sort()
+    print(f"--- API Latency Benchmark ({args.connections} connections, {args.seconds:.0f} s, "
+          f"{os.path.abspath(args.project_root)}) ---")
+    if latencies:
+        print(f"requests: {len(latencies)} ok, {len(errors)} failed, {len(latencies) / elapsed:,.0f} req/s")
+        print(f"latency (ms): p50 {percentile(latencies, 0.50):.1f}, p90 {percentile(latencies, 0.90):.1f}, "
+              f"p99 {percentile(latencies, 0.99):.1f}, max {latencies[-1]:.1f}")
+    else:
+        print(f"no successful requests ({len(errors)} failed)")
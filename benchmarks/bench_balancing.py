@@ -0,0 +1,106 @@
+# bench_balancing.py
+#
+# Cost and quality of each class-balancing strategy (data_ingestion_and_retraining/
+# balancing.py) at several training-set sizes, drawn from the local feature store the
+# same way run_training_from_store() samples it. Each (size, strategy) pair runs in a
+# fresh process so its peak RSS is its own. Reported per run:
+#   - balancing time and peak traced memory, rows after balancing
+#   - forest fit time and the process's peak RSS
+#   - fraud precision / recall / F1 at 0.5, ROC AUC and average precision on a
+#     held-out 30% that keeps the real class distribution
+#
+# How to run (from the project root, after `python data_ingestion_and_retraining/feature_store.py snapshot`):
+#     python benchmarks/bench_balancing.py [--rows 150000 1000000] [--strategies smote undersample] [--trees 100]
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- Configuration ---
+DEFAULT_ROWS = [150000, 1000000]
+DEFAULT_TREES = 100
+
+
+def run_one(store_dir, rows, strategy, trees):
+    """Child process: sample, split, balance, fit and evaluate once; prints a JSON report."""
+    sys.path.insert(0, PROJECT_ROOT)
+    import numpy as np
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import precision_recall_fscore_support, roc_auc_score, average_precision_score
+    from sklearn.model_selection import train_test_split
+    from data_ingestion_and_retraining.balancing import balance, forest_params
+    from data_ingestion_and_retraining.feature_store import FeatureStore, sample_training_matrix
+    from data_ingestion_and_retraining.streaming_loader import peak_rss_mb
+
+    store = FeatureStore(store_dir)
+    X, y = sample_training_matrix(store, rows, random_state=42)
+    X = pd.DataFrame(X, columns=store.feature_names)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    X_train, y_train = balance(X_train, y_train, strategy, random_state=42)
+    balance_seconds = time.perf_counter() - started
+    _, balance_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    model = RandomForestClassifier(n_estimators=trees, random_state=42, n_jobs=-1, **forest_params(strategy))
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    probabilities = model.predict_proba(X_test)[:, 1]
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        y_test, probabilities >= 0.5, average='binary', zero_division=0)
+    print(json.dumps({
+        "rows": len(y), "fraud_rows": int((y == 1).sum()), "train_rows": len(y_train),
+        "balance_s": balance_seconds, "balance_peak_mb": balance_peak / 1e6,
+        "fit_s": fit_seconds, "peak_rss_mb": peak_rss_mb(),
+        "precision": precision, "recall": recall, "f1": f1,
+        "roc_auc": roc_auc_score(y_test, probabilities),
+        "avg_precision": average_precision_score(y_test, probabilities),
+        "fraud_rate_test": float(np.mean(y_test == 1)),
+    }))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, PROJECT_ROOT)
+    from data_ingestion_and_retraining.balancing import STRATEGIES
+    from data_ingestion_and_retraining.feature_store import FEATURE_STORE_DIR
+
+    parser = argparse.ArgumentParser(description="Compares class-balancing strategies.")
+    parser.add_argument("--store", default=FEATURE_STORE_DIR, help="feature store directory")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="training sample sizes")
+    parser.add_argument("--strategies", nargs="+", choices=STRATEGIES, default=STRATEGIES)
+    parser.add_argument("--trees", type=int, default=DEFAULT_TREES)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_one(args.store, args.rows[0], args.strategies[0], args.trees)
+        sys.exit(0)
+
+    print(f"--- Balancing Benchmark ({args.trees} trees, feature store '{args.store}') ---")
+    print(f"{'rows':>9} {'strategy':<14} {'train rows':>10} {'balance s':>9} {'bal. MB':>8} {'fit s':>8} "
+          f"{'RSS MB':>7} {'prec':>6} {'recall':>6} {'F1':>6} {'ROC AUC':>7} {'AP':>6}")
+    for rows in args.rows:
+        for strategy in args.strategies:
+            child = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", "--store", args.store,
+                 "--rows", str(rows), "--strategies", strategy, "--trees", str(args.trees)],
+                capture_output=True, text=True)
+            if child.returncode != 0:
+                print(f"{rows:>9} {strategy:<14} failed: {child.stderr.strip().splitlines()[-1]}")
+                continue
+            r = json.loads(child.stdout.strip().splitlines()[-1])
+            print(f"{r['rows']:>9} {strategy:<14} {r['train_rows']:>10} {r['balance_s']:>9.2f} "
+                  f"{r['balance_peak_mb']:>8.0f} {r['fit_s']:>8.1f} {r['peak_rss_mb'] or 0:>7.0f} "
+                  f"{r['precision']:>6.3f} {r['recall']:>6.3f} {r['f1']:>6.3f} {r['roc_auc']:>7.4f} "
+                  f"{r['avg_precision']:>6.3f}", flush=True)
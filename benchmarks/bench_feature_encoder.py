@@ -0,0 +1,76 @@
+# bench_feature_encoder.py
+#
+# Microbenchmark: the old pandas encoding path (Categorical + get_dummies + reindex)
+# against the precompiled FeatureEncoder, for single rows and for batches.
+#
+# How to run (from the project root):
+#     python benchmarks/bench_feature_encoder.py
+
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.feature_encoder import FeatureEncoder, AGE_CATEGORIES, GENDER_CATEGORIES
+
+# --- Configuration ---
+SINGLE_ROW_ITERATIONS = 2000
+BATCH_SIZE = 500
+BATCH_ITERATIONS = 50
+
+SAMPLE_TRANSACTION = {
+    'customer': 'C1093826151', 'step': 20, 'age': '3', 'gender': 'M', 'zipcodeOri': '28007',
+    'merchant': 'M348934600', 'zipMerchant': '28007', 'category': 'es_transportation', 'amount': 2500.0,
+}
+
+
+def pandas_encode(records, feature_names):
+    """The encoding path /predict used before FeatureEncoder."""
+    input_df = pd.DataFrame(records)
+    input_df['age'] = pd.Categorical(input_df['age'], categories=AGE_CATEGORIES)
+    input_df['gender'] = pd.Categorical(input_df['gender'], categories=GENDER_CATEGORIES)
+    final_df = pd.get_dummies(input_df, columns=['age', 'gender'], drop_first=True)
+    return final_df.reindex(columns=feature_names, fill_value=0)
+
+
+def time_per_call(function, iterations):
+    started = time.perf_counter()
+    for _ in range(iterations):
+        function()
+    return (time.perf_counter() - started) / iterations
+
+
+def make_batch(size, seed=42):
+    rng = np.random.default_rng(seed)
+    return [
+        dict(SAMPLE_TRANSACTION, step=int(rng.integers(0, 180)), amount=float(rng.exponential(40.0)),
+             age=str(rng.choice(AGE_CATEGORIES)), gender=str(rng.choice(GENDER_CATEGORIES)))
+        for _ in range(size)
+    ]
+
+
+if __name__ == "__main__":
+    encoder = FeatureEncoder.for_training()
+    feature_names = encoder.feature_names
+    batch = make_batch(BATCH_SIZE)
+
+    # Both paths must produce the same matrix before their timings mean anything.
+    expected = pandas_encode(batch, feature_names).to_numpy(dtype=np.float64)
+    assert np.array_equal(expected, encoder.encode_many(batch)), "encoder output differs from pandas"
+
+    print("--- Feature Encoding Microbenchmark ---")
+    print(f"Features: {len(feature_names)} columns")
+
+    pandas_single = time_per_call(lambda: pandas_encode([SAMPLE_TRANSACTION], feature_names), SINGLE_ROW_ITERATIONS)
+    encoder_single = time_per_call(lambda: encoder.encode_one(SAMPLE_TRANSACTION), SINGLE_ROW_ITERATIONS)
+    print(f"\nSingle row ({SINGLE_ROW_ITERATIONS} iterations):")
+    print(f"  pandas   : {pandas_single * 1e6:10.1f} us/row")
+    print(f"  encoder  : {encoder_single * 1e6:10.1f} us/row  ({pandas_single / encoder_single:.0f}x faster)")
+
+    pandas_batch = time_per_call(lambda: pandas_encode(batch, feature_names), BATCH_ITERATIONS)
+    encoder_batch = time_per_call(lambda: encoder.encode_many(batch), BATCH_ITERATIONS)
+    print(f"\nBatch of {BATCH_SIZE} ({BATCH_ITERATIONS} iterations):")
+    print(f"  pandas   : {pandas_batch * 1e6 / BATCH_SIZE:10.2f} us/row")
+    print(f"  encoder  : {encoder_batch * 1e6 / BATCH_SIZE:10.2f} us/row  ({pandas_batch / encoder_batch:.1f}x faster)")
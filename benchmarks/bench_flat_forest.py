@@ -0,0 +1,77 @@
+# bench_flat_forest.py
+#
+# Compares the pickled RandomForestClassifier with its compiled FlatForest copy:
+# identical probabilities, artifact size, load time, memory and scoring latency.
+#
+# How to run (from the project root, next to fraud_detection_model.joblib):
+#     python benchmarks/bench_flat_forest.py
+
+import os
+import sys
+import time
+import tracemalloc
+import warnings
+import joblib
+import numpy as np
+import sklearn.ensemble  # imported up front so it isn't counted as model load time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.feature_encoder import FeatureEncoder, AGE_CATEGORIES, GENDER_CATEGORIES
+from prediction_service.flat_forest import FlatForest, export_flat_forest, artifact_bytes, COMPACT_MODEL_FILENAME
+
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# --- Configuration ---
+MODEL_FILENAME = "fraud_detection_model.joblib"
+ROWS = 20000
+BATCH_SIZES = [1, 64, 1024]
+REPEATS = 20
+
+
+def timed_load(load):
+    """Returns (object, seconds, traced MB allocated while loading)."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    loaded = load()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return loaded, elapsed, peak / 1e6
+
+
+def make_features(encoder, rows, seed=7):
+    rng = np.random.default_rng(seed)
+    records = [
+        {'step': int(rng.integers(0, 180)), 'amount': float(rng.exponential(40.0)),
+         'age': str(rng.choice(AGE_CATEGORIES)), 'gender': str(rng.choice(GENDER_CATEGORIES))}
+        for _ in range(rows)
+    ]
+    return encoder.encode_many(records)
+
+
+def latency_ms(model, X, batch_size):
+    started = time.perf_counter()
+    for _ in range(REPEATS):
+        model.predict_proba(X[:batch_size])
+    return (time.perf_counter() - started) / REPEATS * 1000
+
+
+if __name__ == "__main__":
+    if not os.path.exists(COMPACT_MODEL_FILENAME):
+        export_flat_forest(joblib.load(MODEL_FILENAME), COMPACT_MODEL_FILENAME)
+
+    sk_model, sk_load, sk_mem = timed_load(lambda: joblib.load(MODEL_FILENAME))
+    flat_model, flat_load, flat_mem = timed_load(lambda: FlatForest.load(COMPACT_MODEL_FILENAME))
+
+    X = make_features(FeatureEncoder(sk_model.feature_names_in_), ROWS)
+    expected, actual = sk_model.predict_proba(X), flat_model.predict_proba(X)
+    print("--- Flat Forest Benchmark ---")
+    print(f"Max |probability difference| over {ROWS} rows: {np.abs(expected - actual).max():.3g}")
+    print(f"Identical labels: {np.array_equal(sk_model.predict(X), flat_model.predict(X))}")
+
+    print(f"\n{'':22}{'sklearn':>12}{'flat':>12}")
+    print(f"{'artifact size (MB)':22}{os.path.getsize(MODEL_FILENAME) / 1e6:12.2f}{artifact_bytes(COMPACT_MODEL_FILENAME) / 1e6:12.2f}")
+    print(f"{'load time (ms)':22}{sk_load * 1000:12.1f}{flat_load * 1000:12.1f}")
+    print(f"{'load memory (MB)':22}{sk_mem:12.2f}{flat_mem:12.2f}")
+    for batch_size in BATCH_SIZES:
+        print(f"{f'score {batch_size} row(s) (ms)':22}{latency_ms(sk_model, X, batch_size):12.3f}{latency_ms(flat_model, X, batch_size):12.3f}")
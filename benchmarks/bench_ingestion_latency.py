@@ -0,0 +1,92 @@
+# bench_ingestion_latency.py
+#
+# End-to-end "queued by the API -> row in the database" latency of the event-driven
+# database worker, run against the local SQLite stand-in. The API side is simulated
+# with the same SegmentLogWriter + QueueNotifier pair and record encoding
+# (FRAUD_QUEUE_RECORD_FORMAT) that prediction_service/main.py uses.
+#
+# How to run (from the project root):
+#     python benchmarks/bench_ingestion_latency.py
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+from prediction_service.segment_log import SegmentLogWriter
+from prediction_service.record_codec import encode_records
+from prediction_service.queue_notify import QueueNotifier, STATUS_FILENAME
+from prediction_service.db_connection import connect_sqlite
+
+# --- Configuration ---
+NOTIFY_PORT = 8799
+SINGLE_RECORDS = 200
+BURST_RECORDS = 20000
+BURST_APPEND_SIZE = 64
+
+SAMPLE_TRANSACTION = {
+    'customer': 'C1093826151', 'step': 20, 'age': '3', 'gender': 'M', 'zipcodeOri': '28007',
+    'merchant': 'M348934600', 'zipMerchant': '28007', 'category': 'es_transportation', 'amount': 2500.0, 'fraud': 0,
+}
+
+
+def wait_for_rows(conn, expected, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if conn.execute("SELECT COUNT(*) FROM fraud_data").fetchone()[0] >= expected:
+            return time.perf_counter()
+        time.sleep(0.0005)
+    raise TimeoutError(f"Worker did not insert {expected} rows within {timeout} s")
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        connect_sqlite(os.path.join(directory, "bench.db")).close()  # creates fraud_data
+        worker = subprocess.Popen(
+            [sys.executable, os.path.join(PROJECT_ROOT, "prediction_service", "database_worker.py"),
+             "--sqlite", "bench.db", "--notify-port", str(NOTIFY_PORT)],
+            cwd=directory, stdout=subprocess.DEVNULL)
+        try:
+            status_file = os.path.join(directory, "transactions_queue", STATUS_FILENAME)
+            while not os.path.exists(status_file):  # the worker publishes it after its first drain
+                time.sleep(0.01)
+
+            writer = SegmentLogWriter(os.path.join(directory, "transactions_queue"))
+            notifier = QueueNotifier(port=NOTIFY_PORT)
+            conn = sqlite3.connect(os.path.join(directory, "bench.db"), timeout=30)
+            single = encode_records([SAMPLE_TRANSACTION])
+            burst = encode_records([SAMPLE_TRANSACTION] * BURST_APPEND_SIZE)
+
+            latencies = []
+            for number in range(1, SINGLE_RECORDS + 1):
+                started = time.perf_counter()
+                writer.append(single)
+                notifier.notify(1)
+                latencies.append((wait_for_rows(conn, number) - started) * 1000)
+
+            started = time.perf_counter()
+            for _ in range(0, BURST_RECORDS, BURST_APPEND_SIZE):
+                writer.append(burst)
+                notifier.notify(BURST_APPEND_SIZE)
+            burst_seconds = wait_for_rows(conn, SINGLE_RECORDS + BURST_RECORDS) - started
+            writer.close()
+        finally:
+            worker.terminate()
+            worker.wait()
+
+    print("--- Ingestion Latency Benchmark (SQLite stand-in) ---")
+    print(f"Single transactions ({SINGLE_RECORDS}): prediction -> row in DB "
+          f"p50 {percentile(latencies, 0.50):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, "
+          f"max {max(latencies):.1f} ms")
+    print(f"Burst of {BURST_RECORDS}: all rows in DB after {burst_seconds:.2f} s "
+          f"({BURST_RECORDS / burst_seconds:,.0f} rows/sec)")
+    print("(The previous fixed 5-second poll put the floor of this latency at up to 5000 ms.)")
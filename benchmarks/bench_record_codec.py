@@ -0,0 +1,65 @@
+# bench_record_codec.py
+#
+# Size and speed of the transaction queue record formats (prediction_service/record_codec.py)
+# on synthetic transactions (benchmarks/synthetic_data.py):
+#   - bytes per record on disk, including the segment log's 8-byte frame header
+#   - encoding throughput on the API side, per queue write of `batch` records
+#   - decoding throughput on the worker side, from payloads to insert rows
+# for JSON lines and for binary batches. Every format must give the worker the same rows
+# before its timings mean anything. Under load the API coalesces many requests into one
+# queue write, so the larger batch sizes are the common case.
+#
+# How to run (from the project root):
+#     python benchmarks/bench_record_codec.py [--records 100000]
+
+import argparse
+import os
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "benchmarks"))
+from prediction_service.record_codec import encode_records
+from prediction_service.segment_log import FRAME_HEADER
+from prediction_service.database_worker import parse_records
+from synthetic_data import api_transactions
+
+# --- Configuration ---
+DEFAULT_RECORDS = 100000
+BATCH_SIZES = [1, 64, 1024]
+FORMATS = ["json", "binary"]
+
+
+def encode_all(records, record_format, batch_size):
+    payloads = []
+    for start in range(0, len(records), batch_size):
+        payloads.extend(encode_records(records[start:start + batch_size], record_format))
+    return payloads
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the transaction queue record formats.")
+    parser.add_argument("--records", type=int, default=DEFAULT_RECORDS)
+    args = parser.parse_args()
+
+    records = [dict(record, fraud=0) for record in api_transactions(args.records)]
+    expected, _ = parse_records(encode_all(records, "json", 1))
+    print(f"--- Queue Record Format Benchmark ({len(records):,} transactions) ---")
+    print(f"{'format':<8} {'batch':>6} {'bytes/record':>13} {'encode':>16} {'decode':>16} {'encode us/rec':>14} {'decode us/rec':>14}")
+
+    for record_format in FORMATS:
+        for batch_size in BATCH_SIZES:
+            started = time.perf_counter()
+            payloads = encode_all(records, record_format, batch_size)
+            encode_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            rows, malformed = parse_records(payloads)
+            decode_seconds = time.perf_counter() - started
+            assert not malformed and rows == expected, f"{record_format} records decode to different rows"
+
+            size = sum(len(payload) + FRAME_HEADER.size for payload in payloads) / len(records)
+            print(f"{record_format:<8} {batch_size:>6} {size:>13.1f} "
+                  f"{len(records) / encode_seconds:>11,.0f} rec/s {len(records) / decode_seconds:>11,.0f} rec/s "
+                  f"{encode_seconds / len(records) * 1e6:>14.2f} {decode_seconds / len(records) * 1e6:>14.2f}", flush=True)
@@ -0,0 +1,79 @@
+# bench_segment_log.py
+#
+# Append throughput of the segmented transaction queue with several concurrent writer
+# processes, while a reader streams and commits in parallel. At the end every record
+# must have been delivered exactly once.
+#
+# How to run (from the project root):
+#     python benchmarks/bench_segment_log.py
+
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.segment_log import SegmentLogWriter, SegmentLogReader
+
+# --- Configuration ---
+WRITERS = 4
+RECORDS_PER_WRITER = 50000
+APPEND_BATCH = 8
+SEGMENT_BYTES = 4 * 1024 * 1024  # small segments, so rolling and cleanup are exercised
+
+SAMPLE_TRANSACTION = {
+    'customer': 'C1093826151', 'step': 20, 'age': '3', 'gender': 'M', 'zipcodeOri': '28007',
+    'merchant': 'M348934600', 'zipMerchant': '28007', 'category': 'es_transportation', 'amount': 2500.0, 'fraud': 0,
+}
+
+
+def write_records(directory, writer_number, results):
+    writer = SegmentLogWriter(directory, segment_bytes=SEGMENT_BYTES)
+    started = time.perf_counter()
+    for first in range(0, RECORDS_PER_WRITER, APPEND_BATCH):
+        batch = [json.dumps(dict(SAMPLE_TRANSACTION, customer=f"W{writer_number}-{sequence}")).encode('utf-8')
+                 for sequence in range(first, min(first + APPEND_BATCH, RECORDS_PER_WRITER))]
+        writer.append(batch)
+    writer.close()
+    results.put(time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as directory:
+        results = multiprocessing.Queue()
+        writers = [multiprocessing.Process(target=write_records, args=(directory, number, results))
+                   for number in range(WRITERS)]
+        started = time.perf_counter()
+        for process in writers:
+            process.start()
+
+        reader = SegmentLogReader(directory)
+        delivered, expected = [], WRITERS * RECORDS_PER_WRITER
+        deadline = time.time() + 120
+        while len(delivered) < expected and time.time() < deadline:
+            records = reader.read(max_records=20000)
+            if records:
+                delivered.extend(json.loads(record)['customer'] for record in records)
+                reader.commit()
+            else:
+                time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        for process in writers:
+            process.join()
+        writer_seconds = [results.get() for _ in writers]
+        reader.read()
+        reader.commit()  # lets the reader remove the partitions of the closed writers
+        leftover = [name for name in os.listdir(directory) if os.path.isdir(os.path.join(directory, name))]
+
+        record_bytes = len(json.dumps(SAMPLE_TRANSACTION)) + 8
+        print("--- Segment Log Benchmark ---")
+        print(f"Writers: {WRITERS} processes x {RECORDS_PER_WRITER} records, {APPEND_BATCH} records per append")
+        print(f"Append throughput per writer: {RECORDS_PER_WRITER / max(writer_seconds):,.0f} records/s (slowest writer)")
+        print(f"Aggregate append throughput: {expected / max(writer_seconds):,.0f} records/s, "
+              f"{expected * record_bytes / max(writer_seconds) / 1e6:.1f} MB/s")
+        print(f"End-to-end delivery: {len(delivered):,} records in {elapsed:.2f} s")
+        print(f"Lost: {expected - len(set(delivered))}, duplicated: {len(delivered) - len(set(delivered))}")
+        print(f"Partitions left after cleanup: {len(leftover)}")
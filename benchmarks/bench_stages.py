@@ -0,0 +1,192 @@
+# bench_stages.py
+#
+# Stage-by-stage cost of the whole pipeline on synthetic data (benchmarks/synthetic_data.py)
+# in a scratch directory with a SQLite stand-in, so it runs anywhere:
+#   - training: streaming the sample from the database, balancing (SMOTE), forest fit,
+#     and the quality of the resulting model on a held-out part
+#   - serving: velocity features, encoding, scoring with the pickled and the compiled
+#     forest (single rows and batches), appending to the transaction queue
+#   - ingestion: the database worker flushing the queue into SQLite
+# Every measurement is a named metric with its unit and whether lower or higher is better,
+# which is what benchmarks/run_suite.py stores and compares between commits.
+#
+# How to run (from the project root):
+#     python benchmarks/bench_stages.py [--rows 300000] [--trees 100]
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "benchmarks"))
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import average_precision_score, precision_recall_fscore_support
+from sklearn.model_selection import train_test_split
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.flat_forest import FlatForest
+from prediction_service.segment_log import SegmentLogWriter
+from prediction_service.record_codec import encode_records, RECORD_FORMAT
+from prediction_service.velocity import VelocityFeatures
+from prediction_service.db_connection import DatabaseConnection, connect_sqlite
+from prediction_service import database_worker
+from data_ingestion_and_retraining.streaming_loader import load_training_sample
+from data_ingestion_and_retraining.training_pipeline import prepare_features
+from data_ingestion_and_retraining.balancing import balance, forest_params
+from synthetic_data import api_transactions, write_sqlite
+
+# Scoring is measured on plain NumPy rows, like the API does
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+# --- Configuration ---
+DEFAULT_ROWS = 300000
+DEFAULT_SAMPLE_SIZE = 150000
+DEFAULT_TREES = 100
+DEFAULT_STRATEGY = "smote"
+BATCH_SIZE = 64
+SINGLE_ITERATIONS = 300
+BATCH_ITERATIONS = 50
+REPEATS = 5
+QUEUE_RECORDS = 50000
+
+
+def metric(value, unit, better="lower"):
+    return {"value": float(value), "unit": unit, "better": better}
+
+
+def per_call(function, iterations, repeats=REPEATS):
+    """Median over `repeats` rounds of the mean seconds per call."""
+    function()  # warm-up
+    rounds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            function()
+        rounds.append((time.perf_counter() - started) / iterations)
+    return statistics.median(rounds)
+
+
+def training_stages(database, sample_size, trees, strategy, results):
+    """Load, balance and fit like the training pipeline, then score the held-out part. Returns the model."""
+    conn = sqlite3.connect(database)
+    try:
+        sample, stats = load_training_sample(conn, sample_size)
+    finally:
+        conn.close()
+    results["training.load_rows_per_sec"] = metric(stats["rows_per_sec"], "rows/s", "higher")
+
+    X, y = prepare_features(sample.to_frame())
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
+    started = time.perf_counter()
+    X_balanced, y_balanced = balance(X_train, y_train, strategy, random_state=42)
+    results[f"training.balance_{strategy}_seconds"] = metric(time.perf_counter() - started, "s")
+
+    model = RandomForestClassifier(n_estimators=trees, random_state=42, n_jobs=-1, **forest_params(strategy))
+    started = time.perf_counter()
+    model.fit(X_balanced, y_balanced)
+    results["training.fit_seconds"] = metric(time.perf_counter() - started, "s")
+
+    probabilities = model.predict_proba(X_test)[:, 1]
+    precision, recall, _, _ = precision_recall_fscore_support(y_test, probabilities >= 0.5, average='binary', zero_division=0)
+    results["model.fraud_precision"] = metric(precision, "ratio", "higher")
+    results["model.fraud_recall"] = metric(recall, "ratio", "higher")
+    results["model.average_precision"] = metric(average_precision_score(y_test, probabilities), "ratio", "higher")
+    return model
+
+
+def serving_stages(model, transactions, directory, results):
+    """Per-request costs of the /predict path, one stage at a time."""
+    velocity = VelocityFeatures()
+    single, batch = transactions[:1], transactions[:BATCH_SIZE]
+    encoder = FeatureEncoder(model.feature_names_in_)
+    # Velocity state is fed the whole stream first, so lookups hit populated keys
+    velocity.observe_many(transactions)
+    results["velocity.single_us"] = metric(per_call(lambda: velocity.observe_many(single), SINGLE_ITERATIONS) * 1e6, "us")
+    results["velocity.batch_us_per_row"] = metric(
+        per_call(lambda: velocity.observe_many(batch), BATCH_ITERATIONS) * 1e6 / BATCH_SIZE, "us")
+
+    single_extra, batch_extra = velocity.observe_many(single), velocity.observe_many(batch)
+    results["encode.single_us"] = metric(
+        per_call(lambda: encoder.encode_one(single[0], single_extra), SINGLE_ITERATIONS) * 1e6, "us")
+    results["encode.batch_us_per_row"] = metric(
+        per_call(lambda: encoder.encode_many(batch, batch_extra), BATCH_ITERATIONS) * 1e6 / BATCH_SIZE, "us")
+
+    X_single = encoder.encode_one(single[0], single_extra).copy()
+    X_batch = encoder.encode_many(batch, batch_extra)
+    for name, scorer in (("sklearn", model), ("compact", FlatForest.from_sklearn(model))):
+        results[f"score.{name}.single_us"] = metric(
+            per_call(lambda: scorer.predict_proba(X_single), SINGLE_ITERATIONS // 3) * 1e6, "us")
+        results[f"score.{name}.batch_us_per_row"] = metric(
+            per_call(lambda: scorer.predict_proba(X_batch), BATCH_ITERATIONS // 5) * 1e6 / BATCH_SIZE, "us")
+
+    # Queue append: records encoded (FRAUD_QUEUE_RECORD_FORMAT) and appended BATCH_SIZE at a time, like the API's buffer does
+    queue_dir = os.path.join(directory, "transactions_queue")
+    records = [dict(record, fraud=0) for record in transactions[:QUEUE_RECORDS]]
+    writer = SegmentLogWriter(queue_dir)
+    started = time.perf_counter()
+    for start in range(0, len(records), BATCH_SIZE):
+        writer.append(encode_records(records[start:start + BATCH_SIZE]))
+    writer.close()
+    results["queue.append_us_per_record"] = metric((time.perf_counter() - started) * 1e6 / len(records), "us")
+    queue_bytes = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(queue_dir) for name in names)
+    results[f"queue.{RECORD_FORMAT}_bytes_per_record"] = metric(queue_bytes / len(records), "bytes")
+    return queue_dir
+
+
+def ingestion_stages(queue_dir, directory, results):
+    """The database worker draining the queue written by serving_stages into a fresh SQLite file."""
+    target = os.path.join(directory, "ingested.db")
+    database_worker.TRANSACTION_QUEUE_DIR = queue_dir
+    database_worker.DEAD_LETTER_FILE = os.path.join(directory, "dead_letter.log")
+    database_worker.reader = None
+    database_worker.database = DatabaseConnection(lambda: connect_sqlite(target))
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        database_worker.drain_queue()
+    elapsed = time.perf_counter() - started
+    database_worker.database.close()
+    conn = sqlite3.connect(target)
+    rows = conn.execute("SELECT COUNT(*) FROM fraud_data").fetchone()[0]
+    conn.close()
+    results["worker.flush_rows_per_sec"] = metric(rows / elapsed, "rows/s", "higher")
+
+
+def run_stages(directory, rows=DEFAULT_ROWS, sample_size=DEFAULT_SAMPLE_SIZE, trees=DEFAULT_TREES,
+               strategy=DEFAULT_STRATEGY, seed=42):
+    """Runs every stage in `directory`. Returns ({metric name: metric}, trained model)."""
+    results = {}
+    database = os.path.join(directory, "synthetic.db")
+    write_sqlite(database, rows, seed)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        model = training_stages(database, sample_size, trees, strategy, results)
+    model.set_params(n_jobs=1)  # the API scores one request at a time per thread
+    queue_dir = serving_stages(model, api_transactions(min(rows, QUEUE_RECORDS), seed + 1), directory, results)
+    ingestion_stages(queue_dir, directory, results)
+    return results, model
+
+
+def print_results(results):
+    for name, result in results.items():
+        print(f"  {name:<38} {result['value']:>14,.3f} {result['unit']:<7} ({result['better']} is better)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures every stage of the pipeline on synthetic data.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="rows in the synthetic SQLite database")
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE)
+    parser.add_argument("--trees", type=int, default=DEFAULT_TREES)
+    parser.add_argument("--strategy", default=DEFAULT_STRATEGY, help="class-balancing strategy (see balancing.py)")
+    args = parser.parse_args()
+
+    print(f"--- Pipeline Stage Benchmark ({args.rows:,} synthetic rows, {args.trees} trees, {args.strategy}) ---")
+    with tempfile.TemporaryDirectory() as directory:
+        results, _ = run_stages(directory, args.rows, args.sample_size, args.trees, args.strategy)
+    print_results(results)
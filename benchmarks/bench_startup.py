@@ -0,0 +1,115 @@
+# bench_startup.py
+#
+# Cold start of API worker processes: N workers are started at the same time, each
+# imports prediction_service.main and loads the model exactly as startup_event does,
+# then scores one transaction. Reported per model format:
+#   - time to first prediction (process spawn -> first score returned)
+#   - model load time
+#   - per-worker RSS, and PSS (RSS with shared pages split between the processes
+#     mapping them; Linux only) - the memory each extra worker really costs.
+#
+# How to run (from the project root, next to fraud_detection_model.joblib):
+#     python benchmarks/bench_startup.py [workers]
+
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- Configuration ---
+MODEL_FILENAME = "fraud_detection_model.joblib"
+DEFAULT_WORKERS = 4
+FORMATS = ["joblib", "compact"]
+
+
+def memory_kb():
+    """(RSS, PSS) of this process in KB; PSS is None where /proc/self/smaps_rollup is missing."""
+    values = {}
+    for path in ("/proc/self/status", "/proc/self/smaps_rollup"):
+        try:
+            with open(path, 'r') as f:
+                for line in f:
+                    name, _, rest = line.partition(':')
+                    if name in ("VmRSS", "Pss"):
+                        values[name] = int(rest.split()[0])
+        except OSError:
+            pass
+    if "VmRSS" not in values:
+        import resource
+        values["VmRSS"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return values["VmRSS"], values.get("Pss")
+
+
+def run_worker(spawned_at):
+    """Child process: start like an API worker, score once, report, then wait to be released."""
+    sys.path.insert(0, PROJECT_ROOT)
+    with contextlib.redirect_stdout(sys.stderr):  # stdout carries the reports
+        from prediction_service import main
+
+        main.load_model()
+        loaded = main.active
+        main.score(main.encode_transactions([main.WARMUP_TRANSACTION], loaded), loaded)
+    first_prediction = time.time() - spawned_at
+
+    report = {"first_prediction_ms": first_prediction * 1000, "load_ms": loaded.load_ms, "filename": loaded.filename}
+    print(json.dumps(report), flush=True)
+    sys.stdin.readline()  # all workers stay alive until every one has reported
+    rss, pss = memory_kb()
+    print(json.dumps({"rss_kb": rss, "pss_kb": pss}), flush=True)
+    sys.stdin.readline()
+
+
+def start_workers(directory, model_format, workers):
+    env = dict(os.environ, FRAUD_MODEL_FORMAT=model_format)
+    processes = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", repr(time.time())],
+                         cwd=directory, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    reports = [json.loads(process.stdout.readline()) for process in processes]
+    # Memory is measured while every worker is alive, so shared pages are shared for real
+    for process in processes:
+        process.stdin.write("\n")
+        process.stdin.flush()
+    for process, report in zip(processes, reports):
+        report.update(json.loads(process.stdout.readline()))
+        process.stdin.write("\n")
+        process.stdin.close()
+        process.wait()
+    return reports
+
+
+def summary(values):
+    return f"{min(values):8.1f} {sum(values) / len(values):8.1f} {max(values):8.1f}"
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "--worker":
+        run_worker(float(sys.argv[2]))
+        sys.exit(0)
+
+    sys.path.insert(0, PROJECT_ROOT)
+    import joblib
+    from prediction_service.flat_forest import export_flat_forest, COMPACT_MODEL_FILENAME
+
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WORKERS
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(MODEL_FILENAME, os.path.join(directory, MODEL_FILENAME))
+        export_flat_forest(joblib.load(MODEL_FILENAME), os.path.join(directory, COMPACT_MODEL_FILENAME))
+
+        print(f"--- Startup Benchmark ({workers} workers started together; min / mean / max) ---")
+        for model_format in FORMATS:
+            reports = start_workers(directory, model_format, workers)
+            print(f"\n{model_format} ({os.path.basename(reports[0]['filename'])})")
+            print(f"  time to first prediction (ms) {summary([r['first_prediction_ms'] for r in reports])}")
+            print(f"  model load (ms)               {summary([r['load_ms'] for r in reports])}")
+            print(f"  RSS per worker (MB)           {summary([r['rss_kb'] / 1024 for r in reports])}")
+            if all(r['pss_kb'] is not None for r in reports):
+                print(f"  PSS per worker (MB)           {summary([r['pss_kb'] / 1024 for r in reports])}")
@@ -0,0 +1,90 @@
+# bench_velocity.py
+#
+# Cost of the per-customer / per-merchant velocity features (prediction_service/velocity.py)
+# on a synthetic stream in step order:
+#   - the API path: observe_many() for single requests and for micro-batches
+#   - the training batch path: add_to_frame() over DataFrame chunks
+#   - memory of the preallocated tables, and behaviour when the customer table is too
+#     small for the stream (evictions)
+# Both paths must produce the same features before their timings mean anything.
+#
+# How to run (from the project root):
+#     python benchmarks/bench_velocity.py [--rows 1000000] [--customers 100000]
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.velocity import VelocityFeatures
+
+# --- Configuration ---
+DEFAULT_ROWS = 1000000
+DEFAULT_CUSTOMERS = 100000
+MERCHANTS = 50
+STEPS = 180
+BATCH_SIZE = 64
+CHUNK_ROWS = 50000
+
+
+def make_stream(rows, customers, seed=42):
+    """A fraud_data-like stream sorted by step, with ids quoted the way the raw dataset quotes them."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'customer': [f"'C{c}'" for c in rng.integers(0, customers, rows)],
+        'merchant': [f"'M{m}'" for m in rng.integers(0, MERCHANTS, rows)],
+        'step': np.sort(rng.integers(0, STEPS, rows)),
+        'amount': rng.exponential(40.0, rows),
+    })
+
+
+def run_batch_path(stream, velocity):
+    features = [velocity.add_to_frame(stream.iloc[lo:lo + CHUNK_ROWS].copy())[velocity.feature_names].to_numpy()
+                for lo in range(0, len(stream), CHUNK_ROWS)]
+    return np.vstack(features)
+
+
+def run_api_path(records, velocity, batch_size):
+    return np.vstack([velocity.observe_many(records[lo:lo + batch_size]) for lo in range(0, len(records), batch_size)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the velocity feature state.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--customers", type=int, default=DEFAULT_CUSTOMERS)
+    args = parser.parse_args()
+
+    stream = make_stream(args.rows, args.customers)
+    # The API receives unquoted ids; both spellings must land on the same keys
+    records = [{'customer': c.strip("'"), 'merchant': m.strip("'"), 'step': int(s), 'amount': float(a)}
+               for c, m, s, a in stream.itertuples(index=False)]
+    print(f"--- Velocity Feature Benchmark ({args.rows:,} transactions, {args.customers:,} customers, "
+          f"{MERCHANTS} merchants, {STEPS} steps) ---")
+
+    velocity = VelocityFeatures()
+    started = time.perf_counter()
+    batch_features = run_batch_path(stream, velocity)
+    batch_seconds = time.perf_counter() - started
+    stats = velocity.stats()
+    table_mb = (stats['customers']['bytes'] + stats['merchants']['bytes']) / 1e6
+    print(f"Batch job   : {args.rows / batch_seconds:>10,.0f} rows/sec ({batch_seconds:.1f}s)")
+    print(f"State       : {stats['customers']['keys']:,} customers, {stats['merchants']['keys']:,} merchants, "
+          f"{table_mb:.0f} MB of preallocated arrays, {stats['customers']['evictions']:,} evictions")
+
+    for batch_size in (1, BATCH_SIZE):
+        velocity = VelocityFeatures()
+        started = time.perf_counter()
+        api_features = run_api_path(records, velocity, batch_size)
+        elapsed = time.perf_counter() - started
+        assert np.array_equal(batch_features, api_features), "API path features differ from the batch job"
+        print(f"API path    : {elapsed / args.rows * 1e6:>10.2f} us/transaction (batches of {batch_size})")
+
+    # A table too small for the active customers evicts the least recently active ones
+    small = VelocityFeatures(max_customers=max(args.customers // 10, 1))
+    small_features = run_batch_path(stream, small)
+    changed = np.mean(np.any(small_features != batch_features, axis=1))
+    print(f"Small table : {small.customers.max_keys:,} customer slots, {small.customers.evictions:,} evictions, "
+          f"{changed:.1%} of rows got different features")
@@ -0,0 +1,232 @@
+# load_driver.py
+#
+# Open-loop load driver for /predict and /predict/batch. Requests are sent on a fixed
+# Poisson arrival schedule at the target rate, whether or not earlier ones have been
+# answered, and every latency is measured from the request's *scheduled* send time. A
+# slow server therefore shows up as growing latency and backlog, instead of quietly
+# lowering the offered load the way a closed loop (send, wait, send again) does.
+#
+# The bodies are synthetic transactions (benchmarks/synthetic_data.py), so the prediction
+# cache and the velocity state see realistic traffic. Unless --port points at a running
+# server, the API is started in a scratch directory with the given model.
+#
+# How to run (from the project root, next to fraud_detection_model.joblib):
+#     python benchmarks/load_driver.py --rates 200 500 1000 [--endpoint batch --batch-size 64] [--seconds 10]
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "benchmarks"))
+from synthetic_data import api_transactions
+
+# --- Configuration ---
+MODEL_FILENAME = "fraud_detection_model.joblib"
+HOST = "127.0.0.1"
+PORT = 8795
+DEFAULT_RATES = [200, 500, 1000]
+DEFAULT_SECONDS = 10.0
+MAX_CONNECTIONS = 1000
+DISTINCT_TRANSACTIONS = 20000
+REQUEST_TIMEOUT_SECONDS = 30.0
+
+
+def request_bytes(path, body):
+    return (f"POST {path} HTTP/1.1\r\nHost: {HOST}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b"\r\n\r\n")
+    status = int(head.split(b" ", 2)[1])
+    length = 0
+    for line in head.split(b"\r\n"):
+        if line.lower().startswith(b"content-length:"):
+            length = int(line.split(b":", 1)[1])
+    await reader.readexactly(length)
+    return status
+
+
+def make_bodies(endpoint, batch_size, seed=42):
+    """Pre-encoded request bodies, cycled through during the run."""
+    transactions = api_transactions(DISTINCT_TRANSACTIONS, seed)
+    if endpoint == "predict":
+        return "/predict", [json.dumps(transaction).encode() for transaction in transactions]
+    return "/predict/batch", [json.dumps(transactions[start:start + batch_size]).encode()
+                              for start in range(0, len(transactions) - batch_size + 1, batch_size)]
+
+
+class ConnectionPool:
+    """Keep-alive connections; a request opens a new one when all are busy, up to a cap."""
+
+    def __init__(self, host, port, limit):
+        self.host, self.port = host, port
+        self.idle = []
+        self.opened = 0
+        self.slots = asyncio.Semaphore(limit)
+
+    async def request(self, data):
+        async with self.slots:
+            reader, writer = self.idle.pop() if self.idle else await self._open()
+            try:
+                writer.write(data)
+                status = await asyncio.wait_for(read_response(reader), REQUEST_TIMEOUT_SECONDS)
+            except BaseException:
+                writer.close()
+                raise
+            self.idle.append((reader, writer))
+            return status
+
+    async def _open(self):
+        self.opened += 1
+        return await asyncio.open_connection(self.host, self.port)
+
+    def close(self):
+        for _, writer in self.idle:
+            writer.close()
+
+
+async def drive(host, port, path, bodies, rate, seconds, max_connections=MAX_CONNECTIONS, seed=42):
+    """Offers `rate` requests/sec for `seconds`. Returns the raw observations."""
+    rng = random.Random(seed)
+    pool = ConnectionPool(host, port, max_connections)
+    latencies, statuses, lags = [], {}, []
+
+    async def fire(scheduled, data):
+        try:
+            status = await pool.request(data)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            status = type(e).__name__
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append((time.perf_counter() - scheduled) * 1000)
+
+    tasks = []
+    started = time.perf_counter()
+    scheduled = started
+    index = 0
+    while True:
+        scheduled += rng.expovariate(rate)
+        if scheduled - started >= seconds:
+            break
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lags.append((time.perf_counter() - scheduled) * 1000)  # how late the driver itself was
+        tasks.append(asyncio.create_task(fire(scheduled, request_bytes(path, bodies[index % len(bodies)]))))
+        index += 1
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    pool.close()
+    return {"sent": len(tasks), "latencies": latencies, "statuses": statuses, "lags": lags,
+            "elapsed": elapsed, "connections": pool.opened}
+
+
+def percentile(ordered, fraction):
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] if ordered else float('nan')
+
+
+def summarize(observed, rate, transactions_per_request):
+    latencies, lags = sorted(observed["latencies"]), sorted(observed["lags"])
+    ok = len(latencies)
+    return {
+        "offered_rps": rate,
+        "sent": observed["sent"],
+        "ok": ok,
+        "shed_503": observed["statuses"].get(503, 0),
+        "errors": observed["sent"] - ok - observed["statuses"].get(503, 0),
+        "achieved_rps": ok / observed["elapsed"],
+        "transactions_per_sec": ok * transactions_per_request / observed["elapsed"],
+        "p50_ms": percentile(latencies, 0.50), "p90_ms": percentile(latencies, 0.90),
+        "p99_ms": percentile(latencies, 0.99), "p999_ms": percentile(latencies, 0.999),
+        "max_ms": latencies[-1] if latencies else float('nan'),
+        "driver_lag_p99_ms": percentile(lags, 0.99),
+        "connections": observed["connections"],
+    }
+
+
+def wait_until_ready(host, port, timeout=120.0):
+    import http.client
+    deadline = time.perf_counter() + timeout
+    body = json.dumps(api_transactions(1)[0])
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=5)
+            conn.request("POST", "/predict", body, {"Content-Type": "application/json"})
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("The API did not come up")
+
+
+@contextlib.contextmanager
+def running_api(model_path, port=PORT, project_root=PROJECT_ROOT, env=None):
+    """Starts the API in a scratch directory serving `model_path`; stops it on exit."""
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(model_path, os.path.join(directory, MODEL_FILENAME))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "prediction_service.main:app", "--host", HOST, "--port", str(port),
+             "--log-level", "warning", "--backlog", "4096"],
+            cwd=directory, env=dict(os.environ, PYTHONPATH=os.path.abspath(project_root), **(env or {})),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_until_ready(HOST, port)
+            yield HOST, port
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def run_rates(host, port, rates, seconds, endpoint="predict", batch_size=64, max_connections=MAX_CONNECTIONS):
+    """One open-loop run per offered rate, lowest first. Returns a list of summaries."""
+    path, bodies = make_bodies(endpoint, batch_size)
+    per_request = 1 if endpoint == "predict" else batch_size
+    summaries = []
+    for rate in rates:
+        observed = asyncio.run(drive(host, port, path, bodies, rate, seconds, max_connections))
+        summaries.append(dict(summarize(observed, rate, per_request), endpoint=endpoint))
+    return summaries
+
+
+def print_summaries(summaries):
+    print(f"{'endpoint':<9} {'offered':>8} {'achieved':>9} {'tx/s':>8} {'503':>6} {'errors':>6} "
+          f"{'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'p99.9 ms':>9} {'lag p99':>8} {'conns':>6}")
+    for s in summaries:
+        print(f"{s['endpoint']:<9} {s['offered_rps']:>8,.0f} {s['achieved_rps']:>9,.0f} {s['transactions_per_sec']:>8,.0f} "
+              f"{s['shed_503']:>6} {s['errors']:>6} {s['p50_ms']:>8.1f} {s['p90_ms']:>8.1f} {s['p99_ms']:>8.1f} "
+              f"{s['p999_ms']:>9.1f} {s['driver_lag_p99_ms']:>8.1f} {s['connections']:>6}", flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load driver for the prediction API.")
+    parser.add_argument("--rates", type=float, nargs="+", default=DEFAULT_RATES, help="offered requests/sec, one run each")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS)
+    parser.add_argument("--endpoint", choices=["predict", "batch"], default="predict")
+    parser.add_argument("--batch-size", type=int, default=64, help="transactions per /predict/batch request")
+    parser.add_argument("--max-connections", type=int, default=MAX_CONNECTIONS)
+    parser.add_argument("--model", default=MODEL_FILENAME, help="model to serve from a scratch directory")
+    parser.add_argument("--port", type=int, help="drive an API already listening on this port instead")
+    parser.add_argument("--output", metavar="PATH", help="also write the summaries as JSON")
+    args = parser.parse_args()
+
+    print(f"--- Open-Loop Load ({args.endpoint}, {args.seconds:.0f} s per rate) ---")
+    if args.port:
+        summaries = run_rates(HOST, args.port, args.rates, args.seconds, args.endpoint, args.batch_size, args.max_connections)
+    else:
+        with running_api(args.model) as (host, port):
+            summaries = run_rates(host, port, args.rates, args.seconds, args.endpoint, args.batch_size, args.max_connections)
+    print_summaries(summaries)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(summaries, f, indent=2)
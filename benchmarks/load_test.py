@@ -0,0 +1,131 @@
+# load_test.py
+#
+# Throughput of the multi-process serving mode (prediction_service/serve.py) as the
+# number of API workers grows. For every worker count the server is started in a
+# scratch directory (its queue is thrown away afterwards), warmed up, and then driven
+# with concurrent keep-alive /predict requests from several client processes.
+#
+# How to run (from the project root, next to fraud_detection_model.joblib):
+#     python benchmarks/load_test.py [max_workers]
+
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# --- Configuration ---
+MODEL_FILENAME = "fraud_detection_model.joblib"
+HOST = "127.0.0.1"
+PORT = 8797
+CLIENT_PROCESSES = max((os.cpu_count() or 1) // 2, 2)
+CONNECTIONS_PER_CLIENT = 16
+DURATION_SECONDS = 10.0
+
+SAMPLE_TRANSACTION = {
+    'customer': 'C1093826151', 'step': 20, 'age': '3', 'gender': 'M', 'zipcodeOri': '28007',
+    'merchant': 'M348934600', 'zipMerchant': '28007', 'category': 'es_transportation', 'amount': 2500.0,
+}
+
+
+def connection_loop(deadline, results):
+    conn = http.client.HTTPConnection(HOST, PORT, timeout=30)
+    body = json.dumps(SAMPLE_TRANSACTION)
+    headers = {"Content-Type": "application/json"}
+    ok = failed = 0
+    while time.perf_counter() < deadline:
+        try:
+            conn.request("POST", "/predict", body, headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                ok += 1
+            else:
+                failed += 1
+        except (OSError, http.client.HTTPException):
+            failed += 1
+            conn.close()
+            conn = http.client.HTTPConnection(HOST, PORT, timeout=30)
+    conn.close()
+    results.append((ok, failed))
+
+
+def client_process(duration, output):
+    deadline = time.perf_counter() + duration
+    results = []
+    threads = [threading.Thread(target=connection_loop, args=(deadline, results)) for _ in range(CONNECTIONS_PER_CLIENT)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    output.put((sum(ok for ok, _ in results), sum(failed for _, failed in results)))
+
+
+def wait_until_ready(timeout=120.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            conn = http.client.HTTPConnection(HOST, PORT, timeout=5)
+            conn.request("GET", "/admin/model")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError("The API did not come up")
+
+
+def measure(workers, directory):
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(PROJECT_ROOT, "prediction_service", "serve.py"),
+         "--host", HOST, "--port", str(PORT), "--workers", str(workers)],
+        cwd=directory, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_until_ready()
+        output = multiprocessing.Queue()
+        clients = [multiprocessing.Process(target=client_process, args=(DURATION_SECONDS, output))
+                   for _ in range(CLIENT_PROCESSES)]
+        started = time.perf_counter()
+        for client in clients:
+            client.start()
+        totals = [output.get() for _ in clients]
+        elapsed = time.perf_counter() - started
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.wait()
+    ok = sum(ok for ok, _ in totals)
+    failed = sum(failed for _, failed in totals)
+    return ok / elapsed, failed
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, PROJECT_ROOT)
+    import joblib
+    from prediction_service.flat_forest import export_flat_forest, COMPACT_MODEL_FILENAME
+
+    model = joblib.load(MODEL_FILENAME)
+    cores = os.cpu_count() or 1
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else cores
+    worker_counts = sorted({1, *[n for n in (2, 4, 8, 16, 32) if n < max_workers], max_workers})
+
+    print(f"--- Load Test ({cores} cores, {CLIENT_PROCESSES} client processes x "
+          f"{CONNECTIONS_PER_CLIENT} connections, {DURATION_SECONDS:.0f} s per run) ---")
+    print(f"{'workers':>8}{'req/s':>12}{'speed-up':>10}{'failed':>8}")
+    baseline = None
+    for workers in worker_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            shutil.copy(MODEL_FILENAME, os.path.join(directory, MODEL_FILENAME))
+            export_flat_forest(model, os.path.join(directory, COMPACT_MODEL_FILENAME))
+            throughput, failed = measure(workers, directory)
+        baseline = baseline or throughput
+        print(f"{workers:>8}{throughput:>12,.0f}{throughput / baseline:>9.2f}x{failed:>8}")
+    print("(Client processes share the machine with the server; on small hosts they limit the scaling shown.)")
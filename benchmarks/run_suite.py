@@ -0,0 +1,156 @@
+# run_suite.py
+#
+# Runs the reproducible benchmark suite and stores the results as JSON, so performance can
+# be compared between commits:
+#   - stage benchmarks (bench_stages.py) on a fresh synthetic SQLite stand-in: training
+#     load, balancing and fit, model quality, velocity, encoding, scoring, queue append and
+#     worker flush
+#   - with --load, the open-loop load driver (load_driver.py) against the API serving the
+#     model trained in the same run, on /predict and /predict/batch
+# Everything runs locally in a scratch directory; no SQL Server or real data is needed.
+#
+# Each run is written to benchmark_results/<timestamp>-<commit>.json with the commit, whether
+# the tree had uncommitted changes, the machine and the configuration. --compare prints the
+# change of every metric against an earlier result and exits with status 1 if any of them
+# got worse by more than --threshold, so the suite can gate a change in CI.
+#
+# How to run (from the project root):
+#     python benchmarks/run_suite.py [--load] [--rows 300000] [--compare benchmark_results/<baseline>.json]
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import joblib
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PROJECT_ROOT, "benchmarks"))
+from bench_stages import run_stages, print_results, metric, DEFAULT_ROWS, DEFAULT_SAMPLE_SIZE, DEFAULT_TREES, DEFAULT_STRATEGY
+from load_driver import running_api, run_rates, print_summaries
+
+# --- Configuration ---
+RESULTS_DIR = os.environ.get("FRAUD_BENCHMARK_RESULTS_DIR", os.path.join(PROJECT_ROOT, "benchmark_results"))
+DEFAULT_THRESHOLD = 0.10
+LOAD_RATES = [250, 500, 1000]
+LOAD_SECONDS = 10.0
+LOAD_BATCH_SIZE = 64
+LOAD_BATCH_RATES = [20, 50]
+# Load metrics kept per offered rate (the rest of the summary is informational)
+LOAD_METRICS = {"achieved_rps": ("req/s", "higher"), "p50_ms": ("ms", "lower"),
+                "p99_ms": ("ms", "lower"), "p999_ms": ("ms", "lower")}
+
+
+def git(*args):
+    try:
+        return subprocess.run(["git", *args], cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def load_stages(model, directory, rates, batch_rates, seconds):
+    """Open-loop load on both endpoints of an API serving `model`."""
+    model_path = os.path.join(directory, "suite_model.joblib")
+    joblib.dump(model, model_path)
+    results = {}
+    with running_api(model_path) as (host, port):
+        summaries = (run_rates(host, port, rates, seconds, "predict") +
+                     run_rates(host, port, batch_rates, seconds, "batch", LOAD_BATCH_SIZE))
+    print_summaries(summaries)
+    for summary in summaries:
+        prefix = f"load.{summary['endpoint']}.{summary['offered_rps']:g}rps"
+        for name, (unit, better) in LOAD_METRICS.items():
+            results[f"{prefix}.{name}"] = metric(summary[name], unit, better)
+        results[f"{prefix}.failed_ratio"] = metric(
+            (summary['errors'] + summary['shed_503']) / max(summary['sent'], 1), "ratio")
+    return results, summaries
+
+
+def compare(results, baseline, threshold):
+    """Prints every metric against the baseline. Returns the names of the ones that regressed."""
+    regressions = []
+    print(f"\n--- Comparison with {baseline['environment'].get('commit', '?')[:10]} (threshold {threshold:.0%}) ---")
+    for name, result in results.items():
+        before = baseline["results"].get(name)
+        if before is None:
+            print(f"  {name:<38} {result['value']:>14,.3f} (new)")
+            continue
+        change = (result['value'] - before['value']) / abs(before['value']) if before['value'] else 0.0
+        worse = -change if result['better'] == "higher" else change
+        flag = "❌ REGRESSION" if worse > threshold else ("✅ better" if worse < -threshold else "")
+        if worse > threshold:
+            regressions.append(name)
+        print(f"  {name:<38} {before['value']:>14,.3f} -> {result['value']:>14,.3f} {result['unit']:<7} {change:>+8.1%} {flag}")
+    return regressions
+
+
+def save(report):
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    commit = (report["environment"]["commit"] or "nocommit")[:10]
+    suffix = "-dirty" if report["environment"]["dirty"] else ""
+    path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}{suffix}.json")
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the benchmark suite and stores machine-readable results.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS, help="rows in the synthetic SQLite database")
+    parser.add_argument("--sample-size", type=int, default=DEFAULT_SAMPLE_SIZE)
+    parser.add_argument("--trees", type=int, default=DEFAULT_TREES)
+    parser.add_argument("--strategy", default=DEFAULT_STRATEGY)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--load", action="store_true", help="also run the open-loop load driver against the API")
+    parser.add_argument("--load-seconds", type=float, default=LOAD_SECONDS)
+    parser.add_argument("--rates", type=float, nargs="+", default=LOAD_RATES, help="offered /predict requests/sec")
+    parser.add_argument("--batch-rates", type=float, nargs="+", default=LOAD_BATCH_RATES,
+                        help=f"offered /predict/batch requests/sec ({LOAD_BATCH_SIZE} transactions each)")
+    parser.add_argument("--compare", metavar="BASELINE", help="an earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="relative change counted as a regression (default 0.10)")
+    parser.add_argument("--no-save", action="store_true", help="don't write a result file")
+    args = parser.parse_args()
+
+    config = {name: getattr(args, name) for name in
+              ("rows", "sample_size", "trees", "strategy", "seed", "load", "load_seconds", "rates", "batch_rates")}
+    print(f"--- Benchmark Suite ({args.rows:,} synthetic rows, {args.trees} trees, {args.strategy}"
+          f"{', with load' if args.load else ''}) ---")
+    started = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        results, model = run_stages(directory, args.rows, args.sample_size, args.trees, args.strategy, args.seed)
+        load_summaries = []
+        if args.load:
+            load_results, load_summaries = load_stages(model, directory, args.rates, args.batch_rates, args.load_seconds)
+            results.update(load_results)
+    print_results(results)
+
+    report = {"environment": environment(), "config": config, "duration_seconds": time.perf_counter() - started,
+              "results": results, "load": load_summaries}
+    if not args.no_save:
+        print(f"\n✅ Results written to '{save(report)}'.")
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("⚠️ The baseline was run with a different configuration; the comparison may not be meaningful.")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"❌ {len(regressions)} metric(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("✅ No regressions.")
@@ -0,0 +1,164 @@
+# synthetic_data.py
+#
+# A reproducible generator of fraud_data-like transactions for the benchmark suite, so
+# every benchmark can run locally without the real dataset or SQL Server.
+#
+# The distributions follow the BankSim data fraud_data was loaded from:
+#   - 180 steps, rows in step order
+#   - ~4,100 customers with skewed activity, 50 merchants, each selling one category
+#   - category shares and typical amounts per category (es_transportation is ~85% of
+#     the rows at ~27, es_travel is rare at ~2,250), log-normal amounts
+#   - age and gender shares of the dataset
+#   - ~1.2% fraud, concentrated in the expensive categories, at several times the usual
+#     amount, with compromised customers making a few fraudulent transactions in a row
+# The same seed always produces the same rows.
+#
+# Values are quoted the way the raw dataset quotes them ("'C1093826151'", "'3'"); the
+# API-shaped records from api_transactions() are unquoted, as clients send them.
+#
+# How to run (from the project root):
+#     python benchmarks/synthetic_data.py --rows 1000000 --sqlite local_fraud.db
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.db_connection import connect_sqlite, INSERT_SQL, FRAUD_DATA_COLUMNS
+
+# --- Configuration ---
+DEFAULT_ROWS = 600000
+DEFAULT_SEED = 42
+STEPS = 180
+CUSTOMERS = 4112
+MERCHANTS = 50
+ZIPCODE = '28007'
+INSERT_BATCH_ROWS = 50000
+
+# category: (share of rows, typical amount, fraud rate)
+CATEGORIES = {
+    'es_transportation':     (0.8495, 27.0, 0.000),
+    'es_food':               (0.0440, 37.0, 0.000),
+    'es_health':             (0.0272, 105.0, 0.105),
+    'es_wellnessandbeauty':  (0.0254, 57.0, 0.048),
+    'es_fashion':            (0.0109, 62.0, 0.018),
+    'es_barsandrestaurants': (0.0110, 41.0, 0.019),
+    'es_hyper':              (0.0103, 40.0, 0.046),
+    'es_sportsandtoys':      (0.0068, 88.0, 0.495),
+    'es_tech':               (0.0040, 100.0, 0.067),
+    'es_home':               (0.0033, 113.0, 0.152),
+    'es_hotelservices':      (0.0029, 172.0, 0.314),
+    'es_otherservices':      (0.0015, 76.0, 0.250),
+    'es_contents':           (0.0015, 45.0, 0.000),
+    'es_travel':             (0.0012, 670.0, 0.794),
+    'es_leisure':            (0.0005, 74.0, 0.950),
+}
+AGE_SHARES = {'0': 0.004, '1': 0.098, '2': 0.315, '3': 0.247, '4': 0.183, '5': 0.105, '6': 0.045, 'U': 0.003}
+GENDER_SHARES = {'F': 0.545, 'M': 0.451, 'E': 0.002, 'U': 0.002}
+AMOUNT_SIGMA = 0.8
+FRAUD_AMOUNT_FACTOR = 3.0
+# Every RUN_SEED_STRIDE-th fraudulent transaction is followed by FRAUD_RUN more at the same
+# customer in the next steps; the per-category rates above include those runs.
+RUN_SEED_STRIDE = 4
+FRAUD_RUN = (1, 3)
+
+
+def _normalised(shares):
+    values = np.array(list(shares.values()), dtype=np.float64)
+    return list(shares), values / values.sum()
+
+
+def generate(rows=DEFAULT_ROWS, seed=DEFAULT_SEED):
+    """Returns `rows` synthetic transactions as a DataFrame with the fraud_data columns, in step order."""
+    rng = np.random.default_rng(seed)
+    categories, category_shares = _normalised({name: share for name, (share, _, _) in CATEGORIES.items()})
+    typical = np.array([CATEGORIES[name][1] for name in categories])
+    fraud_rate = np.array([CATEGORIES[name][2] for name in categories])
+
+    # Every merchant sells one category; the big categories get more merchants
+    merchant_category = np.sort(np.concatenate([np.arange(len(categories)),
+                                                rng.choice(len(categories), MERCHANTS - len(categories), p=category_shares)]))
+    ages, age_p = _normalised(AGE_SHARES)
+    genders, gender_p = _normalised(GENDER_SHARES)
+    customer_age = rng.choice(len(ages), CUSTOMERS, p=age_p)
+    customer_gender = rng.choice(len(genders), CUSTOMERS, p=gender_p)
+    activity = rng.pareto(2.0, CUSTOMERS) + 1.0
+
+    customer = rng.choice(CUSTOMERS, rows, p=activity / activity.sum())
+    category = rng.choice(len(categories), rows, p=category_shares)
+    merchant = np.empty(rows, dtype=np.int64)
+    for index in range(len(categories)):
+        selected = np.flatnonzero(category == index)
+        merchant[selected] = rng.choice(np.flatnonzero(merchant_category == index), len(selected))
+    step = rng.integers(0, STEPS, rows)
+    fraud = rng.random(rows) < fraud_rate[category] / (1 + np.mean(FRAUD_RUN) / RUN_SEED_STRIDE)
+
+    # Compromised customers: some fraud rows are followed by a short run of fraud at the same customer
+    seeds = np.flatnonzero(fraud)[::RUN_SEED_STRIDE]
+    run_lengths = rng.integers(FRAUD_RUN[0], FRAUD_RUN[1] + 1, len(seeds))
+    targets = rng.choice(np.flatnonzero(~fraud), min(int(run_lengths.sum()), int((~fraud).sum())), replace=False)
+    owners = np.repeat(seeds, run_lengths)[:len(targets)]
+    customer[targets] = customer[owners]
+    step[targets] = np.minimum(step[owners] + rng.integers(0, 3, len(targets)), STEPS - 1)
+    category[targets] = rng.choice(np.flatnonzero(fraud_rate > 0.1), len(targets))
+    for index in np.unique(category[targets]):
+        selected = targets[category[targets] == index]
+        merchant[selected] = rng.choice(np.flatnonzero(merchant_category == index), len(selected))
+    fraud[targets] = True
+
+    amount = typical[category] * rng.lognormal(0.0, AMOUNT_SIGMA, rows)
+    amount[fraud] *= FRAUD_AMOUNT_FACTOR * rng.lognormal(0.0, 0.3, int(fraud.sum()))
+
+    order = np.argsort(step, kind='stable')
+    quote = np.vectorize(lambda value: f"'{value}'", otypes=[object])
+    return pd.DataFrame({
+        'customer': quote(np.char.add('C', customer[order].astype(str))),
+        'step': step[order],
+        'age': quote(np.array(ages)[customer_age[customer[order]]]),
+        'gender': quote(np.array(genders)[customer_gender[customer[order]]]),
+        'zipcodeOri': f"'{ZIPCODE}'",
+        'merchant': quote(np.char.add('M', merchant[order].astype(str))),
+        'zipMerchant': f"'{ZIPCODE}'",
+        'category': quote(np.array(categories)[category[order]]),
+        'amount': np.round(amount[order], 2),
+        'fraud': fraud[order].astype(np.int64),
+    })
+
+
+def api_transactions(rows, seed=DEFAULT_SEED):
+    """The same kind of transactions as /predict request bodies (no fraud label, no quotes)."""
+    df = generate(rows, seed).drop(columns=['fraud'])
+    for column in ('customer', 'age', 'gender', 'zipcodeOri', 'merchant', 'zipMerchant', 'category'):
+        df[column] = df[column].str.strip("'")
+    return [{**record, 'step': int(record['step']), 'amount': float(record['amount'])}
+            for record in df.to_dict('records')]
+
+
+def write_sqlite(path, rows=DEFAULT_ROWS, seed=DEFAULT_SEED):
+    """Creates (or appends to) a SQLite stand-in with `rows` synthetic transactions."""
+    df = generate(rows, seed)
+    conn = connect_sqlite(path)
+    try:
+        records = list(df[list(FRAUD_DATA_COLUMNS)].itertuples(index=False, name=None))
+        for start in range(0, len(records), INSERT_BATCH_ROWS):
+            conn.executemany(INSERT_SQL, records[start:start + INSERT_BATCH_ROWS])
+        conn.commit()
+    finally:
+        conn.close()
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates synthetic fraud_data transactions.")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--sqlite", metavar="PATH", required=True, help="SQLite stand-in to create or append to")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    df = write_sqlite(args.sqlite, args.rows, args.seed)
+    print(f"✅ Wrote {len(df):,} transactions ({df['fraud'].mean():.2%} fraud, {df['customer'].nunique():,} customers, "
+          f"steps {df['step'].min()}-{df['step'].max()}) to '{args.sqlite}' in {time.perf_counter() - started:.1f}s.")
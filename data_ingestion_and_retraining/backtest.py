@@ -0,0 +1,277 @@
+# backtest.py
+#
+# Replays historical fraud_data in `step` order and scores it with one or more model
+# artifacts, to compare model versions on real traffic (no synthetic rows, real fraud
+# rate) at any scale.
+#
+# Rows come either from the local feature store (the default: workers memory-map the
+# partitions themselves, so only row ranges cross the process boundary) or straight from
+# the database, streamed in chunks with ORDER BY step. Chunks are scored on a process
+# pool; at most MAX_PENDING_PER_WORKER chunks per worker are in flight, so memory stays
+# bounded by the chunk size, not the table size.
+#
+# Each worker returns only aggregates per step window and model: the confusion counts at
+# the model's own decision, and a histogram of fraud probabilities per class. AUC and
+# average precision come from those histograms; forest probabilities are multiples of
+# 1/n_trees, so with SCORE_BINS bins they are exact for forests of up to SCORE_BINS trees.
+# Every step window is printed (and optionally written as a JSON line) as soon as it is
+# complete, followed by totals and scoring throughput.
+#
+# How to run (from the project root):
+#     python data_ingestion_and_retraining/backtest.py v000003 v000004 [--window-steps 10] [--workers 4]
+#     python data_ingestion_and_retraining/backtest.py fraud_detection_model.joblib --sqlite local_fraud.db
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.db_connection import connect_sql_server
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.flat_forest import FlatForest, COMPACT_MODEL_FILENAME
+from prediction_service.model_registry import current_version, version_path, MODEL_REGISTRY_DIR, MODEL_FILENAME
+from prediction_service.velocity import VelocityFeatures
+from data_ingestion_and_retraining.feature_store import FeatureStore, FEATURE_STORE_DIR, LABEL_COLUMN
+from data_ingestion_and_retraining.streaming_loader import QUERY_COLUMNS, peak_rss_mb
+
+# --- Configuration ---
+BACKTEST_WORKERS = int(os.environ.get("FRAUD_BACKTEST_WORKERS", os.cpu_count() or 1))
+WINDOW_STEPS = 10
+CHUNK_ROWS = 50000
+MAX_PENDING_PER_WORKER = 2
+SCORE_BINS = 10000
+REPLAY_QUERY = f"SELECT {QUERY_COLUMNS} FROM fraud_data ORDER BY step, TransactionID;"
+
+
+def resolve_artifact(spec):
+    """A model file or directory, a registry version ('v000004'), or 'current'."""
+    if spec == 'current':
+        record = current_version(MODEL_REGISTRY_DIR)
+        if record is None:
+            raise ValueError(f"Nothing has been published to '{MODEL_REGISTRY_DIR}' yet.")
+        spec = record['version']
+    if not os.path.exists(spec) and os.path.isdir(os.path.join(MODEL_REGISTRY_DIR, spec)):
+        compact = version_path(MODEL_REGISTRY_DIR, spec, COMPACT_MODEL_FILENAME)
+        return compact if os.path.exists(compact) else version_path(MODEL_REGISTRY_DIR, spec, MODEL_FILENAME)
+    if not os.path.exists(spec):
+        raise ValueError(f"No model artifact or registry version called '{spec}'.")
+    return spec
+
+
+def load_artifact(path):
+    return FlatForest.load(path) if os.path.isdir(path) or path.endswith('.npz') else joblib.load(path)
+
+
+# --- Worker process ---
+_worker = {}
+
+
+def _init_worker(artifacts, store_dir, feature_names):
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+    _worker['models'] = {}
+    for name, path in artifacts.items():
+        model = load_artifact(path)
+        if hasattr(model, 'n_jobs'):
+            model.n_jobs = 1  # the pool provides the parallelism
+        # Column order of the model, taken from the replayed layout
+        columns = [feature_names.index(str(feature)) for feature in model.feature_names_in_]
+        _worker['models'][name] = (model, columns, list(model.classes_).index(1))
+    _worker['store'] = FeatureStore(store_dir) if store_dir else None
+    _worker['feature_names'] = feature_names
+
+
+def _read_store_chunk(partition_name, lo, hi):
+    store = _worker['store']
+    partition = {"name": partition_name}
+    X = np.empty((hi - lo, len(_worker['feature_names'])), dtype=np.float32)
+    for offset, name in enumerate(_worker['feature_names']):
+        X[:, offset] = store.column(partition, name)[lo:hi]
+    return store.column(partition, 'step')[lo:hi], X, store.column(partition, LABEL_COLUMN)[lo:hi]
+
+
+def _score_chunk(task):
+    """Scores one chunk with every model; returns aggregates per (window, model)."""
+    steps, X, y = _read_store_chunk(*task['range']) if 'range' in task else (task['steps'], task['X'], task['y'])
+    if task.get('step_range'):
+        first, last = task['step_range']
+        keep = (steps >= first) & (steps <= last)
+        steps, X, y = steps[keep], X[keep], y[keep]
+    windows = np.asarray(steps, dtype=np.int64) // task['window_steps']
+    actual = np.asarray(y) == 1
+    result = {"rows": len(y), "windows": {}, "score_seconds": {}}
+    for name, (model, columns, fraud_column) in _worker['models'].items():
+        started = time.perf_counter()
+        probabilities = model.predict_proba(X[:, columns])
+        result["score_seconds"][name] = time.perf_counter() - started
+        flagged = model.classes_.take(np.argmax(probabilities, axis=1)) == 1
+        bins = np.minimum((probabilities[:, fraud_column] * SCORE_BINS).astype(np.int64), SCORE_BINS)
+        for window in np.unique(windows):
+            rows = windows == window
+            hit, flag, window_bins = actual[rows], flagged[rows], bins[rows]
+            result["windows"].setdefault(int(window), {})[name] = {
+                "tp": int((hit & flag).sum()), "fp": int((~hit & flag).sum()),
+                "fn": int((hit & ~flag).sum()), "tn": int((~hit & ~flag).sum()),
+                "positive": np.bincount(window_bins[hit], minlength=SCORE_BINS + 1),
+                "negative": np.bincount(window_bins[~hit], minlength=SCORE_BINS + 1),
+            }
+    return result
+
+
+# --- Aggregation ---
+class Tally:
+    """Confusion counts and per-class probability histograms, merged across chunks."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.positive = np.zeros(SCORE_BINS + 1, dtype=np.int64)
+        self.negative = np.zeros(SCORE_BINS + 1, dtype=np.int64)
+
+    def add(self, part):
+        self.counts.update({key: part[key] for key in ('tp', 'fp', 'fn', 'tn')})
+        self.positive += part['positive']
+        self.negative += part['negative']
+
+    def metrics(self):
+        tp, fp, fn, tn = (self.counts[key] for key in ('tp', 'fp', 'fn', 'tn'))
+        positives, negatives = int(self.positive.sum()), int(self.negative.sum())
+        # ROC AUC: P(score of a fraud row > score of a benign row), ties counting half
+        benign_below = np.cumsum(self.negative) - self.negative
+        auc = ((self.positive * (benign_below + self.negative / 2)).sum() / (positives * negatives)
+               if positives and negatives else float('nan'))
+        # Average precision over the thresholds at every histogram bin, highest first
+        true_positives, false_positives = np.cumsum(self.positive[::-1]), np.cumsum(self.negative[::-1])
+        flagged = true_positives + false_positives
+        precision_at = np.divide(true_positives, flagged, out=np.zeros(len(flagged)), where=flagged > 0)
+        average_precision = (precision_at * self.positive[::-1]).sum() / positives if positives else float('nan')
+        return {"rows": tp + fp + fn + tn, "fraud_rows": tp + fn,
+                "precision": tp / (tp + fp) if tp + fp else 0.0, "recall": tp / (tp + fn) if tp + fn else 0.0,
+                "roc_auc": float(auc), "average_precision": float(average_precision)}
+
+
+def store_tasks(store, window_steps, chunk_rows, steps=None):
+    """(first step, task) per chunk of every selected partition, in step order."""
+    for partition in sorted(store.partitions(steps), key=lambda p: p["first_step"]):
+        for lo in range(0, partition["rows"], chunk_rows):
+            hi = min(lo + chunk_rows, partition["rows"])
+            yield partition["first_step"], {"range": (partition["name"], lo, hi), "window_steps": window_steps,
+                                            "step_range": steps}
+
+
+def database_tasks(conn, encoder, window_steps, chunk_rows):
+    """(first step, task) per chunk of the ORDER BY step replay."""
+    velocity = VelocityFeatures() if encoder.extra else None
+    for chunk in pd.read_sql(REPLAY_QUERY, conn, chunksize=chunk_rows):
+        if velocity is not None:
+            velocity.add_to_frame(chunk)
+        steps = chunk['step'].to_numpy(dtype=np.int32)
+        yield int(steps.min()), {"steps": steps, "X": encoder.encode_frame(chunk).astype(np.float32),
+                                 "y": chunk[LABEL_COLUMN].to_numpy(dtype=np.int8), "window_steps": window_steps}
+
+
+def print_window(window, window_steps, name, metrics, width):
+    first = window * window_steps
+    print(f"steps {first:>4}-{first + window_steps - 1:<4} {name:<{width}} {metrics['rows']:>9,} {metrics['fraud_rows']:>7,} "
+          f"{metrics['precision']:>9.4f} {metrics['recall']:>7.4f} {metrics['roc_auc']:>8.4f} "
+          f"{metrics['average_precision']:>7.4f}", flush=True)
+
+
+def run_backtest(artifacts, tasks, feature_names, store_dir=None, window_steps=WINDOW_STEPS,
+                 workers=BACKTEST_WORKERS, output=None):
+    """Scores the tasks on a process pool and streams metrics per step window.
+
+    `artifacts` maps a display name to a model path. Returns {name: overall metrics}.
+    """
+    width = max(len(name) for name in artifacts)
+    print(f"{'window':<15} {'model':<{width}} {'rows':>9} {'fraud':>7} {'precision':>9} {'recall':>7} {'ROC AUC':>8} {'AP':>7}")
+    open_windows = collections.defaultdict(lambda: {name: Tally() for name in artifacts})
+    totals = {name: Tally() for name in artifacts}
+    score_seconds = collections.Counter()
+    rows = 0
+    sink = open(output, 'w') if output else None
+
+    def close_windows_before(step):
+        for window in sorted(w for w in open_windows if (w + 1) * window_steps <= step):
+            for name, tally in open_windows.pop(window).items():
+                metrics = tally.metrics()
+                print_window(window, window_steps, name, metrics, width)
+                if sink:
+                    sink.write(json.dumps(dict(metrics, model=name, first_step=window * window_steps,
+                                               last_step=(window + 1) * window_steps - 1)) + "\n")
+
+    started = time.perf_counter()
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(artifacts, store_dir, feature_names))
+    try:
+        pending = collections.deque()
+        tasks = iter(tasks)
+        while True:
+            # Keep the pool busy, but never read more than a few chunks ahead
+            for first_step, task in tasks:
+                pending.append((first_step, pool.apply_async(_score_chunk, (task,))))
+                if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+                    break
+            if not pending:
+                break
+            result = pending.popleft()[1].get()
+            rows += result["rows"]
+            score_seconds.update(result["score_seconds"])
+            for window, parts in result["windows"].items():
+                for name, part in parts.items():
+                    open_windows[window][name].add(part)
+                    totals[name].add(part)
+            # Chunks arrive in step order, so every window ending before the next chunk is complete
+            close_windows_before(pending[0][0] if pending else float('inf'))
+    finally:
+        pool.terminate()
+        pool.join()
+        if sink:
+            sink.close()
+    elapsed = time.perf_counter() - started
+
+    print(f"\n--- Backtest totals ({rows:,} rows in {elapsed:.1f}s, {rows / elapsed:,.0f} rows/sec end to end, "
+          f"{workers} worker(s), peak RSS of this process {peak_rss_mb() or 0:.0f} MB) ---")
+    overall = {}
+    for name, tally in totals.items():
+        overall[name] = dict(tally.metrics(), rows_per_sec_per_worker=rows / score_seconds[name] if score_seconds[name] else 0.0)
+        m = overall[name]
+        print(f"{name:<{width}}  precision {m['precision']:.4f}  recall {m['recall']:.4f}  ROC AUC {m['roc_auc']:.4f}  "
+              f"AP {m['average_precision']:.4f}  scoring {m['rows_per_sec_per_worker']:,.0f} rows/sec per worker")
+    return overall
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtests model artifacts on historical fraud_data in step order.")
+    parser.add_argument("models", nargs="+", help="model files/directories, registry versions (v000004) or 'current'")
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--store", default=FEATURE_STORE_DIR, help="feature store to replay (the default source)")
+    source.add_argument("--database", action="store_true", help="replay fraud_data from SQL Server instead")
+    source.add_argument("--sqlite", metavar="PATH", help="replay fraud_data from a local SQLite stand-in instead")
+    parser.add_argument("--steps", type=int, nargs=2, metavar=("FIRST", "LAST"), help="only this step range (feature store)")
+    parser.add_argument("--window-steps", type=int, default=WINDOW_STEPS)
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("--output", metavar="PATH", help="also write one JSON line per window and model")
+    args = parser.parse_args()
+
+    artifacts = {spec: resolve_artifact(spec) for spec in args.models}
+    print(f"🔄 Backtesting {', '.join(f'{name} ({path})' for name, path in artifacts.items())}...")
+    if args.database or args.sqlite:
+        conn = sqlite3.connect(args.sqlite) if args.sqlite else connect_sql_server()
+        encoder = FeatureEncoder.for_training()
+        try:
+            run_backtest(artifacts, database_tasks(conn, encoder, args.window_steps, args.chunk_rows),
+                         encoder.feature_names, None, args.window_steps, args.workers, args.output)
+        finally:
+            conn.close()
+    else:
+        store = FeatureStore(args.store)
+        run_backtest(artifacts, store_tasks(store, args.window_steps, args.chunk_rows, args.steps),
+                     store.feature_names, args.store, args.window_steps, args.workers, args.output)
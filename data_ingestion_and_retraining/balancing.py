@@ -0,0 +1,145 @@
+# balancing.py
+#
+# Class-balancing strategies for the training set, selectable by their cost/quality
+# trade-off (see benchmarks/bench_balancing.py for timing, memory and quality numbers):
+#
+#   smote          imblearn SMOTE over the whole training set (the original behaviour).
+#                  Its neighbour search over every fraud row and the float64 copies it
+#                  builds make it the most expensive step as the sample grows.
+#   chunked_smote  SMOTE-style interpolation with an approximate neighbour search. Fraud
+#                  rows are grouped by their one-hot (age, gender) pattern (the one-hot
+#                  columns come from the FeatureEncoder layout) and neighbours
+#                  are only searched on the numeric columns within a group, in chunks of
+#                  at most SMOTE_CHUNK_SIZE rows. Synthetic rows never mix categories (plain
+#                  SMOTE produces fractional one-hot values) and are written block by block
+#                  into one float32 matrix.
+#   undersample    every fraud row plus a random subset of benign rows (UNDERSAMPLE_RATIO
+#                  benign rows per fraud row). The smallest training set and the fastest fit.
+#   class_weight   no resampling; the forest weights the classes inversely to their
+#                  frequency in each bootstrap sample (class_weight='balanced_subsample').
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import NearestNeighbors
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.feature_encoder import FeatureEncoder
+
+# --- Configuration ---
+STRATEGIES = ['smote', 'chunked_smote', 'undersample', 'class_weight']
+SMOTE_K_NEIGHBORS = 5
+SMOTE_CHUNK_SIZE = 20000
+SYNTHETIC_BLOCK_ROWS = 100000
+UNDERSAMPLE_RATIO = 1.0
+
+
+def forest_params(strategy):
+    """RandomForestClassifier parameters that belong to a strategy (set on every fit,
+    so switching strategies also resets them on a warm-started forest)."""
+    return {'class_weight': 'balanced_subsample' if strategy == 'class_weight' else None}
+
+
+def one_hot_columns(feature_names):
+    """Offsets of the one-hot (categorical) columns in a feature layout.
+
+    Taken from the encoder rather than guessed from the values, so a numeric column that
+    happens to hold only 0/1 (e.g. a velocity count) is not mistaken for a category.
+    """
+    return sorted(offset for lookup in FeatureEncoder(feature_names).one_hot.values() for offset in lookup.values())
+
+
+def _neighbour_table(minority, categorical, k_neighbors, chunk_size, rng):
+    """For every fraud row, the indices of up to k approximate nearest fraud neighbours.
+
+    Rows with fewer than k candidates in their chunk repeat neighbours; a row alone in its
+    chunk is its own neighbour (its synthetic rows are copies of it).
+    """
+    numeric = np.setdiff1d(np.arange(minority.shape[1]), categorical)
+    _, group = np.unique(minority[:, categorical], axis=0, return_inverse=True)
+    group = group.ravel()
+
+    table = np.empty((len(minority), k_neighbors), dtype=np.int64)
+    for members in np.split(*_grouped(group, rng)):
+        for chunk in np.array_split(members, -(-len(members) // chunk_size)):
+            if len(chunk) == 1:
+                table[chunk] = chunk[0]
+                continue
+            k = min(k_neighbors, len(chunk) - 1)
+            search = NearestNeighbors(n_neighbors=k).fit(minority[chunk][:, numeric])
+            found = search.kneighbors(return_distance=False)  # without a query, excludes the row itself
+            table[chunk] = chunk[found[:, np.arange(k_neighbors) % k]]
+    return table
+
+
+def _grouped(group, rng):
+    """(row indices sorted by group and shuffled within it, group boundaries)."""
+    order = rng.permutation(len(group))
+    order = order[np.argsort(group[order], kind='stable')]
+    return order, np.flatnonzero(np.diff(group[order])) + 1
+
+
+def chunked_smote(X, y, categorical, k_neighbors=SMOTE_K_NEIGHBORS, chunk_size=SMOTE_CHUNK_SIZE, random_state=42):
+    """Oversamples the fraud class up to the benign count. X is a float matrix, y 0/1 labels,
+    `categorical` the offsets of X's one-hot columns (see one_hot_columns)."""
+    rng = np.random.default_rng(random_state)
+    is_fraud = y == 1
+    minority = np.asarray(X[is_fraud], dtype=np.float32)
+    n_synthetic = int((~is_fraud).sum()) - len(minority)
+    if n_synthetic <= 0 or len(minority) == 0:
+        return X, y
+
+    table = _neighbour_table(minority, categorical, k_neighbors, chunk_size, rng)
+
+    X_out = np.empty((len(X) + n_synthetic, X.shape[1]), dtype=np.float32)
+    X_out[:len(X)] = X
+    for start in range(0, n_synthetic, SYNTHETIC_BLOCK_ROWS):
+        count = min(SYNTHETIC_BLOCK_ROWS, n_synthetic - start)
+        seeds = rng.integers(0, len(minority), count)
+        neighbours = table[seeds, rng.integers(0, k_neighbors, count)]
+        gap = rng.random((count, 1), dtype=np.float32)
+        block = X_out[len(X) + start:len(X) + start + count]
+        np.subtract(minority[neighbours], minority[seeds], out=block)
+        block *= gap
+        block += minority[seeds]
+    y_out = np.concatenate([np.asarray(y), np.ones(n_synthetic, dtype=np.asarray(y).dtype)])
+    return X_out, y_out
+
+
+def undersample(X, y, ratio=UNDERSAMPLE_RATIO, random_state=42):
+    """Keeps every fraud row and `ratio` randomly chosen benign rows per fraud row."""
+    rng = np.random.default_rng(random_state)
+    fraud = np.flatnonzero(y == 1)
+    benign = np.flatnonzero(y != 1)
+    keep = min(len(benign), int(len(fraud) * ratio))
+    rows = np.sort(np.concatenate([fraud, rng.choice(benign, keep, replace=False)]))
+    return X[rows], y[rows]
+
+
+def balance(X, y, strategy, random_state=42):
+    """Applies a balancing strategy to a training set. Returns (X, y).
+
+    A DataFrame X comes back as a DataFrame with the same columns (so the model keeps
+    its feature_names_in_); y comes back as an array. A plain matrix is taken to be in the
+    FeatureEncoder.for_training() layout.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown balancing strategy '{strategy}'; choose one of {', '.join(STRATEGIES)}.")
+    columns = X.columns if isinstance(X, pd.DataFrame) else None
+    X_values, y_values = np.asarray(X), np.asarray(y)
+
+    if strategy == 'smote':
+        from imblearn.over_sampling import SMOTE
+        X_values, y_values = SMOTE(k_neighbors=SMOTE_K_NEIGHBORS, random_state=random_state).fit_resample(X_values, y_values)
+    elif strategy == 'chunked_smote':
+        feature_names = list(columns) if columns is not None else FeatureEncoder.for_training().feature_names
+        if len(feature_names) != X_values.shape[1]:
+            raise ValueError(f"chunked_smote needs the feature names of the {X_values.shape[1]} columns; pass X as a DataFrame.")
+        X_values, y_values = chunked_smote(X_values, y_values, one_hot_columns(feature_names), random_state=random_state)
+    elif strategy == 'undersample':
+        X_values, y_values = undersample(X_values, y_values, random_state=random_state)
+
+    if columns is not None:
+        return pd.DataFrame(X_values, columns=columns), y_values
+    return X_values, y_values
@@ -0,0 +1,246 @@
+# compaction.py
+#
+# Post-training compaction of the served forest: fewer trees, capped depth, and smaller
+# numeric types, within a quality tolerance.
+#
+# The trained forest is walked down once on a held-out set, and every depth cap is read
+# off on the way; the running mean over trees then gives the forest's probabilities for
+# every tree count at once, so the whole (depth cap x tree count) grid costs one traversal. The
+# smallest configuration (fewest nodes) whose fraud precision and recall are both within
+# COMPACTION_TOLERANCE of the full forest's wins. A depth-capped tree turns its nodes at
+# the cap into leaves holding the class distribution sklearn already stores for them.
+#
+# The result is a regular (smaller) RandomForestClassifier plus its FlatForest compiled
+# with float32 thresholds (rounded down, so float32 inputs take exactly the same
+# branches) and float32 - or, with FRAUD_COMPACTION_VALUE_DTYPE=float16, half-precision -
+# leaf probabilities. Both are published as usual, so the API serves them unchanged.
+#
+# How to compact an existing model (from the project root):
+#     python data_ingestion_and_retraining/compaction.py fraud_detection_model.joblib --store feature_store [--publish]
+
+import argparse
+import copy
+import os
+import sys
+import tempfile
+import time
+import joblib
+import numpy as np
+from sklearn.metrics import average_precision_score
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.flat_forest import FlatForest, artifact_bytes
+
+# --- Configuration ---
+COMPACTION_ENABLED = os.environ.get("FRAUD_COMPACTION_ENABLED", "1") == "1"
+COMPACTION_TOLERANCE = float(os.environ.get("FRAUD_COMPACTION_TOLERANCE", 0.005))  # max drop in precision and in recall
+VALUE_DTYPE = os.environ.get("FRAUD_COMPACTION_VALUE_DTYPE", "float32")
+DEPTH_CAPS = [4, 6, 8, 10, 12, 14, 16, 20, 24, 32]
+SCORING_CHUNK_ROWS = 4096
+LATENCY_ROWS = 200
+LATENCY_BATCH_SIZE = 64
+
+
+def node_depths(forest):
+    """Depth of every node of a FlatForest (roots are at depth 0)."""
+    depth = np.zeros(len(forest.left), dtype=np.int32)
+    frontier, level = forest.roots, 0
+    while len(frontier):
+        depth[frontier] = level
+        frontier = frontier[~forest.is_leaf[frontier]]
+        frontier = np.concatenate([forest.left[frontier], forest.right[frontier]])
+        level += 1
+    return depth
+
+
+def _levels(forest, X):
+    """Walks every (tree, row) pair of X down the forest one level at a time.
+
+    Yields (depth, nodes) after each level, nodes being the (trees, rows) node reached so
+    far; a tree cut at that depth would end there. Leaves point to themselves, so pairs
+    that already reached a leaf stay put.
+    """
+    nodes = np.repeat(forest.roots[:, np.newaxis], len(X), axis=1)
+    rows = np.arange(len(X))
+    for depth in range(1, forest.max_depth + 1):
+        go_left = X[rows, forest.feature[nodes]] <= forest.threshold[nodes]
+        nodes = np.where(go_left, forest.left[nodes], forest.right[nodes])
+        yield depth, nodes
+
+
+def precision_recall(true_positives, flagged, positives):
+    precision = np.divide(true_positives, flagged, out=np.zeros(np.shape(flagged)), where=flagged > 0)
+    return precision, true_positives / max(positives, 1)
+
+
+def evaluate_grid(forest, X, y):
+    """Precision, recall and node count for every (depth cap, tree count) pair.
+
+    One traversal per chunk of rows serves every depth cap; the running mean over trees
+    gives the forest's probabilities for every tree count at once.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    actual = np.asarray(y) == 1
+    fraud_column = list(forest.classes_).index(1)
+    caps = [c for c in DEPTH_CAPS if c < forest.max_depth] + [forest.max_depth]  # the last one is "no cap"
+    counts = np.arange(1, forest.n_estimators + 1)[:, np.newaxis]
+    true_positives = np.zeros((len(caps), forest.n_estimators))
+    flagged = np.zeros((len(caps), forest.n_estimators))
+
+    for start in range(0, len(X), SCORING_CHUNK_ROWS):
+        chunk, chunk_actual = X[start:start + SCORING_CHUNK_ROWS], actual[start:start + SCORING_CHUNK_ROWS]
+        for depth, nodes in _levels(forest, chunk):
+            if depth in caps:
+                probabilities = np.cumsum(forest.value[nodes, fraud_column], axis=0) / counts
+                predicted = probabilities > 0.5  # predict() picks class 1 only above 0.5
+                true_positives[caps.index(depth)] += (predicted & chunk_actual).sum(axis=1)
+                flagged[caps.index(depth)] += predicted.sum(axis=1)
+
+    depth_of_node = node_depths(forest)
+    tree_of_node = np.repeat(np.arange(forest.n_estimators), np.diff(np.append(forest.roots, len(depth_of_node))))
+    grid = []
+    for i, cap in enumerate(caps):
+        precision, recall = precision_recall(true_positives[i], flagged[i], int(actual.sum()))
+        nodes = np.cumsum(np.bincount(tree_of_node[depth_of_node <= cap], minlength=forest.n_estimators))
+        grid += [{"max_depth": cap if cap < forest.max_depth else None, "n_trees": k + 1, "nodes": int(nodes[k]),
+                  "precision": float(precision[k]), "recall": float(recall[k])} for k in range(forest.n_estimators)]
+    return grid
+
+
+def choose(grid, tolerance=COMPACTION_TOLERANCE):
+    """The configuration with the fewest nodes that stays within `tolerance` of the full forest."""
+    full = grid[-1]  # every tree, no depth cap
+    eligible = [g for g in grid if g['precision'] >= full['precision'] - tolerance and g['recall'] >= full['recall'] - tolerance]
+    return full, min(eligible, key=lambda g: (g['nodes'], g['n_trees']))
+
+
+def cap_tree_depth(estimator, max_depth):
+    """A copy of a fitted decision tree whose nodes at `max_depth` become leaves."""
+    tree = estimator.tree_
+    state = tree.__getstate__()
+    nodes, values = state['nodes'], state['values']
+    depth = np.zeros(len(nodes), dtype=np.int64)
+    frontier, level = np.array([0]), 0
+    while len(frontier):
+        depth[frontier] = level
+        frontier = frontier[nodes['left_child'][frontier] != -1]
+        frontier = np.concatenate([nodes['left_child'][frontier], nodes['right_child'][frontier]])
+        level += 1
+
+    keep = depth <= max_depth
+    new_index = np.cumsum(keep) - 1
+    nodes = nodes[keep].copy()
+    internal = nodes['left_child'] != -1
+    cut = internal & (depth[keep] == max_depth)
+    nodes['left_child'][cut] = nodes['right_child'][cut] = -1
+    nodes['feature'][cut], nodes['threshold'][cut] = -2, -2.0
+    still_internal = internal & ~cut
+    nodes['left_child'][still_internal] = new_index[nodes['left_child'][still_internal]]
+    nodes['right_child'][still_internal] = new_index[nodes['right_child'][still_internal]]
+
+    cls, args = tree.__reduce__()[:2]
+    capped = cls(*args)
+    capped.__setstate__({'max_depth': int(min(state['max_depth'], max_depth)), 'node_count': len(nodes),
+                         'nodes': nodes, 'values': values[keep]})
+    estimator = copy.copy(estimator)
+    estimator.tree_ = capped
+    return estimator
+
+
+def prune_model(model, n_trees, max_depth=None):
+    """A copy of a fitted forest with only its first `n_trees` trees, each cut at `max_depth`."""
+    pruned = copy.copy(model)
+    trees = model.estimators_[:n_trees]
+    pruned.estimators_ = [cap_tree_depth(tree, max_depth) for tree in trees] if max_depth is not None else list(trees)
+    pruned.n_estimators = n_trees
+    return pruned
+
+
+def serving_latency(predictor, rows):
+    """Single-row p50 (ms) and per-row cost in a batch of LATENCY_BATCH_SIZE (µs)."""
+    timings = []
+    for row in rows[:LATENCY_ROWS]:
+        started = time.perf_counter()
+        predictor.predict_proba(row[np.newaxis, :])
+        timings.append((time.perf_counter() - started) * 1000)
+    batch = rows[:LATENCY_BATCH_SIZE]
+    started = time.perf_counter()
+    for _ in range(10):
+        predictor.predict_proba(batch)
+    timings.sort()
+    return timings[len(timings) // 2], (time.perf_counter() - started) / (10 * len(batch)) * 1e6
+
+
+def describe_artifacts(model, forest, X, y):
+    """Size, load time, latency and quality of a pickled model and its compiled forest."""
+    fraud_column = list(forest.classes_).index(1)
+    with tempfile.TemporaryDirectory(prefix="compaction_") as directory:
+        pickled, compiled = os.path.join(directory, "model.joblib"), os.path.join(directory, "model.forest")
+        joblib.dump(model, pickled)
+        forest.save(compiled)
+        started = time.perf_counter()
+        loaded = FlatForest.load(compiled)
+        load_ms = (time.perf_counter() - started) * 1000
+        p50_ms, batch_us = serving_latency(loaded, X)
+        probabilities = loaded.predict_proba(X)[:, fraud_column]
+        sizes = os.path.getsize(pickled), artifact_bytes(compiled)
+    actual, predicted = np.asarray(y) == 1, probabilities > 0.5
+    precision, recall = precision_recall((actual & predicted).sum(), predicted.sum(), int(actual.sum()))
+    return {"trees": forest.n_estimators, "max_depth": forest.max_depth, "nodes": len(forest.left),
+            "pickled_mb": sizes[0] / 1e6, "compact_mb": sizes[1] / 1e6, "load_ms": load_ms,
+            "latency_p50_ms": p50_ms, "batch_us_per_row": batch_us, "precision": float(precision),
+            "recall": float(recall), "average_precision": average_precision_score(y, probabilities)}
+
+
+def compact_model(model, X_eval, y_eval, tolerance=COMPACTION_TOLERANCE, value_dtype=VALUE_DTYPE):
+    """Finds the smallest forest within `tolerance` on (X_eval, y_eval).
+
+    Returns (pruned sklearn model, its quantized FlatForest, report).
+    """
+    X_eval = np.ascontiguousarray(X_eval, dtype=np.float32)
+    forest = FlatForest.from_sklearn(model)
+    full, chosen = choose(evaluate_grid(forest, X_eval, y_eval), tolerance)
+    pruned = prune_model(model, chosen['n_trees'], chosen['max_depth'])
+    compacted = FlatForest.from_sklearn(pruned).quantized(np.dtype(value_dtype))
+    return pruned, compacted, {
+        "tolerance": tolerance, "value_dtype": value_dtype, "chosen": chosen,
+        "before": describe_artifacts(model, forest, X_eval, y_eval),
+        "after": describe_artifacts(pruned, compacted, X_eval, y_eval),
+    }
+
+
+def print_report(report):
+    chosen = report['chosen']
+    print(f"[Trainer] ✅ Kept {chosen['n_trees']} trees, depth cap {chosen['max_depth'] or 'none'}, "
+          f"{report['value_dtype']} leaf values (tolerance {report['tolerance']}).")
+    rows = [("trees", "trees", "{:.0f}"), ("max depth", "max_depth", "{:.0f}"), ("nodes", "nodes", "{:,.0f}"),
+            ("pickled model (MB)", "pickled_mb", "{:.2f}"), ("compact model (MB)", "compact_mb", "{:.2f}"),
+            ("compact load (ms)", "load_ms", "{:.2f}"), ("1-row latency p50 (ms)", "latency_p50_ms", "{:.3f}"),
+            (f"per row, batch of {LATENCY_BATCH_SIZE} (µs)", "batch_us_per_row", "{:.1f}"),
+            ("fraud precision", "precision", "{:.4f}"), ("fraud recall", "recall", "{:.4f}"),
+            ("average precision", "average_precision", "{:.4f}")]
+    print(f"    {'':<28} {'before':>10} {'after':>10}")
+    for label, key, number in rows:
+        print(f"    {label:<28} {number.format(report['before'][key]):>10} {number.format(report['after'][key]):>10}")
+
+
+if __name__ == "__main__":
+    from data_ingestion_and_retraining.feature_store import FeatureStore, sample_training_matrix, FEATURE_STORE_DIR
+    from prediction_service.model_registry import publish_model, MODEL_REGISTRY_DIR
+
+    parser = argparse.ArgumentParser(description="Compacts a trained forest within a quality tolerance.")
+    parser.add_argument("model", nargs="?", default="fraud_detection_model.joblib")
+    parser.add_argument("--store", default=FEATURE_STORE_DIR, help="feature store to draw the evaluation rows from")
+    parser.add_argument("--rows", type=int, default=100000, help="evaluation sample size")
+    parser.add_argument("--tolerance", type=float, default=COMPACTION_TOLERANCE)
+    parser.add_argument("--publish", action="store_true", help=f"publish the result to '{MODEL_REGISTRY_DIR}'")
+    args = parser.parse_args()
+
+    model = joblib.load(args.model)
+    X, y = sample_training_matrix(FeatureStore(args.store), args.rows, random_state=7)
+    print(f"[Trainer] 🔄 Compacting '{args.model}' on {len(y)} rows from '{args.store}'...")
+    pruned, compacted, report = compact_model(model, X, y, args.tolerance)
+    print_report(report)
+    if args.publish:
+        version = publish_model(pruned, MODEL_REGISTRY_DIR, forest=compacted)
+        print(f"[Trainer] ✅ Published the compacted model as version {version}.")
@@ -0,0 +1,229 @@
+# feature_store.py
+#
+# A local, columnar snapshot of fraud_data, already encoded into the model's feature
+# layout, so training, evaluation and backtesting can run without the database.
+#
+# Layout on disk:
+#     feature_store/
+#         manifest.json                  feature names, column dtypes, partition list
+#         steps_000000-000009/           one partition per range of PARTITION_STEPS steps
+#             step.npy amount.npy age_1.npy ... gender_U.npy fraud.npy TransactionID.npy
+#
+# Every column of every partition is a plain .npy file with a compact dtype (one-hot
+# columns are uint8), so it can be opened with np.load(mmap_mode='r'): readers touch
+# only the partitions and columns they ask for, and get NumPy arrays without a copy.
+#
+# With velocity features enabled, the snapshot streams fraud_data in (step, TransactionID)
+# order through a VelocityFeatures state and stores the velocity columns with the rest.
+#
+# How to run (from the project root):
+#     python data_ingestion_and_retraining/feature_store.py snapshot [--sqlite local_fraud.db]
+#     python data_ingestion_and_retraining/feature_store.py info
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.db_connection import connect_sql_server
+from prediction_service.velocity import VelocityFeatures, VELOCITY_FEATURES_ENABLED
+from data_ingestion_and_retraining.streaming_loader import STREAMING_QUERY, DEFAULT_CHUNK_SIZE
+
+# --- Configuration ---
+FEATURE_STORE_DIR = "feature_store"
+MANIFEST_FILE = "manifest.json"
+PARTITION_STEPS = 10
+LABEL_COLUMN = 'fraud'
+ID_COLUMN = 'TransactionID'
+
+
+def column_dtypes(encoder):
+    """Compact on-disk dtype of every stored column."""
+    one_hot = {offset for lookup in encoder.one_hot.values() for offset in lookup.values()}
+    dtypes = {}
+    for offset, name in enumerate(encoder.feature_names):
+        if offset in one_hot:
+            dtypes[name] = 'uint8'
+        elif name == 'step':
+            dtypes[name] = 'int32'
+        else:
+            dtypes[name] = 'float32'
+    dtypes[LABEL_COLUMN] = 'int8'
+    dtypes[ID_COLUMN] = 'int64'
+    return dtypes
+
+
+def partition_name(partition_key, partition_steps):
+    first = partition_key * partition_steps
+    return f"steps_{first:06d}-{first + partition_steps - 1:06d}"
+
+
+def snapshot(conn, directory=FEATURE_STORE_DIR, partition_steps=PARTITION_STEPS, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Streams fraud_data into a new feature store, replacing `directory` atomically."""
+    encoder = FeatureEncoder.for_training()
+    dtypes = column_dtypes(encoder)
+    velocity = VelocityFeatures() if VELOCITY_FEATURES_ENABLED else None
+    building = f"{directory}.building"
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+
+    started = time.perf_counter()
+    rows = {}  # partition key -> row count
+    for chunk in pd.read_sql(STREAMING_QUERY, conn, chunksize=chunk_size):
+        if velocity is not None:
+            velocity.add_to_frame(chunk)
+        features = encoder.encode_frame(chunk)
+        columns = {name: features[:, offset] for offset, name in enumerate(encoder.feature_names)}
+        columns[LABEL_COLUMN] = chunk[LABEL_COLUMN].to_numpy()
+        columns[ID_COLUMN] = chunk[ID_COLUMN].to_numpy()
+
+        keys = chunk['step'].to_numpy(dtype=np.int64) // partition_steps
+        for key in np.unique(keys):
+            selected = keys == key
+            partition = os.path.join(building, partition_name(key, partition_steps))
+            os.makedirs(partition, exist_ok=True)
+            # Raw column bytes are appended per chunk and turned into .npy files at the end
+            for name, values in columns.items():
+                with open(os.path.join(partition, f"{name}.raw"), 'ab') as f:
+                    f.write(np.ascontiguousarray(values[selected], dtype=dtypes[name]).tobytes())
+            rows[int(key)] = rows.get(int(key), 0) + int(selected.sum())
+
+    partitions = []
+    for key in sorted(rows):
+        name = partition_name(key, partition_steps)
+        for column, dtype in dtypes.items():
+            raw_path = os.path.join(building, name, f"{column}.raw")
+            with open(os.path.join(building, name, f"{column}.npy"), 'wb') as target, open(raw_path, 'rb') as source:
+                np.lib.format.write_array_header_1_0(target, {
+                    'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (rows[key],)})
+                shutil.copyfileobj(source, target)
+            os.remove(raw_path)
+        partitions.append({"name": name, "first_step": key * partition_steps,
+                           "last_step": key * partition_steps + partition_steps - 1, "rows": rows[key]})
+
+    manifest = {
+        "feature_names": encoder.feature_names,
+        "dtypes": dtypes,
+        "partition_steps": partition_steps,
+        "partitions": partitions,
+        "rows": sum(rows.values()),
+        "created": time.time(),
+    }
+    with open(os.path.join(building, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # Swap the finished snapshot in, so readers never see a half-written store
+    previous = f"{directory}.previous"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(directory):
+        os.replace(directory, previous)
+    os.replace(building, directory)
+    shutil.rmtree(previous, ignore_errors=True)
+
+    elapsed = time.perf_counter() - started
+    return {"rows": manifest["rows"], "partitions": len(partitions), "seconds": elapsed,
+            "rows_per_sec": manifest["rows"] / elapsed if elapsed > 0 else float('inf')}
+
+
+class FeatureStore:
+    """Read side of a snapshot: memory-mapped, partition- and column-selective."""
+
+    def __init__(self, directory=FEATURE_STORE_DIR):
+        self.directory = directory
+        with open(os.path.join(directory, MANIFEST_FILE), 'r') as f:
+            self.manifest = json.load(f)
+        self.feature_names = self.manifest["feature_names"]
+
+    def partitions(self, steps=None):
+        """Partitions overlapping the inclusive (first_step, last_step) range, or all of them."""
+        if steps is None:
+            return list(self.manifest["partitions"])
+        first, last = steps
+        return [p for p in self.manifest["partitions"] if p["last_step"] >= first and p["first_step"] <= last]
+
+    def column(self, partition, name):
+        """One column of one partition, memory-mapped (no copy, no read until touched)."""
+        return np.load(os.path.join(self.directory, partition["name"], f"{name}.npy"), mmap_mode='r')
+
+    def iter_partitions(self, columns=None, steps=None):
+        """Yields (partition, {column: memory-mapped array}) for the selected partitions."""
+        columns = columns or self.feature_names + [LABEL_COLUMN]
+        for partition in self.partitions(steps):
+            yield partition, {name: self.column(partition, name) for name in columns}
+
+    def load_matrix(self, steps=None, rows=None):
+        """Returns (X, y) for the selected partitions as one float32 matrix.
+
+        `rows`, if given, are indices into the concatenation of the selected partitions;
+        only those rows are gathered from the memory-mapped columns.
+        """
+        selected = self.partitions(steps)
+        offsets = np.cumsum([0] + [p["rows"] for p in selected])
+        total = int(offsets[-1])
+        rows = np.arange(total) if rows is None else np.sort(np.asarray(rows, dtype=np.int64))
+
+        X = np.empty((len(rows), len(self.feature_names)), dtype=np.float32)
+        y = np.empty(len(rows), dtype=np.int8)
+        for index, partition in enumerate(selected):
+            lo, hi = np.searchsorted(rows, [offsets[index], offsets[index + 1]])
+            if lo == hi:
+                continue
+            local = rows[lo:hi] - offsets[index]
+            for offset, name in enumerate(self.feature_names):
+                X[lo:hi, offset] = self.column(partition, name)[local]
+            y[lo:hi] = self.column(partition, LABEL_COLUMN)[local]
+        return X, y
+
+    def labels(self, steps=None):
+        """The label column of the selected partitions (1 byte per row)."""
+        selected = self.partitions(steps)
+        if not selected:
+            return np.empty(0, dtype=np.int8)
+        return np.concatenate([self.column(p, LABEL_COLUMN) for p in selected])
+
+
+def sample_training_matrix(store, sample_size, steps=None, random_state=42):
+    """Draws the same kind of sample as the streaming loader (all fraud rows up to half
+    the sample, the rest uniformly from benign rows) straight from the store."""
+    rng = np.random.default_rng(random_state)
+    labels = store.labels(steps)
+    fraud = np.flatnonzero(labels == 1)
+    benign = np.flatnonzero(labels != 1)
+    if len(fraud) > sample_size // 2:
+        fraud = rng.choice(fraud, sample_size // 2, replace=False)
+    benign_needed = min(max(sample_size - len(fraud), 0), len(benign))
+    benign = rng.choice(benign, benign_needed, replace=False)
+    return store.load_matrix(steps, rows=np.concatenate([fraud, benign]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds or inspects the local feature store.")
+    parser.add_argument("command", choices=["snapshot", "info"])
+    parser.add_argument("--sqlite", metavar="PATH", help="snapshot a local SQLite stand-in instead of SQL Server")
+    parser.add_argument("--directory", default=FEATURE_STORE_DIR)
+    args = parser.parse_args()
+
+    if args.command == "snapshot":
+        print(f"🔄 Snapshotting fraud_data into '{args.directory}'...")
+        conn = sqlite3.connect(args.sqlite) if args.sqlite else connect_sql_server()
+        try:
+            stats = snapshot(conn, args.directory)
+        finally:
+            conn.close()
+        print(f"✅ Stored {stats['rows']} rows in {stats['partitions']} partitions "
+              f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:,.0f} rows/sec).")
+    else:
+        store = FeatureStore(args.directory)
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(args.directory) for name in names)
+        print(f"Feature store '{args.directory}': {store.manifest['rows']} rows, "
+              f"{len(store.manifest['partitions'])} partitions of {store.manifest['partition_steps']} steps, "
+              f"{size / 1e6:.1f} MB on disk.")
+        print(f"Features: {', '.join(store.feature_names)}")
@@ -0,0 +1,300 @@
+# model_search.py
+#
+# Parallel hyperparameter and model-family search for the training pipeline.
+#
+# The sample is loaded, encoded, split and balanced once. The resulting matrices are
+# saved as .npy files in a scratch directory that every worker process memory-maps
+# (read-only, shared through the page cache) instead of receiving its own pickled copy.
+# Candidates - random forests of several sizes and depths, and histogram gradient
+# boosting - are fitted on a process pool, one core each, cheapest first. When the
+# wall-clock budget runs out, the candidates still running are abandoned.
+#
+# Every finished candidate is then timed the way the API would serve it (the compiled
+# FlatForest for forests, predict_proba otherwise), one at a time so the timings don't
+# disturb each other. The winner is the model with the lowest single-row latency among
+# those whose average precision is within QUALITY_TOLERANCE of the best one, so a
+# slightly better but much slower model does not win. It is saved and published like any
+# other training run, and the full leaderboard is written to LEADERBOARD_FILENAME.
+# Candidates are ranked on the validation rows; the test rows are only used to report on
+# the winner, so its reported metrics are not inflated by having been picked on them.
+#
+# How to run (from the project root):
+#     python data_ingestion_and_retraining/model_search.py [--store feature_store] [--mode random --candidates 12] [--budget 900]
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier, HistGradientBoostingClassifier
+from sklearn.metrics import average_precision_score, roc_auc_score, f1_score
+from threadpoolctl import threadpool_limits
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.db_connection import connect_sql_server
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.flat_forest import FlatForest
+from data_ingestion_and_retraining.balancing import forest_params
+from data_ingestion_and_retraining.feature_store import FeatureStore, sample_training_matrix
+from data_ingestion_and_retraining.streaming_loader import load_training_sample
+from data_ingestion_and_retraining.training_pipeline import (
+    SAMPLE_SIZE, CHUNK_SIZE, BALANCING_STRATEGY, report_load, prepare_features, prepare_holdout, balance_training,
+    balance_and_split, save_model, evaluate,
+)
+
+# --- Configuration ---
+SEARCH_WORKERS = int(os.environ.get("FRAUD_SEARCH_WORKERS", os.cpu_count() or 1))
+SEARCH_BUDGET_SECONDS = float(os.environ.get("FRAUD_SEARCH_BUDGET_SECONDS", 900))
+QUALITY_TOLERANCE = 0.005  # average precision a faster model may give up
+MAX_SERVING_LATENCY_MS = float(os.environ.get("FRAUD_SEARCH_MAX_LATENCY_MS", 0))  # 0 = no cap
+LATENCY_ROWS = 200
+LATENCY_BATCH_SIZE = 64
+LEADERBOARD_FILENAME = "model_search_leaderboard.json"
+
+SEARCH_SPACE = {
+    'random_forest': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [12, 20, None],
+        'min_samples_leaf': [1, 5],
+    },
+    'hist_gradient_boosting': {
+        'max_iter': [100, 200],
+        'learning_rate': [0.05, 0.1],
+        'max_leaf_nodes': [31, 63],
+    },
+}
+
+
+def candidates(mode='grid', count=None, random_state=42):
+    """The candidates to try, cheapest first: the full grid, or `count` of them at random."""
+    grid = [{'family': family, 'params': dict(zip(space, values))}
+            for family, space in SEARCH_SPACE.items() for values in itertools.product(*space.values())]
+    if mode == 'random' and count and count < len(grid):
+        rng = np.random.default_rng(random_state)
+        grid = [grid[i] for i in rng.choice(len(grid), count, replace=False)]
+    return sorted(grid, key=lambda c: c['params'].get('n_estimators', c['params'].get('max_iter')))
+
+
+def build_model(candidate, strategy=BALANCING_STRATEGY):
+    params = dict(candidate['params'])
+    class_weight = forest_params(strategy)['class_weight']
+    if candidate['family'] == 'random_forest':
+        return RandomForestClassifier(random_state=42, n_jobs=1, class_weight=class_weight, **params)
+    # Gradient boosting has no bootstrap samples, so the per-subsample weighting becomes 'balanced'
+    return HistGradientBoostingClassifier(random_state=42, class_weight='balanced' if class_weight else None, **params)
+
+
+def describe(candidate):
+    params = ", ".join(f"{name}={value}" for name, value in candidate['params'].items())
+    return f"{candidate['family']}({params})"
+
+
+# --- Worker process ---
+_data = {}
+
+
+def _init_worker(data_dir):
+    threadpool_limits(1)  # one core per candidate; the pool provides the parallelism
+    with open(os.path.join(data_dir, 'features.json'), 'r') as f:
+        _data['feature_names'] = json.load(f)
+    for name in ('X_train', 'y_train', 'X_val', 'y_val'):
+        _data[name] = np.load(os.path.join(data_dir, f'{name}.npy'), mmap_mode='r')
+    _data['dir'] = data_dir
+
+
+def _fit_candidate(task):
+    index, candidate, strategy = task
+    try:
+        model = build_model(candidate, strategy)
+        started = time.perf_counter()
+        model.fit(pd.DataFrame(_data['X_train'], columns=_data['feature_names']), _data['y_train'])
+        fit_seconds = time.perf_counter() - started
+
+        X_val = pd.DataFrame(_data['X_val'], columns=_data['feature_names'])
+        probabilities = model.predict_proba(X_val)[:, list(model.classes_).index(1)]
+        y_val = _data['y_val']
+        path = os.path.join(_data['dir'], f'candidate_{index}.joblib')
+        joblib.dump(model, path)
+        return dict(candidate, fit_seconds=fit_seconds, model_path=path, model_mb=os.path.getsize(path) / 1e6,
+                    average_precision=average_precision_score(y_val, probabilities),
+                    roc_auc=roc_auc_score(y_val, probabilities),
+                    f1=f1_score(y_val, probabilities >= 0.5, zero_division=0))
+    except Exception as e:
+        return dict(candidate, error=f"{type(e).__name__}: {e}")
+
+
+# --- Search ---
+def save_search_data(directory, X_train, y_train, X_val, y_val):
+    """Writes the shared matrices the workers memory-map (the test rows stay in this process)."""
+    with open(os.path.join(directory, 'features.json'), 'w') as f:
+        json.dump([str(name) for name in X_train.columns], f)
+    for name, values, dtype in (('X_train', X_train, np.float32), ('y_train', y_train, np.int8),
+                                ('X_val', X_val, np.float32), ('y_val', y_val, np.int8)):
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(values, dtype=dtype))
+
+
+def fit_candidates(directory, tasks, workers=SEARCH_WORKERS, budget_seconds=SEARCH_BUDGET_SECONDS):
+    """Fits the tasks on a process pool until they are done or the budget runs out."""
+    results = []
+    deadline = time.perf_counter() + budget_seconds
+    pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(directory,))
+    try:
+        finished = pool.imap_unordered(_fit_candidate, tasks)
+        for _ in tasks:
+            try:
+                result = finished.next(timeout=max(deadline - time.perf_counter(), 0))
+            except multiprocessing.TimeoutError:
+                print(f"[Trainer] ⏱️ Search budget of {budget_seconds:.0f}s used up; "
+                      f"abandoning {len(tasks) - len(results)} unfinished candidate(s).")
+                break
+            results.append(result)
+            if 'error' in result:
+                print(f"[Trainer] ❌ {describe(result)} failed: {result['error']}")
+            else:
+                print(f"[Trainer] ✅ {describe(result)}: average precision {result['average_precision']:.4f}, "
+                      f"fit {result['fit_seconds']:.1f}s ({len(results)}/{len(tasks)})")
+    finally:
+        pool.terminate()
+        pool.join()
+    return [r for r in results if 'error' not in r]
+
+
+def measure_serving_latency(model, rows):
+    """Single-row p50/p99 (ms) and per-row cost in a batch (µs), in the form the API serves."""
+    serving = FlatForest.from_sklearn(model) if hasattr(model, 'estimators_') else model
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="X does not have valid feature names")
+        timings = []
+        for row in rows[:LATENCY_ROWS]:
+            started = time.perf_counter()
+            serving.predict_proba(row[np.newaxis, :])
+            timings.append((time.perf_counter() - started) * 1000)
+        batch = rows[:LATENCY_BATCH_SIZE]
+        started = time.perf_counter()
+        for _ in range(10):
+            serving.predict_proba(batch)
+        batch_us = (time.perf_counter() - started) / (10 * len(batch)) * 1e6
+    timings.sort()
+    return timings[len(timings) // 2], timings[min(int(len(timings) * 0.99), len(timings) - 1)], batch_us
+
+
+def choose_winner(results, tolerance=QUALITY_TOLERANCE, max_latency_ms=MAX_SERVING_LATENCY_MS):
+    """The fastest candidate whose average precision is within `tolerance` of the best one."""
+    eligible = [r for r in results if not max_latency_ms or r['latency_p50_ms'] <= max_latency_ms]
+    if not eligible:
+        print(f"[Trainer] WARNING: No candidate meets the {max_latency_ms:g} ms latency cap "
+              f"(FRAUD_SEARCH_MAX_LATENCY_MS); choosing among all of them.")
+        eligible = results
+    best = max(r['average_precision'] for r in eligible)
+    return min((r for r in eligible if r['average_precision'] >= best - tolerance), key=lambda r: r['latency_p50_ms'])
+
+
+def print_leaderboard(results, winner):
+    print("\n--- Model Search Leaderboard (by validation average precision) ---")
+    print(f"{'':2}{'candidate':<76} {'AP':>6} {'ROC AUC':>7} {'F1':>6} {'fit s':>7} "
+          f"{'p50 ms':>7} {'p99 ms':>7} {'µs/row@64':>9} {'MB':>6}")
+    for r in results:
+        marker = "*" if r is winner else ""
+        print(f"{marker:2}{describe(r):<76} {r['average_precision']:>6.4f} {r['roc_auc']:>7.4f} {r['f1']:>6.3f} "
+              f"{r['fit_seconds']:>7.1f} {r['latency_p50_ms']:>7.3f} {r['latency_p99_ms']:>7.3f} "
+              f"{r['batch_us_per_row']:>9.1f} {r['model_mb']:>6.1f}")
+
+
+def load_search_sample(store_dir=None, connect=connect_sql_server):
+    """The encoded sample, split and with its training part balanced, from a feature store
+    snapshot or from the database. Returns (X_train, X_val, X_test, y_train, y_val, y_test).
+
+    From the database, the validation and test rows are the sample's held-out rows, as in
+    training_pipeline.py, so the winner is never ranked on rows a training run has used.
+    """
+    if store_dir:
+        store = FeatureStore(store_dir)
+        if store.feature_names != FeatureEncoder.for_training().feature_names:
+            raise ValueError(f"Feature store '{store_dir}' uses a different feature layout; rebuild it with a new snapshot.")
+        print(f"[Trainer] 🔄 1. Sampling up to {SAMPLE_SIZE} rows from the feature store '{store_dir}'...")
+        X, y = sample_training_matrix(store, SAMPLE_SIZE, random_state=42)
+        X = pd.DataFrame(X, columns=store.feature_names)
+        print(f"[Trainer] ✅ Data prepared. Feature shape: {X.shape}")
+
+        # 3. SPLIT DATA & 4. BALANCE THE TRAINING PART
+        return balance_and_split(X, y)
+
+    print(f"[Trainer] 🔄 1. Streaming a sample of up to {SAMPLE_SIZE} rows from the database...")
+    conn = connect()
+    try:
+        sample, load_stats = load_training_sample(conn, SAMPLE_SIZE, chunk_size=CHUNK_SIZE, random_state=42)
+    finally:
+        conn.close()
+    df = sample.to_frame()
+    report_load(load_stats, len(df))
+    X, y = prepare_features(df)
+    print(f"[Trainer] ✅ Data prepared. Feature shape: {X.shape}")
+
+    # 3. HOLD OUT & 4. BALANCE THE TRAINING PART
+    X_val, X_test, y_val, y_test = prepare_holdout(sample)
+    X_train, y_train = balance_training(X, y)
+    return X_train, X_val, X_test, y_train, y_val, y_test
+
+
+def run_model_search(store_dir=None, mode='grid', count=None, workers=SEARCH_WORKERS,
+                     budget_seconds=SEARCH_BUDGET_SECONDS, connect=connect_sql_server):
+    """Searches the candidates in parallel, then saves and publishes the winner."""
+    print("[Trainer] --- Starting Model Search ---")
+    try:
+        # 1. - 4. LOAD, ENCODE, SPLIT AND BALANCE THE DATA (once for the whole search)
+        X_train, X_val, X_test, y_train, y_val, y_test = load_search_sample(store_dir, connect)
+
+        # 5. FIT THE CANDIDATES IN PARALLEL
+        tasks = [(index, candidate, BALANCING_STRATEGY) for index, candidate in enumerate(candidates(mode, count))]
+        print(f"\n[Trainer] 🔄 5. Fitting {len(tasks)} candidates on {workers} worker process(es), "
+              f"budget {budget_seconds:.0f}s...")
+        with tempfile.TemporaryDirectory(prefix="model_search_") as directory:
+            save_search_data(directory, X_train, y_train, X_val, y_val)
+            results = fit_candidates(directory, tasks, workers, budget_seconds)
+            if not results:
+                raise RuntimeError("No candidate finished within the search budget.")
+
+            print(f"\n[Trainer] 🔄 Measuring the serving latency of {len(results)} candidate(s)...")
+            rows = np.ascontiguousarray(X_val.to_numpy(dtype=np.float32)[:max(LATENCY_ROWS, LATENCY_BATCH_SIZE)])
+            for result in results:
+                model = joblib.load(result['model_path'])
+                result['latency_p50_ms'], result['latency_p99_ms'], result['batch_us_per_row'] = \
+                    measure_serving_latency(model, rows)
+
+            results.sort(key=lambda r: r['average_precision'], reverse=True)
+            winner = choose_winner(results)
+            print_leaderboard(results, winner)
+            model = joblib.load(winner['model_path'])
+
+        with open(LEADERBOARD_FILENAME, 'w') as f:
+            json.dump({"winner": describe(winner), "balancing": BALANCING_STRATEGY,
+                       "leaderboard": [{k: v for k, v in r.items() if k != 'model_path'} for r in results]}, f, indent=2)
+        print(f"\n[Trainer] 🏆 Winner: {describe(winner)} (leaderboard saved to '{LEADERBOARD_FILENAME}').")
+
+        # 6. SAVE MODEL & 7. EVALUATE
+        served = save_model(model, X_val, y_val)
+        evaluate(served, X_test, y_test)
+        return True
+
+    except Exception as e:
+        print(f"❌ AN ERROR OCCURRED during the model search: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parallel hyperparameter and model-family search.")
+    parser.add_argument("--store", metavar="DIR", help="train from a feature store snapshot instead of the database")
+    parser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    parser.add_argument("--candidates", type=int, help="number of candidates for --mode random")
+    parser.add_argument("--workers", type=int, default=SEARCH_WORKERS)
+    parser.add_argument("--budget", type=float, default=SEARCH_BUDGET_SECONDS, help="wall-clock budget in seconds")
+    args = parser.parse_args()
+    success = run_model_search(args.store, args.mode, args.candidates, args.workers, args.budget)
+    sys.exit(0 if success else 1)
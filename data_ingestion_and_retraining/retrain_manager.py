@@ -1,72 +1,268 @@
 # retrain_manager.py
+#
+# Long-running retraining scheduler. It never counts the fraud_data table:
+#   - New rows are counted from the counters the database worker publishes after every
+#     flush (transactions_queue/database_worker.status), which cost nothing to read.
+#   - When there is no fresh worker status (the worker is down, or at start-up), the
+#     count comes from the identity high-water mark instead: MAX(TransactionID), an index
+#     seek, minus the TransactionID the cached training sample has reached.
+#
+# A training run is triggered by any of:
+#   - volume: at least RETRAIN_THRESHOLD new rows since the last training
+#   - time:   some new rows, and MAX_INTERVAL_SECONDS since the last training
+#   - drift:  the share of new rows scored as fraud, or their mean amount, moved by more
+#             than DRIFT_THRESHOLD (relative) from the rows of the previous window
+# but never sooner than MIN_INTERVAL_SECONDS after the previous run.
+#
+# Training runs in a separate process with a capped number of cores (n_jobs and the
+# BLAS/OpenMP thread pools), a lower CPU priority (nice, or BELOW_NORMAL on Windows) and
+# optionally a memory limit, so it doesn't starve an API on the same host. The scheduler's
+# counters and trigger history are kept in retrain_state.json.
+#
+# How to run (from the project root):
+#     python data_ingestion_and_retraining/retrain_manager.py            # run as a scheduler
+#     python data_ingestion_and_retraining/retrain_manager.py --once     # check once and exit (cron / Task Scheduler)
+#     python data_ingestion_and_retraining/retrain_manager.py --sqlite local_fraud.db   # against the SQLite stand-in
 
+import argparse
+import json
 import os
-import pyodbc
-from training_pipeline import run_training 
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.db_connection import connect_sql_server, connect_sqlite, DATABASE_ERRORS
+from prediction_service.queue_notify import STATUS_FILENAME
+from data_ingestion_and_retraining.streaming_loader import TrainingSample
+from data_ingestion_and_retraining.training_pipeline import run_incremental_training, TRAINING_CACHE_DIR
 
 # --- Configuration ---
-CONN_STR = r'DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\SQLEXPRESS;DATABASE=FraudDetectionDB;Trusted_Connection=yes;'
-SQL_QUERY = "SELECT * FROM fraud_data;"
-MODEL_FILENAME = "fraud_detection_model.joblib"
-RETRAIN_THRESHOLD = 1000
-LAST_COUNT_FILE = "last_training_count.txt"
-
-def get_current_db_count():
-    """Gets the current number of rows in the fraud_data table."""
+STATE_FILE = "retrain_state.json"
+TRANSACTION_QUEUE_DIR = "transactions_queue"
+CHECK_INTERVAL_SECONDS = float(os.environ.get("FRAUD_RETRAIN_CHECK_INTERVAL_SECONDS", "60"))
+RETRAIN_THRESHOLD = int(os.environ.get("FRAUD_RETRAIN_MIN_NEW_ROWS", "1000"))
+MAX_INTERVAL_SECONDS = float(os.environ.get("FRAUD_RETRAIN_MAX_INTERVAL_SECONDS", str(24 * 3600)))
+MIN_INTERVAL_SECONDS = float(os.environ.get("FRAUD_RETRAIN_MIN_INTERVAL_SECONDS", "600"))
+DRIFT_THRESHOLD = float(os.environ.get("FRAUD_RETRAIN_DRIFT_THRESHOLD", "0.5"))
+DRIFT_MIN_ROWS = int(os.environ.get("FRAUD_RETRAIN_DRIFT_MIN_ROWS", "500"))
+# Fraud rates are compared relative to at least this much, so 0.1% -> 0.2% is not "doubling"
+DRIFT_FRAUD_RATE_FLOOR = 0.005
+# Worker status older than this is ignored and the high-water mark is read instead
+STATUS_STALE_SECONDS = 300
+
+# Limits of the training process
+TRAINING_N_JOBS = int(os.environ.get("FRAUD_RETRAIN_N_JOBS", str(max(1, (os.cpu_count() or 2) // 2))))
+TRAINING_NICE = int(os.environ.get("FRAUD_RETRAIN_NICE", "10"))
+TRAINING_MAX_MEMORY_MB = int(os.environ.get("FRAUD_RETRAIN_MAX_MEMORY_MB", "0"))  # 0 = no limit (POSIX only)
+TRAINING_TIMEOUT_SECONDS = float(os.environ.get("FRAUD_RETRAIN_TIMEOUT_SECONDS", str(4 * 3600)))
+
+HIGH_WATER_MARK_QUERY = "SELECT MAX(TransactionID) FROM fraud_data;"
+WORKER_COUNTERS = ("rows_inserted", "fraud_rows", "amount_sum")
+
+
+def empty_window():
+    """Counts since the last training. `observed_rows` are the rows whose fraud/amount sums are known."""
+    return {"rows": 0, "observed_rows": 0, "fraud_rows": 0, "amount_sum": 0.0}
+
+
+def load_state(path=STATE_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {"created_at": time.time(), "trained_at": None, "trainings": 0, "since_training": empty_window(),
+            "reference": None, "worker": {}, "last_training": None}
+
+
+def save_state(state, path=STATE_FILE):
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(temporary, path)
+
+
+def read_worker_status(queue_directory=TRANSACTION_QUEUE_DIR):
+    """The database worker's last published status, or None if there is none or it is stale."""
+    try:
+        with open(os.path.join(queue_directory, STATUS_FILENAME), 'r') as f:
+            status = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if "started_at" not in status or time.time() - status.get("updated", 0) > STATUS_STALE_SECONDS:
+        return None
+    return status
+
+
+def database_high_water_mark(connect):
+    """The newest TransactionID (an index seek on the identity key, not a scan)."""
+    conn = connect()
     try:
-        conn = pyodbc.connect(CONN_STR)
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM fraud_data")
-        count = cursor.fetchone()[0]
-        return count
-    except Exception as e:
-        print(f"Error getting DB count: {e}")
-        return 0
+        cursor.execute(HIGH_WATER_MARK_QUERY)
+        return cursor.fetchone()[0] or 0
     finally:
-        if 'conn' in locals() and conn:
-            conn.close()
+        conn.close()
+
+
+def limit_resources():
+    """Runs in the training process before it starts (POSIX)."""
+    os.nice(TRAINING_NICE)
+    if TRAINING_MAX_MEMORY_MB:
+        import resource
+        limit = TRAINING_MAX_MEMORY_MB * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
 
-def get_last_training_count():
-    """Reads the number of rows from the last successful training run."""
-    if not os.path.exists(LAST_COUNT_FILE):
-        return 0
+
+def run_training_process(sqlite=None, timeout=TRAINING_TIMEOUT_SECONDS):
+    """Runs one (incremental) training in a resource-limited child process. Returns True on success."""
+    command = [sys.executable, os.path.abspath(__file__), "--train"] + (["--sqlite", sqlite] if sqlite else [])
+    threads = str(TRAINING_N_JOBS)
+    env = dict(os.environ, FRAUD_TRAINING_N_JOBS=threads, OMP_NUM_THREADS=threads,
+               OPENBLAS_NUM_THREADS=threads, MKL_NUM_THREADS=threads)
+    if os.name == 'nt':
+        limits = {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+    else:
+        limits = {"preexec_fn": limit_resources}
     try:
-        with open(LAST_COUNT_FILE, 'r') as f:
-            return int(f.read().strip())
-    except:
-        return 0
+        return subprocess.run(command, env=env, timeout=timeout, **limits).returncode == 0
+    except subprocess.TimeoutExpired:
+        print(f"[Retrain] ❌ Training did not finish within {timeout:.0f}s and was stopped.")
+        return False
+
+
+class RetrainScheduler:
+    """Decides when to retrain from cheap signals, and runs the training out of process."""
+
+    def __init__(self, connect=connect_sql_server, sqlite=None, state_file=STATE_FILE,
+                 queue_directory=TRANSACTION_QUEUE_DIR, train=run_training_process):
+        self.connect = connect
+        self.sqlite = sqlite
+        self.state_file = state_file
+        self.queue_directory = queue_directory
+        self.train = train
+        self.state = load_state(state_file)
+
+    def observe_worker(self, count=True):
+        """Adds the rows the worker inserted since the last look to the window. False without a fresh status."""
+        status = read_worker_status(self.queue_directory)
+        if status is None:
+            return False
+        seen = self.state["worker"]
+        current = {name: status.get(name, 0) for name in WORKER_COUNTERS}
+        if count and seen.get("started_at") == status["started_at"]:
+            window = self.state["since_training"]
+            delta = {name: max(current[name] - seen.get(name, 0), 0) for name in WORKER_COUNTERS}
+            window["rows"] += delta["rows_inserted"]
+            window["observed_rows"] += delta["rows_inserted"]
+            window["fraud_rows"] += delta["fraud_rows"]
+            window["amount_sum"] += delta["amount_sum"]
+        # A worker seen for the first time (or restarted) only becomes the baseline: its
+        # earlier rows are covered by reconcile()
+        self.state["worker"] = dict(current, started_at=status["started_at"])
+        return True
+
+    def reconcile(self):
+        """Counts new rows from the high-water marks, for whatever the worker counters missed."""
+        try:
+            newest = database_high_water_mark(self.connect)
+        except DATABASE_ERRORS as e:
+            print(f"[Retrain] WARNING: Could not read the high-water mark: {e}")
+            return
+        trained = TrainingSample.saved_high_water_mark(TRAINING_CACHE_DIR) or 0
+        window = self.state["since_training"]
+        window["rows"] = max(window["rows"], newest - trained)
+
+    def drift(self):
+        """A description of the shift since the reference window, or None."""
+        reference, window = self.state["reference"], self.state["since_training"]
+        if not reference or window["observed_rows"] < DRIFT_MIN_ROWS:
+            return None
+        fraud_rate = window["fraud_rows"] / window["observed_rows"]
+        mean_amount = window["amount_sum"] / window["observed_rows"]
+        for name, value, before, scale in (
+                ("fraud rate", fraud_rate, reference["fraud_rate"], max(reference["fraud_rate"], DRIFT_FRAUD_RATE_FLOOR)),
+                ("mean amount", mean_amount, reference["mean_amount"], max(abs(reference["mean_amount"]), 1e-9))):
+            if abs(value - before) / scale > DRIFT_THRESHOLD:
+                return f"{name} {before:.4g} -> {value:.4g}"
+        return None
+
+    def due(self, now=None):
+        """The reason to retrain now, or None."""
+        now = now or time.time()
+        window, trained_at = self.state["since_training"], self.state["trained_at"]
+        if trained_at and now - trained_at < MIN_INTERVAL_SECONDS:
+            return None
+        if window["rows"] >= RETRAIN_THRESHOLD:
+            return f"volume: {window['rows']} new rows"
+        if window["rows"] > 0 and now - (trained_at or self.state["created_at"]) >= MAX_INTERVAL_SECONDS:
+            return f"time: {window['rows']} new rows, {(now - (trained_at or self.state['created_at'])) / 3600:.1f} h since the last training"
+        shift = self.drift()
+        if shift:
+            return f"drift: {shift}"
+        return None
+
+    def retrain(self, reason):
+        print(f"\n[Retrain] ❗️ Retraining ({reason}) in a separate process "
+              f"(n_jobs={TRAINING_N_JOBS}, nice {TRAINING_NICE})...")
+        started = time.time()
+        succeeded = self.train(self.sqlite)
+        self.state["last_training"] = {"started_at": started, "seconds": round(time.time() - started, 1),
+                                       "reason": reason, "succeeded": succeeded}
+        if not succeeded:
+            print("[Retrain] ❌ Retraining failed. The counts are kept, so it is retried on the next check.")
+            return False
+        window = self.state["since_training"]
+        if window["observed_rows"]:
+            self.state["reference"] = {"fraud_rate": window["fraud_rows"] / window["observed_rows"],
+                                       "mean_amount": window["amount_sum"] / window["observed_rows"]}
+        self.state["since_training"] = empty_window()
+        self.state["trained_at"] = time.time()
+        self.state["trainings"] += 1
+        # Rows inserted while training ran are counted from the new high-water mark, not the worker
+        self.observe_worker(count=False)
+        self.reconcile()
+        print(f"[Retrain] ✅ Retraining finished in {time.time() - started:.0f}s.")
+        return True
+
+    def check(self):
+        """One scheduling step. Returns True if a training ran."""
+        if not self.observe_worker():
+            self.reconcile()
+        print(f"[Retrain] 📊 {self.state['since_training']['rows']} new rows since the last training.", flush=True)
+        reason = self.due()
+        if reason:
+            trained = self.retrain(reason)
+        else:
+            print("[Retrain] ✅ No need to retrain at this time.")
+            trained = False
+        save_state(self.state, self.state_file)
+        return trained
+
+    def run(self, interval=CHECK_INTERVAL_SECONDS):
+        self.reconcile()
+        while True:
+            self.check()
+            time.sleep(interval)
 
-def update_last_training_count(count):
-    """Saves the new row count after a successful training run."""
-    with open(LAST_COUNT_FILE, 'w') as f:
-        f.write(str(count))
-    print(f"✅ Updated last training count to {count}.")
 
 # --- Main Orchestrator Logic ---
 if __name__ == "__main__":
-    print("--- Retraining Manager Started ---")
-    
-    current_count = get_current_db_count()
-    last_count = get_last_training_count()
-    
-    print(f"📊 Current records in DB: {current_count}")
-    print(f"📈 Last training was at:   {last_count} records")
-    
-    new_records = current_count - last_count
-    print(f"🆕 New records since last training: {new_records}")
-    
-    if new_records >= RETRAIN_THRESHOLD:
-        print(f"\n❗️ Threshold of {RETRAIN_THRESHOLD} met. Initiating retraining...")
-        
-        # 2. Call the imported function
-        training_successful = run_training()
-        
-        if training_successful:
-            update_last_training_count(current_count)
-        else:
-            print("❌ Retraining failed. The count file will not be updated.")
-            
+    parser = argparse.ArgumentParser(description="Schedules model retraining from ingestion counters.")
+    parser.add_argument("--once", action="store_true", help="check once, retrain if due, and exit")
+    parser.add_argument("--interval", type=float, default=CHECK_INTERVAL_SECONDS, help="seconds between checks")
+    parser.add_argument("--sqlite", metavar="PATH", help="use a local SQLite stand-in instead of SQL Server")
+    parser.add_argument("--train", action="store_true", help=argparse.SUPPRESS)  # the training process itself
+    args = parser.parse_args()
+    connect = (lambda: connect_sqlite(args.sqlite)) if args.sqlite else connect_sql_server
+
+    if args.train:
+        sys.exit(0 if run_incremental_training(connect) else 1)
+
+    print("--- Retraining Scheduler Started ---")
+    scheduler = RetrainScheduler(connect, args.sqlite)
+    if args.once:
+        scheduler.reconcile()
+        scheduler.check()
     else:
-        print("\n✅ No need to retrain at this time. System is up-to-date.")
-        
-    print("\n--- Retraining Manager Finished ---")
+        print(f"Checking every {args.interval:.0f}s. Press Ctrl+C to stop.")
+        scheduler.run(args.interval)
@@ -24,16 +24,20 @@ def add_batch_of_transactions(number_of_records):
             VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
 
-        for i in range(number_of_records):
-            # Create a unique customer ID for each new record
-            customer_id = f"C_SIM_{i}"
-            row_values = (
-                customer_id, sample_transaction['step'], sample_transaction['age'],
+        # Create a unique customer ID for each new record
+        rows = [
+            (
+                f"C_SIM_{i}", sample_transaction['step'], sample_transaction['age'],
                 sample_transaction['gender'], sample_transaction['zipcodeOri'], sample_transaction['merchant'],
                 sample_transaction['zipMerchant'], sample_transaction['category'], sample_transaction['amount'],
                 sample_transaction['fraud']
             )
-            cursor.execute(sql_insert, row_values)
+            for i in range(number_of_records)
+        ]
+
+        # Send all rows as one parameter array instead of one round trip per row
+        cursor.fast_executemany = True
+        cursor.executemany(sql_insert, rows)
 
         conn.commit()
         print(f"✅ Successfully added {number_of_records} new records.")
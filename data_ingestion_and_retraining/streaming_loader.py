@@ -0,0 +1,282 @@
+# streaming_loader.py
+#
+# Loads the training sample from fraud_data without ever holding the whole table:
+# only the columns the model uses are selected, the result set is streamed in chunks,
+# every chunk is downcast to compact dtypes, and the sample is drawn on the fly.
+# Fraud rows are all kept (up to half the sample); benign rows go through a uniform
+# reservoir sample. Peak memory is therefore bounded by the sample size.
+#
+# The sample can be saved with its high-water mark (largest TransactionID seen) and
+# later extended with only the rows added since, for incremental retraining.
+#
+# Rows whose TransactionID % 100 is below HOLDOUT_PERCENT never enter the training sample;
+# a separate reservoir of them (in the real class distribution) is the evaluation set.
+# Membership depends only on the id, so no run, full or incremental, ever trains on a row
+# that an earlier or later run evaluates on.
+#
+# With velocity features enabled (FRAUD_VELOCITY_FEATURES=1; off by default), this is also
+# the batch job behind them: every streamed row (not only the sampled ones) goes through
+# the same VelocityFeatures state the API uses, in (step, TransactionID) order, and the
+# state is saved with the sample so an incremental run continues the stream where the
+# last one stopped. That has a cost: the query gains a full-table ORDER BY, and every row
+# takes a Python-level window update (tens of thousands of rows/sec, see
+# benchmarks/bench_velocity.py) instead of only being downcast.
+
+import json
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.feature_encoder import AGE_CATEGORIES, GENDER_CATEGORIES
+from prediction_service.velocity import VelocityFeatures, VELOCITY_FEATURES, VELOCITY_FEATURES_ENABLED
+
+# --- Configuration ---
+TRAINING_COLUMNS = ['step', 'amount', 'age', 'gender', 'fraud']
+# The velocity state needs every row, in the order the API would have seen them
+VELOCITY_KEY_COLUMNS = ['customer', 'merchant'] if VELOCITY_FEATURES_ENABLED else []
+QUERY_COLUMNS = ', '.join(TRAINING_COLUMNS + VELOCITY_KEY_COLUMNS)
+ORDER_BY = " ORDER BY step, TransactionID" if VELOCITY_FEATURES_ENABLED else ""
+STREAMING_QUERY = f"SELECT TransactionID, {QUERY_COLUMNS} FROM fraud_data{ORDER_BY};"
+INCREMENTAL_QUERY = f"SELECT TransactionID, {QUERY_COLUMNS} FROM fraud_data WHERE TransactionID > ?{ORDER_BY};"
+DEFAULT_CHUNK_SIZE = 50000
+HOLDOUT_PERCENT = 30
+SAMPLE_ARRAYS_FILE = "training_sample.npz"
+SAMPLE_STATE_FILE = "training_sample.json"
+
+CATEGORY_CODES = {
+    'age': {value: code for code, value in enumerate(AGE_CATEGORIES)},
+    'gender': {value: code for code, value in enumerate(GENDER_CATEGORIES)},
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where it can't be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # bytes on macOS, KB on Linux
+
+
+def downcast_chunk(chunk):
+    """Turns a raw chunk into compact column arrays (categoricals as int8 codes)."""
+    columns = {
+        'step': chunk['step'].to_numpy(dtype=np.int32),
+        'amount': chunk['amount'].to_numpy(dtype=np.float32),
+        'fraud': chunk['fraud'].to_numpy(dtype=np.int8),
+    }
+    for name in VELOCITY_FEATURES:
+        if name in chunk:
+            columns[name] = chunk[name].to_numpy(dtype=np.float32)
+    for column, codes in CATEGORY_CODES.items():
+        # Unknown values become -1, i.e. a missing category (all dummy columns 0)
+        values = chunk[column].astype(str).str.strip("'")
+        columns[column] = values.map(codes).fillna(-1).to_numpy(dtype=np.int8)
+    return columns
+
+
+class Reservoir:
+    """Uniform fixed-size sample of a stream of column arrays (vectorized Algorithm R)."""
+
+    def __init__(self, capacity, rng):
+        self.capacity = capacity
+        self.rng = rng
+        self.seen = 0
+        self.size = 0
+        self.columns = None
+
+    def add(self, columns):
+        count = len(next(iter(columns.values())))
+        if count == 0:
+            return
+        if self.columns is None:
+            self.columns = {name: np.empty(self.capacity, dtype=values.dtype) for name, values in columns.items()}
+
+        # Fill the reservoir first...
+        fill = min(self.capacity - self.size, count)
+        for name, values in columns.items():
+            self.columns[name][self.size:self.size + fill] = values[:fill]
+        self.size += fill
+
+        # ...then the n-th row of the stream replaces a random slot with probability capacity / n
+        remaining = count - fill
+        if remaining > 0:
+            positions = self.seen + fill + np.arange(1, remaining + 1)
+            accepted = np.flatnonzero(self.rng.random(remaining) < self.capacity / positions)
+            slots = self.rng.integers(0, self.capacity, size=len(accepted))
+            for name, values in columns.items():
+                self.columns[name][slots] = values[fill:][accepted]
+        self.seen += count
+
+    def arrays(self):
+        if self.columns is None:
+            return {}
+        return {name: values[:self.size] for name, values in self.columns.items()}
+
+
+class TrainingSample:
+    """The training sample as it is built from a stream of fraud_data rows.
+
+    All fraud rows are kept (up to half the sample) and benign rows are reservoir
+    sampled, so after any number of `add_chunk` calls the sample is still a uniform
+    sample of everything seen. Held-out rows go to their own uniform reservoir instead.
+    Together with the high-water mark (the largest TransactionID seen) it can be saved
+    and later extended with only the new rows.
+    """
+
+    def __init__(self, sample_size, random_state=42, velocity=None):
+        self.sample_size = sample_size
+        self.rng = np.random.default_rng(random_state)
+        self.fraud = Reservoir(max(sample_size // 2, 1), self.rng)
+        self.benign = Reservoir(sample_size, self.rng)
+        self.holdout = Reservoir(max(sample_size * HOLDOUT_PERCENT // 100, 1), self.rng)
+        self.high_water_mark = 0
+        if velocity is None and VELOCITY_FEATURES_ENABLED:
+            velocity = VelocityFeatures()
+        self.velocity = velocity
+
+    @property
+    def columns(self):
+        return TRAINING_COLUMNS + (VELOCITY_FEATURES if self.velocity is not None else [])
+
+    def add_chunk(self, chunk):
+        if self.velocity is not None:
+            self.velocity.add_to_frame(chunk)
+        columns = downcast_chunk(chunk)
+        is_fraud = columns['fraud'] == 1
+        held_out = np.zeros(len(chunk), dtype=bool)
+        if 'TransactionID' in chunk and len(chunk):
+            transaction_ids = chunk['TransactionID'].to_numpy(dtype=np.int64)
+            held_out = transaction_ids % 100 < HOLDOUT_PERCENT
+            self.high_water_mark = max(self.high_water_mark, int(transaction_ids.max()))
+        self.holdout.add({name: values[held_out] for name, values in columns.items()})
+        self.fraud.add({name: values[is_fraud & ~held_out] for name, values in columns.items()})
+        self.benign.add({name: values[~is_fraud & ~held_out] for name, values in columns.items()})
+
+    @property
+    def rows_seen(self):
+        return self.fraud.seen + self.benign.seen + self.holdout.seen
+
+    def to_frame(self):
+        """The training rows."""
+        if self.fraud.seen + self.benign.seen == 0:
+            raise ValueError("fraud_data returned no rows to train on.")
+        # All fraud rows (up to half the sample), topped up with benign rows
+        benign_needed = max(self.sample_size - self.fraud.size, 0)
+        parts = [self.fraud.arrays(), {name: values[:benign_needed] for name, values in self.benign.arrays().items()}]
+        return self._frame([part for part in parts if part])
+
+    def holdout_frame(self):
+        """The held-out rows, which no training run has used."""
+        if self.holdout.size == 0:
+            raise ValueError("fraud_data returned no held-out rows to evaluate on.")
+        return self._frame([self.holdout.arrays()])
+
+    def _frame(self, parts):
+        merged = {name: np.concatenate([part[name] for part in parts]) for name in self.columns}
+        return pd.DataFrame({
+            'step': merged['step'],
+            'amount': merged['amount'],
+            'age': pd.Categorical.from_codes(merged['age'], categories=AGE_CATEGORIES),
+            'gender': pd.Categorical.from_codes(merged['gender'], categories=GENDER_CATEGORIES),
+            'fraud': merged['fraud'],
+            **{name: merged[name] for name in self.columns if name not in TRAINING_COLUMNS},
+        })
+
+    def save(self, directory):
+        """Writes the sample as compressed column arrays plus a small JSON state file."""
+        os.makedirs(directory, exist_ok=True)
+        arrays = {}
+        for prefix, reservoir in (('fraud', self.fraud), ('benign', self.benign), ('holdout', self.holdout)):
+            for name, values in reservoir.arrays().items():
+                arrays[f"{prefix}.{name}"] = values
+        np.savez_compressed(os.path.join(directory, SAMPLE_ARRAYS_FILE), **arrays)
+        if self.velocity is not None:
+            self.velocity.save(directory)
+        state = {
+            "sample_size": self.sample_size,
+            "high_water_mark": self.high_water_mark,
+            "fraud_seen": self.fraud.seen,
+            "benign_seen": self.benign.seen,
+            "holdout_seen": self.holdout.seen,
+            "rng_state": self.rng.bit_generator.state,
+        }
+        temporary = os.path.join(directory, SAMPLE_STATE_FILE + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(state, f)
+        os.replace(temporary, os.path.join(directory, SAMPLE_STATE_FILE))
+
+    @staticmethod
+    def saved_high_water_mark(directory):
+        """The high-water mark of a saved sample without loading it, or None if there is none."""
+        try:
+            with open(os.path.join(directory, SAMPLE_STATE_FILE), 'r') as f:
+                return json.load(f)["high_water_mark"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    @classmethod
+    def load(cls, directory):
+        """Restores a saved sample, or returns None if there is no (usable) cache."""
+        state_path = os.path.join(directory, SAMPLE_STATE_FILE)
+        arrays_path = os.path.join(directory, SAMPLE_ARRAYS_FILE)
+        if not (os.path.exists(state_path) and os.path.exists(arrays_path)):
+            return None
+        velocity = None
+        if VELOCITY_FEATURES_ENABLED:
+            # Without the state the stream can't be continued, so the sample is unusable
+            velocity = VelocityFeatures.load(directory)
+            if velocity is None:
+                return None
+        with open(state_path, 'r') as f:
+            state = json.load(f)
+        if "holdout_seen" not in state:
+            return None  # saved before rows were held out, so its training rows include them
+        sample = cls(state["sample_size"], velocity=velocity)
+        sample.rng.bit_generator.state = state["rng_state"]
+        sample.high_water_mark = state["high_water_mark"]
+        with np.load(arrays_path) as arrays:
+            for prefix, reservoir, seen in (('fraud', sample.fraud, state["fraud_seen"]),
+                                            ('benign', sample.benign, state["benign_seen"]),
+                                            ('holdout', sample.holdout, state["holdout_seen"])):
+                if seen and f"{prefix}.{sample.columns[-1]}" not in arrays:
+                    return None  # saved without the velocity columns this layout needs
+                columns = {name: arrays[f"{prefix}.{name}"] for name in sample.columns if f"{prefix}.{name}" in arrays}
+                if columns:
+                    reservoir.add(columns)
+                reservoir.seen = seen
+        return sample
+
+
+def stream_into(sample, conn, query=STREAMING_QUERY, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Streams a query's rows into `sample` chunk by chunk. Returns load statistics."""
+    started = time.perf_counter()
+    streamed = 0
+    for chunk in pd.read_sql(query, conn, params=params, chunksize=chunk_size):
+        sample.add_chunk(chunk)
+        streamed += len(chunk)
+    elapsed = time.perf_counter() - started
+    return {
+        "rows_streamed": streamed,
+        "fraud_rows_seen": sample.fraud.seen,
+        "sample_fraud_rows": sample.fraud.size,
+        "holdout_rows": sample.holdout.size,
+        "high_water_mark": sample.high_water_mark,
+        "seconds": elapsed,
+        "rows_per_sec": streamed / elapsed if elapsed > 0 else float('inf'),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def load_training_sample(conn, sample_size, chunk_size=DEFAULT_CHUNK_SIZE, random_state=42):
+    """Streams the whole of fraud_data and returns (TrainingSample, load statistics)."""
+    sample = TrainingSample(sample_size, random_state)
+    stats = stream_into(sample, conn, STREAMING_QUERY, chunk_size=chunk_size)
+    return sample, stats
@@ -1,79 +1,186 @@
 # training_pipeline.py (Big Data Ready Version)
 
+import os
+import sys
+import time
+import numpy as np
 import pandas as pd
-import pyodbc
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import classification_report, confusion_matrix
 import joblib
-from imblearn.over_sampling import SMOTE
 import matplotlib.pyplot as plt
 import seaborn as sns
 
-def run_training():
+# Make the project root importable so training shares the serving feature encoder.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.model_registry import publish_model, atomic_joblib_dump, MODEL_REGISTRY_DIR
+from prediction_service.db_connection import connect_sql_server
+from data_ingestion_and_retraining.streaming_loader import (
+    TrainingSample, load_training_sample, stream_into, INCREMENTAL_QUERY,
+)
+from data_ingestion_and_retraining.feature_store import FeatureStore, sample_training_matrix, FEATURE_STORE_DIR
+from data_ingestion_and_retraining.balancing import balance, forest_params
+from data_ingestion_and_retraining.compaction import compact_model, print_report, COMPACTION_ENABLED, COMPACTION_TOLERANCE
+
+# --- Configuration ---
+MODEL_FILENAME = "fraud_detection_model.joblib"
+SAMPLE_SIZE = int(os.environ.get("FRAUD_TRAINING_SAMPLE_SIZE", 150000)) # <-- THE FIX: Define a sample size
+CHUNK_SIZE = 50000   # rows fetched from the database per chunk
+N_ESTIMATORS = 100
+# Cores used to fit the forest (-1 = all); the retrain scheduler caps it so training
+# doesn't starve an API running on the same host
+TRAINING_N_JOBS = int(os.environ.get("FRAUD_TRAINING_N_JOBS", "-1"))
+# How the training data is balanced: smote, chunked_smote, undersample or class_weight
+# (see balancing.py). The cheaper strategies allow a much larger SAMPLE_SIZE in the same time.
+BALANCING_STRATEGY = os.environ.get("FRAUD_BALANCING_STRATEGY", "smote")
+# Share of the held-out rows used to make choices (the compaction configuration, the model
+# search winner); the rest is only used for the final report, so that stays unbiased
+VALIDATION_FRACTION = 0.5
+# With 1, new models are published as the registry's candidate: the API shadow-scores
+# live traffic with them and they only go live when promoted (POST /admin/model/promote,
+# with the FRAUD_ADMIN_TOKEN in an X-Admin-Token header)
+PUBLISH_AS_CANDIDATE = os.environ.get("FRAUD_PUBLISH_AS_CANDIDATE", "0") == "1"
+
+# Incremental retraining: the training sample and its high-water mark are cached here,
+# so an update only reads rows added since the last run. Each update grows the forest
+# by NEW_TREES_PER_UPDATE trees fitted on the refreshed sample and retires the oldest
+# trees beyond MAX_TREES (a sliding window over training runs).
+TRAINING_CACHE_DIR = "training_cache"
+NEW_TREES_PER_UPDATE = 20
+MAX_TREES = 100
+
+def report_load(load_stats, sample_rows):
+    peak_rss = f"{load_stats['peak_rss_mb']:.0f} MB" if load_stats['peak_rss_mb'] is not None else "n/a"
+    print(f"[Trainer] ✅ Streamed {load_stats['rows_streamed']} rows in {load_stats['seconds']:.1f}s "
+          f"({load_stats['rows_per_sec']:,.0f} rows/sec, peak RSS {peak_rss}).")
+    print(f"[Trainer] ✅ Sample ready: {sample_rows} rows, including {load_stats['sample_fraud_rows']} fraud rows "
+          f"(plus {load_stats['holdout_rows']} held-out rows).")
+
+def prepare_features(df):
+    """Encodes the sample with the shared FeatureEncoder. Returns (X, y)."""
+    df_prepared = df.drop(['TransactionID', 'customer', 'merchant', 'zipcodeOri', 'zipMerchant', 'category'], axis=1, errors='ignore')
+
+    # The same encoder is rebuilt from model.feature_names_in_ by the API,
+    # so the training and serving column layouts cannot drift apart.
+    encoder = FeatureEncoder.for_training()
+    X = pd.DataFrame(encoder.encode_frame(df_prepared), columns=encoder.feature_names, index=df_prepared.index)
+    y = df_prepared['fraud']
+    return X, y
+
+def balance_and_split(X, y, strategy=BALANCING_STRATEGY):
+    """Splits the sample, then balances only the training part. Returns (X_train, X_test, y_train, y_test).
+
+    The test part keeps the real class distribution and no synthetic rows, so the
+    evaluation is comparable across balancing strategies.
+    """
+    print("\n[Trainer] 🔄 3. Splitting data...")
+    X_train, X_held_out, y_train, y_held_out = train_test_split(X, y, test_size=0.3, random_state=42, stratify=y)
+    X_val, X_test, y_val, y_test = split_validation(X_held_out, y_held_out)
+    print(f"[Trainer] ✅ Data split successfully ({len(y_val)} validation and {len(y_test)} test rows).")
+    X_train, y_train = balance_training(X_train, y_train, strategy)
+    return X_train, X_val, X_test, y_train, y_val, y_test
+
+def split_validation(X_held_out, y_held_out):
+    """Splits held-out rows into validation rows (for choosing) and test rows (for reporting).
+
+    Returns (X_val, X_test, y_val, y_test).
+    """
+    stratify = y_held_out if min(np.bincount(np.asarray(y_held_out, dtype=np.int64), minlength=2)) >= 2 else None
+    return train_test_split(X_held_out, y_held_out, train_size=VALIDATION_FRACTION, random_state=42, stratify=stratify)
+
+def prepare_holdout(sample):
+    """Encodes the sample's held-out rows (see streaming_loader.py) and splits them with
+    split_validation(). Returns (X_val, X_test, y_val, y_test).
+
+    They are chosen by TransactionID, so no run, full or incremental, has trained on them:
+    the retained trees of an incremental update are evaluated on unseen rows too.
+    """
+    print("\n[Trainer] 🔄 3. Preparing the held-out rows...")
+    X_held_out, y_held_out = prepare_features(sample.holdout_frame())
+    X_val, X_test, y_val, y_test = split_validation(X_held_out, y_held_out)
+    print(f"[Trainer] ✅ {len(y_held_out)} held-out rows, including {int((y_held_out == 1).sum())} fraud rows "
+          f"({len(y_val)} for validation, {len(y_test)} for the test report).")
+    return X_val, X_test, y_val, y_test
+
+def balance_training(X_train, y_train, strategy=BALANCING_STRATEGY):
+    print(f"\n[Trainer] 🔄 4. Balancing the training data ({strategy})...")
+    started = time.perf_counter()
+    X_train, y_train = balance(X_train, y_train, strategy, random_state=42)
+    print(f"[Trainer] ✅ Balancing complete in {time.perf_counter() - started:.1f}s. Training data shape: {X_train.shape}")
+    return X_train, y_train
+
+def save_model(model, X_eval=None, y_eval=None):
+    """Saves the full model (the state incremental runs grow) and publishes it for serving.
+
+    With validation rows, a forest is first compacted (fewer trees, capped depth, float32
+    arrays) within COMPACTION_TOLERANCE, and the compacted version is what gets published.
+    Returns the model as it is served (the compacted FlatForest, if any), for evaluate().
+    """
+    print(f"\n[Trainer] 🔄 6. Saving the trained model to '{MODEL_FILENAME}'...")
+    atomic_joblib_dump(model, MODEL_FILENAME)
+    print(f"[Trainer] ✅ Model saved successfully.")
+
+    served, forest = model, None
+    if COMPACTION_ENABLED and X_eval is not None and hasattr(model, 'estimators_'):
+        print(f"[Trainer] 🔄 Compacting the forest for serving (tolerance {COMPACTION_TOLERANCE})...")
+        served, forest, report = compact_model(model, X_eval, y_eval)
+        print_report(report)
+
+    # The running API hot-swaps to each version published here (no restart needed),
+    # or shadow-scores it first when it is published as a candidate
+    print(f"[Trainer] 🔄 Publishing the model and its compiled forest to '{MODEL_REGISTRY_DIR}'...")
+    version = publish_model(served, MODEL_REGISTRY_DIR, forest=forest, as_candidate=PUBLISH_AS_CANDIDATE)
+    print(f"[Trainer] ✅ Published model version {version}{' as the candidate' if PUBLISH_AS_CANDIDATE else ''}.")
+    return forest if forest is not None else served
+
+def evaluate(model, X_test, y_test):
+    """Reports on test rows that played no part in training or in choosing the model."""
+    print("\n[Trainer] 🔄 7. Evaluating the served model...")
+    predictions = model.predict(X_test)
+    print("\n--- Model Evaluation Report ---")
+    print(classification_report(y_test, predictions, target_names=['Benign (0)', 'Fraud (1)']))
+
+def fit_and_save(X_train, y_train, X_eval=None, y_eval=None, strategy=BALANCING_STRATEGY):
+    """Trains and saves a forest. Returns the model as it is served (see save_model)."""
+    print("\n[Trainer] 🔄 5. Training the RandomForestClassifier model...")
+    model = RandomForestClassifier(n_estimators=N_ESTIMATORS, random_state=42, n_jobs=TRAINING_N_JOBS, **forest_params(strategy))
+    model.fit(X_train, y_train)
+    print("[Trainer] ✅ Model training complete.")
+    return save_model(model, X_eval, y_eval)
+
+def run_training(connect=connect_sql_server):
     print("[Trainer] --- Starting Model Training Pipeline ---")
-    
-    # --- Configuration ---
-    CONN_STR = r'DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\SQLEXPRESS;DATABASE=FraudDetectionDB;Trusted_Connection=yes;'
-    SQL_QUERY = "SELECT * FROM fraud_data;"
-    MODEL_FILENAME = "fraud_detection_model.joblib"
-    SAMPLE_SIZE = 150000 # <-- THE FIX: Define a sample size
 
     conn = None
     try:
         # 1. LOAD DATA
-        print(f"[Trainer] 🔄 1. Loading data from SQL Server...")
-        conn = pyodbc.connect(CONN_STR)
-        df = pd.read_sql(SQL_QUERY, conn)
-        print(f"[Trainer] ✅ Data loaded successfully with {len(df)} rows.")
-
-        # === THE FIX: SAMPLE THE DATA IF IT'S TOO LARGE ===
-        if len(df) > SAMPLE_SIZE:
-            print(f"[Trainer] 🔄 Dataframe is too large ({len(df)} rows). Taking a random sample of {SAMPLE_SIZE} rows.")
-            df = df.sample(n=SAMPLE_SIZE, random_state=42)
-            print(f"[Trainer] ✅ Sampling complete. New dataframe size: {len(df)} rows.")
-        # =================================================
+        # Stream only the model's columns in chunks and sample on the fly (keeping every
+        # fraud row), so memory is bounded by SAMPLE_SIZE rather than by the table size.
+        print(f"[Trainer] 🔄 1. Streaming a sample of up to {SAMPLE_SIZE} rows from the database...")
+        conn = connect()
+        sample, load_stats = load_training_sample(conn, SAMPLE_SIZE, chunk_size=CHUNK_SIZE, random_state=42)
+        df = sample.to_frame()
+        report_load(load_stats, len(df))
 
         # 2. FEATURE ENGINEERING & PREPARATION
         print("\n[Trainer] 🔄 2. Preparing data for modeling...")
-        # (The rest of the code is the same)
-        df_prepared = df.drop(['TransactionID', 'customer', 'merchant', 'zipcodeOri', 'zipMerchant', 'category'], axis=1, errors='ignore')
-        
-        df_prepared['age'] = pd.Categorical(df_prepared['age'], categories=['0', '1', '2', '3', '4', '5', '6', 'U'])
-        df_prepared['gender'] = pd.Categorical(df_prepared['gender'], categories=['E', 'F', 'M', 'U'])
-
-        X = pd.get_dummies(df_prepared.drop('fraud', axis=1), columns=['age', 'gender'], drop_first=True)
-        y = df_prepared['fraud']
+        X, y = prepare_features(df)
         print(f"[Trainer] ✅ Data prepared. Feature shape: {X.shape}")
 
-        # 3. HANDLE CLASS IMBALANCE WITH SMOTE
-        print("\n[Trainer] 🔄 3. Balancing data using SMOTE...")
-        smote = SMOTE(random_state=42)
-        X_resampled, y_resampled = smote.fit_resample(X, y)
-        print(f"[Trainer] ✅ SMOTE complete. Resampled data shape: {X_resampled.shape}")
-
-        # 4. SPLIT DATA
-        print("\n[Trainer] 🔄 4. Splitting data...")
-        X_train, X_test, y_train, y_test = train_test_split(X_resampled, y_resampled, test_size=0.3, random_state=42, stratify=y_resampled)
-        print("[Trainer] ✅ Data split successfully.")
-
-        # 5. TRAIN MODEL
-        print("\n[Trainer] 🔄 5. Training the RandomForestClassifier model...")
-        model = RandomForestClassifier(n_estimators=100, random_state=42, n_jobs=-1)
-        model.fit(X_train, y_train)
-        print("[Trainer] ✅ Model training complete.")
+        # 3. HOLD OUT & 4. BALANCE THE TRAINING PART
+        X_val, X_test, y_val, y_test = prepare_holdout(sample)
+        X_train, y_train = balance_training(X, y)
 
-        # 6. SAVE MODEL
-        print(f"\n[Trainer] 🔄 6. Saving the trained model to '{MODEL_FILENAME}'...")
-        joblib.dump(model, MODEL_FILENAME)
-        print(f"[Trainer] ✅ Model saved successfully.")
+        # 5. TRAIN MODEL & 6. SAVE MODEL (and the sample, so the next run can be incremental)
+        served = fit_and_save(X_train, y_train, X_val, y_val)
+        sample.save(TRAINING_CACHE_DIR)
+        print(f"[Trainer] ✅ Training sample cached in '{TRAINING_CACHE_DIR}' (high-water mark: TransactionID {sample.high_water_mark}).")
 
         # 7. EVALUATE
-        print("\n[Trainer] 🔄 7. Evaluating the model...")
-        predictions = model.predict(X_test)
-        print("\n--- Model Evaluation Report ---")
-        print(classification_report(y_test, predictions, target_names=['Benign (0)', 'Fraud (1)']))
-        
+        evaluate(served, X_test, y_test)
+
         return True # Indicate success
 
     except Exception as e:
@@ -84,3 +191,109 @@ def run_training():
             conn.close()
             print("\n[Trainer] 🔌 Database connection closed.")
 
+def run_incremental_training(connect=connect_sql_server):
+    """Updates the model with only the rows added since the last training run.
+
+    Falls back to a full run_training() when there is no cached sample or model yet.
+    """
+    sample = TrainingSample.load(TRAINING_CACHE_DIR)
+    if sample is None or not os.path.exists(MODEL_FILENAME):
+        print("[Trainer] No cached training sample or model found; running a full training instead.")
+        return run_training(connect)
+
+    print("[Trainer] --- Starting Incremental Training Pipeline ---")
+    conn = None
+    try:
+        # 1. LOAD ONLY THE NEW DATA
+        print(f"[Trainer] 🔄 1. Streaming rows after TransactionID {sample.high_water_mark}...")
+        conn = connect()
+        load_stats = stream_into(sample, conn, INCREMENTAL_QUERY, params=(sample.high_water_mark,), chunk_size=CHUNK_SIZE)
+        if load_stats['rows_streamed'] == 0:
+            print("[Trainer] ✅ No new rows since the last training run. Nothing to do.")
+            return True
+        df = sample.to_frame()
+        report_load(load_stats, len(df))
+
+        # 2. FEATURE ENGINEERING & PREPARATION
+        print("\n[Trainer] 🔄 2. Preparing data for modeling...")
+        X, y = prepare_features(df)
+        print(f"[Trainer] ✅ Data prepared. Feature shape: {X.shape}")
+
+        model = joblib.load(MODEL_FILENAME)
+        if not hasattr(model, 'estimators_'):
+            print(f"[Trainer] The saved model ({type(model).__name__}) can't be grown tree by tree; running a full training instead.")
+            return run_training(connect)
+        if list(model.feature_names_in_) != list(X.columns):
+            print("[Trainer] The saved model uses a different feature layout; running a full training instead.")
+            return run_training(connect)
+
+        # 3. HOLD OUT & 4. BALANCE THE TRAINING PART
+        # Not a split of the refreshed sample: the retained trees were trained on it
+        X_val, X_test, y_val, y_test = prepare_holdout(sample)
+        X_train, y_train = balance_training(X, y)
+
+        # 5. GROW THE FOREST
+        print(f"\n[Trainer] 🔄 5. Adding {NEW_TREES_PER_UPDATE} trees fitted on the refreshed sample...")
+        # A new seed per update, so the new trees don't repeat the previous update's bootstraps
+        model.set_params(warm_start=True, n_estimators=len(model.estimators_) + NEW_TREES_PER_UPDATE,
+                         random_state=42 + sample.high_water_mark, n_jobs=TRAINING_N_JOBS, **forest_params(BALANCING_STRATEGY))
+        model.fit(X_train, y_train)
+        if len(model.estimators_) > MAX_TREES:
+            retired = len(model.estimators_) - MAX_TREES
+            model.estimators_ = model.estimators_[retired:]
+            print(f"[Trainer] ✅ Retired the {retired} oldest tree(s).")
+        model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+        print(f"[Trainer] ✅ Forest updated: {len(model.estimators_)} trees.")
+
+        # 6. SAVE MODEL (and the sample with its new high-water mark)
+        served = save_model(model, X_val, y_val)
+        sample.save(TRAINING_CACHE_DIR)
+        print(f"[Trainer] ✅ Training sample cached (high-water mark: TransactionID {sample.high_water_mark}).")
+
+        # 7. EVALUATE
+        evaluate(served, X_test, y_test)
+
+        return True
+
+    except Exception as e:
+        print(f"❌ AN ERROR OCCURRED during the incremental training pipeline: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+            print("\n[Trainer] 🔌 Database connection closed.")
+
+def run_training_from_store(store_dir=FEATURE_STORE_DIR, steps=None):
+    """Full training run from a local feature store snapshot instead of the database.
+
+    The rows are already encoded, so only the sampled rows are read from the
+    memory-mapped columns. `steps` optionally limits training to a (first, last) step range.
+    """
+    print("[Trainer] --- Starting Model Training Pipeline (feature store) ---")
+    try:
+        # 1. LOAD DATA
+        store = FeatureStore(store_dir)
+        expected = FeatureEncoder.for_training().feature_names
+        if store.feature_names != expected:
+            raise ValueError(f"Feature store '{store_dir}' uses a different feature layout; rebuild it with a new snapshot.")
+        print(f"[Trainer] 🔄 1. Sampling up to {SAMPLE_SIZE} rows from the feature store '{store_dir}'...")
+        X, y = sample_training_matrix(store, SAMPLE_SIZE, steps=steps, random_state=42)
+        if len(y) == 0:
+            raise ValueError("The feature store has no rows in the requested step range.")
+        X = pd.DataFrame(X, columns=store.feature_names)
+        print(f"[Trainer] ✅ Data prepared. Feature shape: {X.shape}, including {int((y == 1).sum())} fraud rows.")
+
+        # 3. SPLIT DATA & 4. BALANCE THE TRAINING PART
+        X_train, X_val, X_test, y_train, y_val, y_test = balance_and_split(X, y)
+
+        # 5. TRAIN MODEL & 6. SAVE MODEL
+        served = fit_and_save(X_train, y_train, X_val, y_val)
+
+        # 7. EVALUATE
+        evaluate(served, X_test, y_test)
+
+        return True
+
+    except Exception as e:
+        print(f"❌ AN ERROR OCCURRED during the training pipeline: {e}")
+        return False
@@ -1,17 +1,12 @@
 import joblib
 import pandas as pd
+from prediction_service.feature_encoder import FeatureEncoder
 
 # --- Configuration ---
 MODEL_FILENAME = "fraud_detection_model.joblib"
 
-# --- CORRECTED COLUMN LIST ---
-# These names now EXACTLY match the names from the training process.
-# Notice the quotes around the numbers for 'age'.
-EXPECTED_COLUMNS = [
-    'step', 'amount', 
-    "age_'1'", "age_'2'", "age_'3'", "age_'4'", "age_'5'", "age_'6'", "age_'U'",
-    "gender_'F'", "gender_'M'", "gender_'U'"
-]
+# The column layout is no longer hard-coded here: it is read from the model's
+# feature_names_in_ by the same FeatureEncoder the API and the trainer use.
 
 def predict_single_transaction(transaction_data):
     """
@@ -36,13 +31,9 @@ def predict_single_transaction(transaction_data):
         'gender': str(transaction_data['gender'])
     }
     
-    input_df = pd.DataFrame([transaction_data_typed])
-
-    # One-Hot Encode the categorical features
-    input_df_encoded = pd.get_dummies(input_df)
-    
-    # Align columns with the training data
-    final_df = input_df_encoded.reindex(columns=EXPECTED_COLUMNS, fill_value=0)
+    # One-Hot Encode the categorical features, aligned with the training columns
+    encoder = FeatureEncoder(model.feature_names_in_)
+    final_df = pd.DataFrame(encoder.encode_one(transaction_data_typed), columns=encoder.feature_names)
     
     print("✅ New data prepared for prediction.")
     print("   - Data to be predicted:\n", final_df)
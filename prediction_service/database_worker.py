@@ -1,63 +1,229 @@
 # database_worker.py (Back to Basics Version)
-import pyodbc
+import argparse
 import json
 import time
 import os
+import sys
+
+# Make the project root importable when this file is run as a script.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.segment_log import SegmentLogReader
+from prediction_service.record_codec import is_binary, decode_frame, record_count, payload_text
+from prediction_service.queue_notify import QueueListener, write_status, DEFAULT_NOTIFY_PORT
+from prediction_service.metrics import Histogram, STAGE_MS_BUCKETS
+from prediction_service.db_connection import (
+    DatabaseConnection, connect_sqlite, enable_fast_executemany,
+    FRAUD_DATA_COLUMNS, INSERT_SQL, DATABASE_ERRORS, ROW_ERRORS,
+)
 
 # --- Configuration ---
-CONN_STR = r'DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\SQLEXPRESS;DATABASE=FraudDetectionDB;Trusted_Connection=yes;'
-TRANSACTION_QUEUE_FILE = "transactions_queue.log"
+TRANSACTION_QUEUE_DIR = "transactions_queue"
+DEAD_LETTER_FILE = "transactions_dead_letter.log"
+MAX_RECORDS_PER_FLUSH = 10000
+INSERT_CHUNK_SIZE = 1000
 
-def process_queue():
-    if not os.path.exists(TRANSACTION_QUEUE_FILE):
-        return # Wait silently if no file
+# Event-driven flushing: flush as soon as FLUSH_SIZE_THRESHOLD records are announced,
+# otherwise at most FLUSH_MAX_LATENCY_MS after the first unflushed one.
+FLUSH_SIZE_THRESHOLD = 500
+FLUSH_MAX_LATENCY_MS = 20
+# Safety net for lost notifications (or writers that don't send them)
+POLL_INTERVAL_SECONDS = 1.0
+RETRY_INTERVAL_SECONDS = 5.0
+
+COLUMN_TYPES = {'step': int, 'amount': float, 'fraud': int}
+
+FLUSH_RECORDS_BUCKETS = [1, 10, 100, 500, 1000, 5000, 10000]
+
+reader = None
+database = DatabaseConnection()
+
+# Published with the worker's status, and exported by the API on /metrics. The retrain
+# scheduler reads the row counters (fraud_rows and amount_sum describe the inserted rows)
+# instead of counting the table; they restart from zero with the worker, which
+# `started_at` tells it.
+flush_records = Histogram(FLUSH_RECORDS_BUCKETS)
+flush_ms = Histogram(STAGE_MS_BUCKETS)
+totals = {"flushes": 0, "failed_flushes": 0, "rows_inserted": 0, "dead_letters": 0, "fraud_rows": 0, "amount_sum": 0.0}
+STARTED_AT = time.time()
+FRAUD_INDEX = FRAUD_DATA_COLUMNS.index('fraud')
+AMOUNT_INDEX = FRAUD_DATA_COLUMNS.index('amount')
+
+def parse_records(payloads):
+    """Turns queue payloads into insert rows. Returns (rows, [(payload, reason)] for malformed ones).
 
-    # Read all lines and then clear the file to avoid re-processing
-    with open(TRANSACTION_QUEUE_FILE, 'r+') as f:
-        lines = f.readlines()
-        f.seek(0)
-        f.truncate()
+    A binary payload is decoded a column at a time into a whole batch of rows; JSON lines
+    (FRAUD_QUEUE_RECORD_FORMAT=json) are parsed one by one.
+    """
+    rows, malformed = [], []
+    for payload in payloads:
+        try:
+            if is_binary(payload):
+                columns = decode_frame(payload)
+                rows.extend(zip(*(columns[column] for column in FRAUD_DATA_COLUMNS)))
+                continue
+            data = json.loads(payload)
+            rows.append(tuple(COLUMN_TYPES.get(column, str)(data[column]) for column in FRAUD_DATA_COLUMNS))
+        except Exception as e:
+            malformed.append((payload, f"{type(e).__name__}: {e}"))
+    return rows, malformed
 
-    if not lines:
+def write_dead_letters(rejected):
+    """Appends records that can never be inserted, with the reason, for later inspection."""
+    if not rejected:
         return
+    with open(DEAD_LETTER_FILE, 'a') as f:
+        for line, reason in rejected:
+            if isinstance(line, bytes):
+                line = payload_text(line)
+            f.write(json.dumps({"record": line, "reason": reason}) + '\n')
+    print(f"[Worker] Moved {len(rejected)} record(s) to '{DEAD_LETTER_FILE}'.")
 
-    print(f"[Worker] Found {len(lines)} new transaction(s). Attempting to process...")
-    
-    conn = None
+def insert_rows(conn, rows, chunk_size=INSERT_CHUNK_SIZE):
+    """Bulk-inserts rows with one executemany per chunk. Returns the rows the database rejected."""
+    cursor = enable_fast_executemany(conn.cursor())
     try:
-        print("[Worker] Attempting to connect to database...")
-        conn = pyodbc.connect(CONN_STR)
-        cursor = conn.cursor()
-        print("[Worker] Database connection successful.")
-        
-        success_count = 0
-        for line in lines:
-            try:
-                data = json.loads(line)
-                sql = "INSERT INTO fraud_data (customer, step, age, gender, zipcodeOri, merchant, zipMerchant, category, amount, fraud) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
-                values = (data['customer'], data['step'], data['age'], data['gender'], data['zipcodeOri'], data['merchant'], data['zipMerchant'], data['category'], data['amount'], data['fraud'])
-                cursor.execute(sql, values)
-                success_count += 1
-            except Exception as e:
-                print(f"[Worker] ERROR inserting line: {line.strip()}. Reason: {e}")
+        for start in range(0, len(rows), chunk_size):
+            cursor.executemany(INSERT_SQL, rows[start:start + chunk_size])
+        return []
+    except ROW_ERRORS:
+        # A bad row fails its whole chunk, possibly after part of it was applied: undo the
+        # flush and insert it row by row (the rare slow path) to isolate the culprit(s).
+        conn.rollback()
 
-        conn.commit()
-        print(f"[Worker] Successfully inserted {success_count}/{len(lines)} transactions.")
+    rejected = []
+    for row in rows:
+        try:
+            cursor.execute(INSERT_SQL, row)
+        except ROW_ERRORS as e:
+            rejected.append((json.dumps(dict(zip(FRAUD_DATA_COLUMNS, row))), f"{type(e).__name__}: {e}"))
+    return rejected
+
+def process_queue():
+    """Flushes the next batch of queued transactions into the database.
+
+    Returns a small report of the flush (with "failed" set if the database could not
+    be written), or None if the queue was empty.
+    """
+    global reader
+    if reader is None:
+        reader = SegmentLogReader(TRANSACTION_QUEUE_DIR, record_count=record_count)
 
-    except pyodbc.Error as ex:
+    # Stream everything appended since the last committed position
+    payloads = reader.read(max_records=MAX_RECORDS_PER_FLUSH)
+    if not payloads:
+        return None
+
+    started = time.perf_counter()
+    records = sum(record_count(payload) for payload in payloads)
+    rows, malformed = parse_records(payloads)
+    try:
+        conn = database.get()
+        rejected = insert_rows(conn, rows)
+        conn.commit()
+    except DATABASE_ERRORS as ex:
         print(f"[Worker] FATAL DATABASE ERROR: {ex}")
-        # If connection fails, write the lines back to the file so we don't lose them
-        with open(TRANSACTION_QUEUE_FILE, 'a') as f:
-            f.writelines(lines)
-        print("[Worker] Transactions returned to queue file for next attempt.")
+        # The queue position was not committed, so the same transactions are read again
+        database.reset()
+        reader.rewind()
+        totals["failed_flushes"] += 1
+        print("[Worker] Transactions left in the queue for next attempt; will reconnect.")
+        return {"records": records, "rows": 0, "failed": True}
+
+    write_dead_letters(malformed + rejected)
+    # Only now is it safe to move the queue position past these transactions
+    reader.commit()
+
+    elapsed = time.perf_counter() - started
+    inserted = len(rows) - len(rejected)
+    report = {
+        "records": records,
+        "rows": inserted,
+        "failed": False,
+        "dead_letters": len(malformed) + len(rejected),
+        "seconds": elapsed,
+        "rows_per_sec": inserted / elapsed if elapsed > 0 else float('inf'),
+    }
+    flush_records.observe(records)
+    flush_ms.observe(elapsed * 1000)
+    totals["flushes"] += 1
+    totals["rows_inserted"] += inserted
+    # Over the parsed rows: the rare ones the database rejected are included
+    totals["fraud_rows"] += sum(row[FRAUD_INDEX] for row in rows)
+    totals["amount_sum"] += sum(row[AMOUNT_INDEX] for row in rows)
+    totals["dead_letters"] += report["dead_letters"]
+    print(f"[Worker] Inserted {inserted}/{records} transactions in {elapsed * 1000:.1f} ms "
+          f"({report['rows_per_sec']:,.0f} rows/sec).")
+    return report
+
+def publish_status(last_report):
+    """Tells the API how far behind ingestion is (see queue_notify.QueueStatus)."""
+    write_status(TRANSACTION_QUEUE_DIR, {
+        "backlog_bytes": reader.backlog_bytes(),
+        "last_flush_rows": last_report["rows"] if last_report else 0,
+        "last_flush_failed": bool(last_report and last_report["failed"]),
+        "last_flush_rows_per_sec": last_report.get("rows_per_sec", 0.0) if last_report else 0.0,
+        "flush_records": flush_records.snapshot(),
+        "flush_ms": flush_ms.snapshot(),
+        "started_at": STARTED_AT,
+        **totals,
+    })
+
+def drain_queue():
+    """Flushes until the queue is empty (or the database fails). Returns False on failure."""
+    report = None
+    try:
+        while True:
+            report = process_queue()
+            if report is None or report["failed"] or report["records"] < MAX_RECORDS_PER_FLUSH:
+                return not (report and report["failed"])
     finally:
-        if conn:
-            conn.close()
-            print("[Worker] Database connection closed.")
+        publish_status(report)
+
+def run_worker(notify_port=DEFAULT_NOTIFY_PORT):
+    """Sleeps until the API announces new records, then flushes on size or on latency."""
+    listener = QueueListener(port=notify_port)
+    max_latency = FLUSH_MAX_LATENCY_MS / 1000.0
+    announced, first_announced_at = 0, None
+    next_poll = time.monotonic()
+    try:
+        while True:
+            now = time.monotonic()
+            deadline = next_poll if first_announced_at is None else min(next_poll, first_announced_at + max_latency)
+            received = listener.wait(deadline - now)
+            now = time.monotonic()
+            if received:
+                announced += received
+                if first_announced_at is None:
+                    first_announced_at = now
+
+            size_reached = announced >= FLUSH_SIZE_THRESHOLD
+            latency_reached = first_announced_at is not None and now - first_announced_at >= max_latency
+            if not (size_reached or latency_reached or now >= next_poll):
+                continue
+
+            succeeded = drain_queue()
+            announced, first_announced_at = 0, None
+            if not succeeded:
+                # Don't let new notifications turn a database outage into a retry storm
+                time.sleep(RETRY_INTERVAL_SECONDS)
+                next_poll = time.monotonic()
+            else:
+                next_poll = time.monotonic() + POLL_INTERVAL_SECONDS
+    finally:
+        listener.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Moves queued transactions into the fraud_data table.")
+    parser.add_argument("--sqlite", metavar="PATH", help="write to a local SQLite stand-in instead of SQL Server")
+    parser.add_argument("--notify-port", type=int, default=DEFAULT_NOTIFY_PORT,
+                        help="UDP port on which the API announces new queue records")
+    args = parser.parse_args()
+    if args.sqlite:
+        database = DatabaseConnection(lambda: connect_sqlite(args.sqlite))
+
     print("--- Database Worker Started ---")
-    print("Watching for new transactions. Press Ctrl+C to stop.")
-    while True:
-        process_queue()
-        time.sleep(5) # Check every 5 seconds
+    print("Waiting for new transactions. Press Ctrl+C to stop.")
+    try:
+        run_worker(args.notify_port)
+    finally:
+        database.close()
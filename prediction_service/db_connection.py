@@ -0,0 +1,81 @@
+# db_connection.py
+#
+# Connection helpers shared by the database worker and the offline scripts: a
+# persistent, reconnecting connection holder, and a local SQLite stand-in with the
+# same fraud_data table so everything can be run and measured without SQL Server.
+
+import sqlite3
+
+try:
+    import pyodbc
+except ImportError:  # the SQLite stand-in does not need the ODBC driver
+    pyodbc = None
+
+# --- Configuration ---
+CONN_STR = r'DRIVER={ODBC Driver 17 for SQL Server};SERVER=localhost\SQLEXPRESS;DATABASE=FraudDetectionDB;Trusted_Connection=yes;'
+
+FRAUD_DATA_COLUMNS = ('customer', 'step', 'age', 'gender', 'zipcodeOri', 'merchant', 'zipMerchant', 'category', 'amount', 'fraud')
+INSERT_SQL = f"INSERT INTO fraud_data ({', '.join(FRAUD_DATA_COLUMNS)}) VALUES ({', '.join('?' for _ in FRAUD_DATA_COLUMNS)})"
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fraud_data (
+    TransactionID INTEGER PRIMARY KEY AUTOINCREMENT,
+    customer TEXT, step INTEGER, age TEXT, gender TEXT, zipcodeOri TEXT,
+    merchant TEXT, zipMerchant TEXT, category TEXT, amount REAL, fraud INTEGER
+)
+"""
+
+
+class DriverUnavailable(Exception):
+    """Raised when the database driver is not installed, so no connection can be made."""
+
+
+# Errors that mean "the database (or the connection to it) failed" ...
+DATABASE_ERRORS = (sqlite3.Error, DriverUnavailable) + ((pyodbc.Error,) if pyodbc else ())
+# ... and the subset that means "this particular row was rejected".
+ROW_ERRORS = (sqlite3.DataError, sqlite3.IntegrityError) + ((pyodbc.DataError, pyodbc.IntegrityError) if pyodbc else ())
+
+
+def connect_sql_server():
+    if pyodbc is None:
+        raise DriverUnavailable("pyodbc is not installed; use the SQLite stand-in or install pyodbc.")
+    return pyodbc.connect(CONN_STR)
+
+
+def connect_sqlite(path):
+    conn = sqlite3.connect(path)
+    conn.execute(SQLITE_SCHEMA)
+    conn.commit()
+    return conn
+
+
+def enable_fast_executemany(cursor):
+    """Lets pyodbc send a whole executemany() as one parameter array instead of row by row."""
+    if hasattr(cursor, 'fast_executemany'):
+        cursor.fast_executemany = True
+    return cursor
+
+
+class DatabaseConnection:
+    """Keeps one connection open across flushes and reconnects after a failure."""
+
+    def __init__(self, connect=connect_sql_server):
+        self.connect = connect
+        self.conn = None
+
+    def get(self):
+        if self.conn is None:
+            self.conn = self.connect()
+        return self.conn
+
+    def reset(self):
+        """Drops a connection that failed; the next get() opens a fresh one."""
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+        self.conn = None
+
+    def close(self):
+        self.reset()
@@ -0,0 +1,137 @@
+# feature_encoder.py
+#
+# A small, pandas-free replacement for the pd.Categorical + pd.get_dummies + reindex
+# steps. The column layout is resolved once (from the model's feature_names_in_ when
+# serving, or from the category lists when training), so encoding a transaction is
+# just a handful of writes into a NumPy row at fixed offsets.
+#
+# Extra numeric features that are not part of the transaction itself (the sliding-window
+# velocity features) are passed in as a ready-made matrix and copied into their columns.
+
+import threading
+import numpy as np
+from prediction_service.velocity import VELOCITY_FEATURES, VELOCITY_FEATURES_ENABLED
+
+# --- Feature Layout ---
+NUMERIC_FEATURES = ['step', 'amount']
+AGE_CATEGORIES = ['0', '1', '2', '3', '4', '5', '6', 'U']
+GENDER_CATEGORIES = ['E', 'F', 'M', 'U']
+CATEGORICAL_FEATURES = {'age': AGE_CATEGORIES, 'gender': GENDER_CATEGORIES}
+
+
+def _normalise(value):
+    """The raw dataset quotes categorical values ("'1'"), the API does not ('1')."""
+    return str(value).strip("'")
+
+
+class FeatureEncoder:
+    """Writes transactions straight into NumPy rows using precomputed column offsets.
+
+    Unknown or dropped (drop_first) category values leave every dummy column of that
+    feature at 0, exactly like the pandas path does. Columns named in `extra` are
+    filled from the `extra` matrix given to the encode_* calls, or left at 0 without one.
+    """
+
+    def __init__(self, feature_names, categories=CATEGORICAL_FEATURES, extra=VELOCITY_FEATURES):
+        self.feature_names = [str(name) for name in feature_names]
+        self.width = len(self.feature_names)
+        self.numeric = []      # [(feature name, column offset)]
+        self.one_hot = {}      # {feature name: {category value: column offset}}
+        self.extra = []        # [(column of the extra matrix, column offset)]
+
+        extra_columns = {name: index for index, name in enumerate(extra)}
+        for offset, name in enumerate(self.feature_names):
+            if name in extra_columns:
+                self.extra.append((extra_columns[name], offset))
+                continue
+            for column, values in categories.items():
+                prefix = f"{column}_"
+                if name.startswith(prefix) and _normalise(name[len(prefix):]) in values:
+                    self.one_hot.setdefault(column, {})[_normalise(name[len(prefix):])] = offset
+                    break
+            else:
+                self.numeric.append((name, offset))
+
+        self._local = threading.local()
+
+    @classmethod
+    def for_training(cls, numeric=NUMERIC_FEATURES, categories=CATEGORICAL_FEATURES, extra=None):
+        """Builds the training layout: numeric columns, the extra (by default velocity)
+        columns, then one-hot columns with drop_first."""
+        if extra is None:
+            extra = VELOCITY_FEATURES if VELOCITY_FEATURES_ENABLED else []
+        feature_names = list(numeric) + list(extra)
+        for column, values in categories.items():
+            feature_names += [f"{column}_{value}" for value in values[1:]]
+        return cls(feature_names, categories, extra)
+
+    @property
+    def extra_offsets(self):
+        """(columns of the extra matrix, their column offsets) as index arrays."""
+        return [index for index, _ in self.extra], [offset for _, offset in self.extra]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def encode_into(self, record, row, extra=None):
+        """Encodes one transaction dict (and its row of extra features) into a preallocated 1-D row of length `width`."""
+        row.fill(0.0)
+        for name, offset in self.numeric:
+            row[offset] = record[name]
+        for column, lookup in self.one_hot.items():
+            offset = lookup.get(_normalise(record[column]))
+            if offset is not None:
+                row[offset] = 1.0
+        if extra is not None:
+            for index, offset in self.extra:
+                row[offset] = extra[index]
+        return row
+
+    def encode_one(self, record, extra=None):
+        """Encodes one transaction into a (1, width) matrix.
+
+        The matrix is a per-thread buffer that is reused by the next call on the same
+        thread, so it must be consumed (scored) before encoding another transaction.
+        """
+        row = getattr(self._local, 'row', None)
+        if row is None:
+            row = self._local.row = np.zeros((1, self.width))
+        self.encode_into(record, row[0], None if extra is None else extra[0])
+        return row
+
+    def encode_many(self, records, extra=None):
+        """Encodes a list of transaction dicts (and their (n, k) extra features) into an (n, width) matrix in one pass per column."""
+        features = np.zeros((len(records), self.width))
+        for name, offset in self.numeric:
+            features[:, offset] = [record[name] for record in records]
+        for column, lookup in self.one_hot.items():
+            offsets = np.fromiter((lookup.get(_normalise(record[column]), -1) for record in records),
+                                  dtype=np.int64, count=len(records))
+            rows = np.flatnonzero(offsets >= 0)
+            features[rows, offsets[rows]] = 1.0
+        if extra is not None and self.extra:
+            indices, offsets = self.extra_offsets
+            features[:, offsets] = extra[:, indices]
+        return features
+
+    def encode_frame(self, df):
+        """Encodes a DataFrame (e.g. a training sample) into an (n, width) matrix.
+
+        Extra columns are read from the DataFrame's columns of the same name.
+        """
+        features = np.zeros((len(df), self.width))
+        for name, offset in self.numeric:
+            features[:, offset] = df[name].to_numpy(dtype=np.float64)
+        for _, offset in self.extra:
+            features[:, offset] = df[self.feature_names[offset]].to_numpy(dtype=np.float64)
+        for column, lookup in self.one_hot.items():
+            offsets = df[column].astype(str).str.strip("'").map(lookup).fillna(-1).to_numpy(dtype=np.int64)
+            rows = np.flatnonzero(offsets >= 0)
+            features[rows, offsets[rows]] = 1.0
+        return features
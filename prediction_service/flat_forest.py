@@ -0,0 +1,205 @@
+# flat_forest.py
+#
+# Compiles a trained RandomForestClassifier into a handful of contiguous NumPy arrays
+# and scores it without sklearn: every (row, tree) pair walks down one level per step
+# of a vectorized loop. Results match model.predict_proba.
+#
+# The arrays are saved as a directory of plain .npy files and loaded with
+# mmap_mode='r': loading takes milliseconds, and every API worker process maps the
+# same page-cached copy of the trees instead of deserializing its own.
+#
+# How to export an existing model (from the project root):
+#     python prediction_service/flat_forest.py fraud_detection_model.joblib
+
+import json
+import os
+import shutil
+import sys
+import numpy as np
+
+# --- Configuration ---
+COMPACT_MODEL_FILENAME = "fraud_detection_model.forest"  # a directory
+METADATA_FILENAME = "forest.json"
+NODE_ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'is_leaf')
+SCORING_CHUNK_ROWS = 1024  # bounds the (rows x trees) working set of one traversal
+
+
+class FlatForest:
+    """A random forest packed into flat node arrays.
+
+    All trees share one node table; `roots[t]` is the first node of tree t. Leaves point
+    to themselves and hold an infinite threshold, so a traversal step can never move a
+    (row, tree) pair off its leaf.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, feature_names, is_leaf=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_estimators = len(roots)
+        self.n_features_in_ = len(self.feature_names_in_)
+        self.is_leaf = self.left == np.arange(len(self.left)) if is_leaf is None else is_leaf
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Packs every tree of a fitted RandomForestClassifier into the flat layout."""
+        if getattr(model, "n_outputs_", 1) != 1:
+            raise ValueError("Only single-output forests can be compiled.")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset))
+            rights.append(np.where(is_leaf, node_ids, tree.children_right + offset))
+
+            # Same per-tree normalisation as DecisionTreeClassifier.predict_proba
+            value = tree.value[:, 0, :].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(value / normalizer)
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            left=np.concatenate(lefts).astype(np.int32),
+            right=np.concatenate(rights).astype(np.int32),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            max_depth=max(estimator.tree_.max_depth for estimator in model.estimators_),
+            classes=model.classes_,
+            feature_names=model.feature_names_in_,
+        )
+
+    def quantized(self, value_dtype=np.float32):
+        """A smaller copy of the forest.
+
+        Thresholds become float32, rounded down, so float32 inputs take exactly the same
+        branches (x <= t64 holds iff x <= the largest float32 not above t64). Class
+        probabilities are stored as `value_dtype`, and feature indices use the narrowest
+        integer type.
+        """
+        threshold = self.threshold.astype(np.float32)
+        above = threshold > self.threshold
+        threshold[above] = np.nextafter(threshold[above], np.float32(-np.inf))
+        feature = self.feature.astype(np.min_scalar_type(max(self.n_features_in_ - 1, 0)))
+        return FlatForest(feature, threshold, self.left, self.right, self.value.astype(value_dtype), self.roots,
+                          self.max_depth, self.classes_, self.feature_names_in_, is_leaf=self.is_leaf)
+
+    def save(self, directory):
+        """Writes one .npy file per node array plus a small JSON file, replacing `directory`.
+
+        The new files are complete before they replace the old ones, but the swap is two
+        renames and `directory` is briefly missing in between, so it is not atomic for a
+        concurrent load(). Registry versions are written into a fresh directory before
+        they are published, so the API never loads one of those mid-swap.
+        """
+        building = directory.rstrip(os.sep) + '.building'
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+        for name in NODE_ARRAYS:
+            np.save(os.path.join(building, f"{name}.npy"), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(building, METADATA_FILENAME), 'w') as f:
+            json.dump({"max_depth": self.max_depth, "classes": self.classes_.tolist(),
+                       "feature_names": self.feature_names_in_.astype(str).tolist()}, f)
+
+        previous = directory.rstrip(os.sep) + '.previous'
+        shutil.rmtree(previous, ignore_errors=True)
+        if os.path.exists(directory):
+            os.replace(directory, previous)
+        os.replace(building, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Maps a saved forest (nothing is copied or read until scoring touches it).
+
+        A single .npz file written by earlier versions is still accepted, but is read into memory.
+        """
+        if not os.path.isdir(path):
+            with np.load(path) as data:
+                return cls(data['feature'], data['threshold'], data['left'], data['right'], data['value'],
+                           data['roots'], data['max_depth'], data['classes'], data['feature_names'])
+        with open(os.path.join(path, METADATA_FILENAME), 'r') as f:
+            metadata = json.load(f)
+        # np.asarray drops the memmap subclass (cheaper indexing) but keeps the mapping
+        arrays = {name: np.asarray(np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode))
+                  for name in NODE_ARRAYS}
+        return cls(arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'], arrays['value'],
+                   arrays['roots'], metadata['max_depth'], metadata['classes'], metadata['feature_names'],
+                   is_leaf=arrays['is_leaf'])
+
+    def _predict_chunk(self, X):
+        n_rows, n_features = X.shape
+        n_trees = self.n_estimators
+
+        # One traversal slot per (row, tree) pair, flattened row-major.
+        nodes = np.tile(self.roots, n_rows)
+        row_base = np.repeat(np.arange(n_rows, dtype=np.int64) * n_features, n_trees)
+        flat_X = X.ravel()
+
+        # Only the slots that have not reached a leaf yet are advanced each step.
+        active = np.flatnonzero(~self.is_leaf.take(nodes))
+        while len(active):
+            current = nodes[active]
+            go_left = flat_X.take(row_base.take(active) + self.feature.take(current)) <= self.threshold.take(current)
+            following = np.where(go_left, self.left.take(current), self.right.take(current))
+            nodes[active] = following
+            active = active[~self.is_leaf.take(following)]
+
+        # (trees, rows, classes) summed over trees one tree at a time, like sklearn
+        proba = self.value.take(nodes.reshape(n_rows, n_trees).T, axis=0).sum(axis=0, dtype=np.float64)
+        proba /= n_trees
+        return proba
+
+    def predict_proba(self, X):
+        # sklearn's trees compare float32 feature values against float64 thresholds
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[np.newaxis, :]
+        if len(X) <= SCORING_CHUNK_ROWS:
+            return self._predict_chunk(X)
+        return np.concatenate([self._predict_chunk(X[start:start + SCORING_CHUNK_ROWS])
+                               for start in range(0, len(X), SCORING_CHUNK_ROWS)])
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
+
+
+def artifact_bytes(path):
+    """Size on disk of a saved forest (directory or legacy .npz)."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+
+def export_flat_forest(model, filename=COMPACT_MODEL_FILENAME):
+    """Compiles a fitted forest and writes it next to the pickled model."""
+    forest = FlatForest.from_sklearn(model)
+    forest.save(filename)
+    return forest
+
+
+if __name__ == "__main__":
+    import joblib
+
+    source = sys.argv[1] if len(sys.argv) > 1 else "fraud_detection_model.joblib"
+    target = sys.argv[2] if len(sys.argv) > 2 else COMPACT_MODEL_FILENAME
+    print(f"🔄 Compiling '{source}' into the flat forest format...")
+    forest = export_flat_forest(joblib.load(source), target)
+    print(f"✅ Wrote '{target}': {forest.n_estimators} trees, {len(forest.feature)} nodes, "
+          f"max depth {forest.max_depth}, {artifact_bytes(target) / 1e6:.1f} MB.")
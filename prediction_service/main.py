@@ -1,83 +1,657 @@
-# main.py (Final Corrected Version with Categorical Types)
+# main.py
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Depends, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import PlainTextResponse, JSONResponse
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import contextvars
+import hmac
 import joblib
-import pandas as pd
-import json
+import math
+import numpy as np
 import os
+import time
+import warnings
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.velocity import VelocityFeatures, VELOCITY_FEATURES_ENABLED, VELOCITY_WINDOW_STEPS, WARM_UP_QUERY
+from prediction_service.micro_batcher import MicroBatcher, BatcherOverloaded, BatcherStopped
+from prediction_service.flat_forest import FlatForest, COMPACT_MODEL_FILENAME
+from prediction_service.segment_log import SegmentLogWriter
+from prediction_service.record_codec import encode_records, RECORD_FORMAT, RECORD_FORMATS
+from prediction_service.queue_notify import QueueNotifier, QueueStatus, DEFAULT_NOTIFY_PORT
+from prediction_service.model_registry import (
+    ModelWatcher, current_version, candidate_version, promote_candidate, discard_candidate, version_path,
+    MODEL_REGISTRY_DIR, CANDIDATE_FILENAME,
+)
+from prediction_service.shadow import ShadowScorer
+from prediction_service.prediction_cache import PredictionCache
+from prediction_service.queue_buffer import QueueBuffer
+from prediction_service.metrics import MetricsRegistry
+from prediction_service.profiling import SamplingProfiler, ProfileStore
+
+# The encoder hands the model plain NumPy arrays already laid out in
+# feature_names_in_ order, so sklearn's feature-name check has nothing to add.
+warnings.filterwarnings("ignore", message="X does not have valid feature names")
 
 # --- Pydantic Model ---
 class Transaction(BaseModel):
     customer: str; step: int; age: str; gender: str; zipcodeOri: str
-    merchant: str; zipMerchant: str; category: str; amount: float
+    merchant: str; zipMerchant: str; category: str
+    # NaN / Infinity would poison the shared velocity sums of the customer and merchant
+    amount: float = Field(allow_inf_nan=False)
 
 app = FastAPI(title="Fraud Detection API")
 
+@app.exception_handler(RequestValidationError)
+async def validation_error(request, exc):
+    """The default 422 echoes the rejected input, which can't be written as JSON when it is NaN or Infinity."""
+    errors = []
+    for error in exc.errors():
+        value = error.get("input")
+        if isinstance(value, float) and not math.isfinite(value):
+            error = dict(error, input=str(value))
+        errors.append(error)
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
 # --- Configuration ---
 MODEL_FILENAME = "fraud_detection_model.joblib"
-# We no longer need EXPECTED_COLUMNS, but we'll keep it for reference
-EXPECTED_COLUMNS = ['step', 'amount', "age_'1'", "age_'2'", "age_'3'", "age_'4'", "age_'5'", "age_'6'", "age_'U'", "gender_'F'", "gender_'M'", "gender_'U'"]
-TRANSACTION_QUEUE_FILE = "transactions_queue.log"
+# "auto" serves the compiled flat forest when it exists, else the pickled estimator
+MODEL_FORMAT = os.environ.get("FRAUD_MODEL_FORMAT", "auto")  # auto | compact | joblib
+# Versions published by the training pipeline are picked up without a restart
+MODEL_WATCH_INTERVAL_SECONDS = float(os.environ.get("FRAUD_MODEL_WATCH_INTERVAL_SECONDS", "2.0"))
+TRANSACTION_QUEUE_DIR = "transactions_queue"
+QUEUE_FSYNC_INTERVAL_MS = float(os.environ.get("FRAUD_QUEUE_FSYNC_INTERVAL_MS", "50"))
+WORKER_NOTIFY_PORT = int(os.environ.get("FRAUD_WORKER_NOTIFY_PORT", str(DEFAULT_NOTIFY_PORT)))
+# Backlog (unconsumed queue bytes) above which the worker is reported as falling behind;
+# with FRAUD_QUEUE_SHED_WHEN_BEHIND=1, /predict then answers 503 until it catches up.
+QUEUE_MAX_BACKLOG_BYTES = int(os.environ.get("FRAUD_QUEUE_MAX_BACKLOG_BYTES", str(256 * 1024 * 1024)))
+QUEUE_SHED_WHEN_BEHIND = os.environ.get("FRAUD_QUEUE_SHED_WHEN_BEHIND", "0") == "1"
+# Scored records wait in memory for the background queue writer; beyond this many the API sheds load
+QUEUE_MAX_BUFFERED_RECORDS = int(os.environ.get("FRAUD_QUEUE_MAX_BUFFERED_RECORDS", "100000"))
+# Answers go out before their records are written (queue_buffer.py), so a crash loses the
+# buffered ones. With 1, /predict/batch only answers once its records are in the queue.
+QUEUE_WRITE_BEFORE_REPLY = os.environ.get("FRAUD_QUEUE_WRITE_BEFORE_REPLY", "0") == "1"
+
+# Encoding and scoring run on this dedicated pool, never on the event loop or FastAPI's shared threadpool
+SCORING_THREADS = int(os.environ.get("FRAUD_SCORING_THREADS", str(min(4, os.cpu_count() or 1))))
+
+# Micro-batching of concurrent /predict calls
+BATCH_MAX_SIZE = int(os.environ.get("FRAUD_BATCH_MAX_SIZE", "64"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("FRAUD_BATCH_MAX_WAIT_MS", "2.0"))
+BATCH_MAX_QUEUE_DEPTH = int(os.environ.get("FRAUD_BATCH_MAX_QUEUE_DEPTH", "1024"))
+
+# Results of recently scored feature vectors (0 entries disables the cache)
+PREDICTION_CACHE_SIZE = int(os.environ.get("FRAUD_PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_TTL_SECONDS = float(os.environ.get("FRAUD_PREDICTION_CACHE_TTL_SECONDS", "300"))
+
+# Per-customer and per-merchant sliding-window features (velocity.py). The state lives in
+# this process, so serve.py runs a single worker while they are enabled (several uvicorn
+# workers started by hand would each see only their share of the traffic). At start-up the
+# last window of fraud_data is replayed into it, so the first transactions don't see empty
+# windows; FRAUD_VELOCITY_WARM_UP=0 skips that.
+VELOCITY_WARM_UP = os.environ.get("FRAUD_VELOCITY_WARM_UP", "1") == "1"
+
+# Shadow scoring (shadow.py): a candidate model scores this fraction of the traffic in the
+# background. The candidate is FRAUD_SHADOW_MODEL (a registry version or a model file) if
+# set, else whatever the registry's CANDIDATE points to. A fraction of 0 disables it.
+SHADOW_MODEL = os.environ.get("FRAUD_SHADOW_MODEL", "")
+SHADOW_FRACTION = float(os.environ.get("FRAUD_SHADOW_FRACTION", "0.1"))
+SHADOW_MAX_QUEUED_ROWS = int(os.environ.get("FRAUD_SHADOW_MAX_QUEUED_ROWS", "4096"))
+# Every worker writes its shadow counters here, so the statistics cover all of them
+SHADOW_STATS_DIR = os.environ.get("FRAUD_SHADOW_STATS_DIR", "shadow_stats")
+# Promoting or withdrawing the candidate needs this value in an X-Admin-Token header;
+# unset, those endpoints are disabled (they share the public scoring port)
+ADMIN_TOKEN = os.environ.get("FRAUD_ADMIN_TOKEN", "")
+
+# Requests sent with "X-Profile: 1" are run under a sampling profiler (off by default)
+PROFILING_ENABLED = os.environ.get("FRAUD_PROFILING_ENABLED", "0") == "1"
+PROFILE_HEADER = b"x-profile"
+
+# The model and the encoder built from it are swapped together as one object, and every
+# request scores with the `active` it read when it started, so a reload never mixes versions.
+active = None
+model_watcher = None
+candidate_watcher = None
+queue_writer = SegmentLogWriter(TRANSACTION_QUEUE_DIR, fsync_interval_ms=QUEUE_FSYNC_INTERVAL_MS)
+queue_notifier = QueueNotifier(port=WORKER_NOTIFY_PORT)
+queue_status = QueueStatus(TRANSACTION_QUEUE_DIR)
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SECONDS)
+scoring_executor = ThreadPoolExecutor(max_workers=SCORING_THREADS, thread_name_prefix="scoring")
+velocity = VelocityFeatures() if VELOCITY_FEATURES_ENABLED else None
+
+# --- Metrics (exported on GET /metrics) ---
+metrics = MetricsRegistry()
+STAGE_HELP = "Time spent in each stage of serving a prediction, in milliseconds (encoding, model and queue stages are per batch)."
+stage_ms = {stage: metrics.histogram("fraud_api_stage_milliseconds", STAGE_HELP, stage=stage)
+            for stage in ("parse_validate", "velocity", "encode", "cache_lookup", "model", "queue_handoff")}
+request_ms = {path: metrics.histogram("fraud_api_request_milliseconds", "End-to-end request latency in milliseconds.", path=path)
+              for path in ("/predict", "/predict/batch")}
+request_started = contextvars.ContextVar("request_started", default=None)
+profile_store = ProfileStore()
+
+class LoadedModel:
+    """A model ready to serve, with the encoder for its column layout and its load timings."""
 
-model = None
+    def __init__(self, model, version, filename, load_ms, warmup_ms):
+        self.model = model
+        # Resolve the column layout once, so requests never touch pandas.
+        self.encoder = FeatureEncoder(model.feature_names_in_)
+        self.version = version
+        self.filename = filename
+        self.load_ms = load_ms
+        self.warmup_ms = warmup_ms
+        self.loaded_at = time.time()
+
+    def describe(self):
+        return {"version": self.version, "filename": self.filename, "loaded_at": self.loaded_at,
+                "load_ms": round(self.load_ms, 3), "warmup_ms": round(self.warmup_ms, 3)}
+
+# Scored once per freshly loaded model, so its first real request does not pay for cold caches
+WARMUP_TRANSACTION = {
+    'customer': 'C1093826151', 'step': 20, 'age': '3', 'gender': 'M', 'zipcodeOri': '28007',
+    'merchant': 'M348934600', 'zipMerchant': '28007', 'category': 'es_transportation', 'amount': 2500.0,
+}
+
+def model_file_to_load(version=None):
+    """The artifact to serve: from the given registry version, else the legacy files in the working directory."""
+    compact = version_path(MODEL_REGISTRY_DIR, version, COMPACT_MODEL_FILENAME) if version else COMPACT_MODEL_FILENAME
+    pickled = version_path(MODEL_REGISTRY_DIR, version, MODEL_FILENAME) if version else MODEL_FILENAME
+    if MODEL_FORMAT == "compact" or (MODEL_FORMAT == "auto" and os.path.exists(compact)):
+        return compact
+    return pickled
+
+def load_version(version=None, filename=None):
+    """Loads and warms up a model off the request path. Returns a LoadedModel.
+
+    `filename` loads a model file outside the registry instead (named by its path).
+    """
+    if filename is not None:
+        version = filename
+    filename = filename or model_file_to_load(version)
+    started = time.perf_counter()
+    if filename.endswith(COMPACT_MODEL_FILENAME):
+        loaded = FlatForest.load(filename)
+    else:
+        loaded = joblib.load(filename)
+    loaded_in = time.perf_counter()
+    candidate = LoadedModel(loaded, version or "unversioned", filename, (loaded_in - started) * 1000, 0.0)
+    if candidate.encoder.extra and velocity is None:
+        print(f"[API] WARNING: Model version {candidate.version} uses velocity features, but FRAUD_VELOCITY_FEATURES=0; they will all be 0.")
+    for size in (1, BATCH_MAX_SIZE):
+        # Warm-up transactions are not recorded in the velocity state
+        score(encode_transactions([WARMUP_TRANSACTION] * size, candidate, observe=False), candidate)
+    candidate.warmup_ms = (time.perf_counter() - loaded_in) * 1000
+    return candidate
+
+def swap_model(record):
+    """ModelWatcher callback: loads and warms up a new version, then makes it active."""
+    global active
+    print(f"[API] New model version {record['version']} published; loading it in the background...")
+    candidate = load_version(record["version"])
+    previous, active = active, candidate  # a single reference assignment: the swap itself
+    prediction_cache.clear()  # entries are keyed by version too, this just frees them early
+    if shadow.candidate is not None and shadow.candidate.version == candidate.version:
+        shadow.set_candidate(None)  # the candidate was promoted; there is nothing left to compare
+    print(f"[API] Now serving model version {candidate.version} (was {previous.version if previous else 'none'}; "
+          f"load {candidate.load_ms:.1f} ms, warm-up {candidate.warmup_ms:.1f} ms).")
 
 def load_model():
-    global model
-    if model is None:
+    global active
+    if active is None:
         print("[API] Model is not loaded. Attempting to load...")
-        if not os.path.exists(MODEL_FILENAME):
-            print(f"[API] FATAL ERROR: Model file '{MODEL_FILENAME}' not found!")
-            raise HTTPException(status_code=500, detail=f"Model file not found: {MODEL_FILENAME}")
+        record = current_version(MODEL_REGISTRY_DIR)
+        version = record["version"] if record else None
+        filename = model_file_to_load(version)
+        if not os.path.exists(filename):
+            print(f"[API] FATAL ERROR: Model file '{filename}' not found!")
+            raise HTTPException(status_code=500, detail=f"Model file not found: {filename}")
         try:
-            model = joblib.load(MODEL_FILENAME)
-            print("[API] Model loaded successfully.")
+            active = load_version(version)
+            print(f"[API] Model loaded successfully from '{filename}' "
+                  f"(load {active.load_ms:.1f} ms, warm-up {active.warmup_ms:.1f} ms).")
         except Exception as e:
             print(f"[API] FATAL ERROR: Could not load model. Reason: {e}")
             raise HTTPException(status_code=500, detail=f"Could not load model: {e}")
 
+def observe_velocity(records):
+    """Runs records through the velocity state (even when the active model does not use it,
+    so it is warm for a model that does). Returns their velocity features, or None when disabled."""
+    if velocity is None:
+        return None
+    started = time.perf_counter()
+    extra = velocity.observe_many(records)
+    stage_ms["velocity"].observe((time.perf_counter() - started) * 1000)
+    return extra
+
+def encode_features(records, loaded, extra=None):
+    """Encodes transaction dicts (and their velocity features) into one feature matrix aligned with the model."""
+    if len(records) == 1:
+        return loaded.encoder.encode_one(records[0], extra)
+    return loaded.encoder.encode_many(records, extra)
+
+def encode_transactions(records, loaded, observe=True):
+    """Encodes a list of transaction dicts into one feature matrix aligned with the model.
+
+    With `observe`, the records also go through the velocity state.
+    """
+    return encode_features(records, loaded, observe_velocity(records) if observe else None)
+
+def score(features, loaded):
+    """Scores an encoded feature matrix with one predict_proba call.
+
+    Returns the predicted labels (exactly what model.predict would return)
+    and the fraud probability of every row.
+    """
+    probabilities = loaded.model.predict_proba(features)
+    labels = loaded.model.classes_.take(np.argmax(probabilities, axis=1))
+    fraud_column = list(loaded.model.classes_).index(1)
+    return labels.astype(int), probabilities[:, fraud_column]
+
+def score_cached(features, loaded):
+    """score() through the prediction cache: only rows this model version has not
+    scored recently go through the forest, in one predict_proba call."""
+    if not prediction_cache.enabled:
+        started = time.perf_counter()
+        result = score(features, loaded)
+        stage_ms["model"].observe((time.perf_counter() - started) * 1000)
+        return result
+    started = time.perf_counter()
+    keys = PredictionCache.keys_for(loaded.version, features)
+    cached = prediction_cache.get_many(keys)
+    stage_ms["cache_lookup"].observe((time.perf_counter() - started) * 1000)
+    labels = np.empty(len(keys), dtype=int)
+    fraud_probabilities = np.empty(len(keys))
+    missing = [row for row, hit in enumerate(cached) if hit is None]
+    if missing:
+        started = time.perf_counter()
+        missing_labels, missing_probabilities = score(features[missing], loaded)
+        stage_ms["model"].observe((time.perf_counter() - started) * 1000)
+        labels[missing] = missing_labels
+        fraud_probabilities[missing] = missing_probabilities
+        prediction_cache.put_many([keys[row] for row in missing], missing_labels, missing_probabilities)
+    for row, hit in enumerate(cached):
+        if hit is not None:
+            labels[row], fraud_probabilities[row] = hit
+    return labels, fraud_probabilities
+
+def write_to_queue(records):
+    """Encodes scored records (FRAUD_QUEUE_RECORD_FORMAT) and appends them to this process's queue partition in a single write."""
+    queue_writer.append(encode_records(records))
+    # Wake the database worker up instead of letting it find the records on its next poll
+    queue_notifier.notify(len(records))
+
+queue_buffer = QueueBuffer(write_to_queue, QUEUE_MAX_BUFFERED_RECORDS)
+
+def append_to_queue(records):
+    """Hands scored transactions to the queue buffer; encoding and the write happen on the queue I/O thread."""
+    queue_buffer.append(records)
+
+def ingestion_is_behind():
+    return queue_status.backlog_bytes() > QUEUE_MAX_BACKLOG_BYTES
+
+def shed_if_ingestion_is_behind():
+    if queue_buffer.is_full():
+        print("[API] WARNING: Transaction queue writes are falling behind; shedding request.")
+        raise HTTPException(status_code=503, detail="Transaction queue is falling behind, retry later.")
+    if QUEUE_SHED_WHEN_BEHIND and ingestion_is_behind():
+        print("[API] WARNING: Database worker is falling behind; shedding request.")
+        raise HTTPException(status_code=503, detail="Transaction ingestion is falling behind, retry later.")
+
+def label_for(is_fraud):
+    return "Fraudulent" if is_fraud == 1 else "Benign"
+
+def score_and_queue_batch(records, queue=True):
+    """Scores records and queues them in one append (unless `queue` is False, when the
+    caller writes them itself). Returns (labels, fraud probabilities)."""
+    loaded = active
+    started = time.perf_counter()
+    extra = observe_velocity(records)
+    features = encode_features(records, loaded, extra)
+    stage_ms["encode"].observe((time.perf_counter() - started) * 1000)
+    labels, fraud_probabilities = score_cached(features, loaded)
+    started = time.perf_counter()
+    for record, is_fraud in zip(records, labels):
+        record['fraud'] = int(is_fraud)
+    if queue:
+        append_to_queue(records)
+    stage_ms["queue_handoff"].observe((time.perf_counter() - started) * 1000)
+    shadow.offer(records, extra, labels, fraud_probabilities, loaded)  # a sample, handed off without waiting
+    return labels, fraud_probabilities
+
+def score_and_queue(records):
+    """Scores a micro-batch of /predict records and queues them in one append."""
+    labels, _ = score_and_queue_batch(records)
+    return [int(is_fraud) for is_fraud in labels]
+
+batcher = MicroBatcher(score_and_queue, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS,
+                       max_queue_depth=BATCH_MAX_QUEUE_DEPTH, executor=scoring_executor,
+                       max_concurrent_batches=SCORING_THREADS)
+
+def shadow_score(records, extra, loaded):
+    """Scores a shadow sample with one model (on the shadow thread, never through the prediction cache)."""
+    return score(encode_features(records, loaded, extra), loaded)
+
+def serving_under_load():
+    """Shadow samples are dropped while requests queue up for a micro-batch or queue writes fall behind."""
+    return batcher.queue_depth() >= BATCH_MAX_SIZE or queue_buffer.is_full()
+
+shadow = ShadowScorer(shadow_score, SHADOW_FRACTION, SHADOW_MAX_QUEUED_ROWS, overloaded=serving_under_load,
+                      stats_dir=SHADOW_STATS_DIR)
+
+# Everything below is read from the components' own counters only when /metrics is scraped
+metrics.register_histogram("fraud_api_stage_milliseconds", STAGE_HELP, queue_buffer.flush_ms, stage="queue_write")
+metrics.register_histogram("fraud_api_batch_size", "Requests scored together per micro-batch.", batcher.batch_sizes)
+metrics.register_histogram("fraud_api_batch_wait_milliseconds", "Time a request waited for its micro-batch, in milliseconds.", batcher.wait_ms)
+metrics.gauge("fraud_api_batcher_queue_depth", "Requests waiting for a micro-batch.", batcher.queue_depth)
+metrics.counter("fraud_api_rejected_requests_total", "Requests rejected because the micro-batcher was full.", lambda: batcher.rejected)
+metrics.gauge("fraud_api_queue_buffered_records", "Scored records waiting to be written to the transaction queue.", queue_buffer.buffered)
+metrics.counter("fraud_api_queue_flushes_total", "Writes of buffered records to the transaction queue.", lambda: queue_buffer.flushes)
+metrics.counter("fraud_api_queue_flush_errors_total", "Failed writes to the transaction queue.", lambda: queue_buffer.flush_errors)
+for counter in ("hits", "misses", "expired", "evictions", "invalidations"):
+    metrics.counter(f"fraud_api_cache_{counter}_total", f"Prediction cache {counter}.", lambda counter=counter: getattr(prediction_cache, counter))
+metrics.gauge("fraud_api_cache_entries", "Entries in the prediction cache.", prediction_cache.__len__)
+if velocity is not None:
+    for table in ("customers", "merchants"):
+        metrics.gauge(f"fraud_api_velocity_{table}", f"Keys held in the velocity state for {table}.",
+                      lambda table=table: len(getattr(velocity, table).slots))
+        metrics.counter(f"fraud_api_velocity_{table}_evictions_total", f"Keys evicted from the velocity state for {table}.",
+                        lambda table=table: getattr(velocity, table).evictions)
+for counter, help_text in (("sampled", "Rows sampled for shadow scoring."), ("dropped_queue_full", "Shadow rows dropped because the shadow queue was full."),
+                           ("dropped_overloaded", "Shadow rows dropped because the API was under load."),
+                           ("compared", "Shadow rows whose candidate prediction was compared with the served one."),
+                           ("disagreements", "Shadow rows the candidate model labelled differently from the active one."),
+                           ("errors", "Shadow rounds that failed to score.")):
+    metrics.counter(f"fraud_api_shadow_{counter}_total", help_text, lambda counter=counter: getattr(shadow, counter))
+for model in ("active", "candidate"):
+    metrics.register_histogram("fraud_api_shadow_model_milliseconds", "CPU time to encode and score a round of shadow samples, per model (the active one on every tenth round), in milliseconds.",
+                               lambda model=model: shadow.latency_ms[model].snapshot(), model=model)
+metrics.gauge("fraud_api_model_load_milliseconds", "Load time of the active model, in milliseconds.", lambda: active.load_ms if active else None)
+metrics.gauge("fraud_worker_backlog_bytes", "Unconsumed transaction queue bytes, as last published by the database worker.", queue_status.backlog_bytes)
+metrics.gauge("fraud_worker_last_flush_rows_per_sec", "Insert rate of the worker's last flush.", lambda: queue_status.get().get("last_flush_rows_per_sec"))
+for counter, help_text in (("rows_inserted", "Rows inserted into fraud_data."), ("flushes", "Successful flushes."),
+                           ("failed_flushes", "Flushes that failed on a database error."), ("dead_letters", "Records written to the dead-letter log."),
+                           ("fraud_rows", "Inserted rows that were scored as fraud.")):
+    metrics.counter(f"fraud_worker_{counter}_total", help_text, lambda counter=counter: queue_status.get().get(counter))
+metrics.register_histogram("fraud_worker_flush_records", "Records per worker flush.", lambda: queue_status.get().get("flush_records"))
+metrics.register_histogram("fraud_worker_flush_milliseconds", "Duration of a worker flush, in milliseconds.", lambda: queue_status.get().get("flush_ms"))
+
+def observe_parse_validate():
+    """Time from the request arriving to the handler running: body read, routing and pydantic validation."""
+    started = request_started.get()
+    if started is not None:
+        stage_ms["parse_validate"].observe((time.perf_counter() - started) * 1000)
+
+class RequestInstrumentation:
+    """ASGI middleware: times the prediction endpoints and profiles requests that ask for it."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        histogram = request_ms.get(scope.get("path")) if scope["type"] == "http" else None
+        if histogram is None:
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        request_started.set(started)
+        if not (PROFILING_ENABLED and (PROFILE_HEADER, b"1") in scope["headers"]):
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                histogram.observe((time.perf_counter() - started) * 1000)
+
+        profile_id = profile_store.new_id()
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+        profiler = SamplingProfiler().start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            histogram.observe(elapsed_ms)
+            profile_store.put(profile_id, profiler, elapsed_ms)
+
+app.add_middleware(RequestInstrumentation)
+
 @app.on_event("startup")
 def startup_event():
     print("[API] Server is starting up...")
+    if RECORD_FORMAT not in RECORD_FORMATS:
+        raise ValueError(f"Unknown queue record format '{RECORD_FORMAT}'; choose one of {', '.join(RECORD_FORMATS)}.")
     load_model()
 
+@app.on_event("startup")
+def warm_up_velocity():
+    if velocity is None or not VELOCITY_WARM_UP:
+        return
+    import pandas as pd
+    from prediction_service.db_connection import connect_sql_server
+    print(f"[API] Replaying the last {VELOCITY_WINDOW_STEPS} steps of fraud_data into the velocity state...")
+    started = time.perf_counter()
+    conn = None
+    rows = 0
+    try:
+        conn = connect_sql_server()
+        for chunk in pd.read_sql(WARM_UP_QUERY, conn, params=(VELOCITY_WINDOW_STEPS,), chunksize=50000):
+            velocity.add_to_frame(chunk)
+            rows += len(chunk)
+        print(f"[API] Velocity state warmed up with {rows} transactions in {time.perf_counter() - started:.1f}s.")
+    except Exception as e:
+        print(f"[API] WARNING: Could not warm up the velocity state ({e}); starting empty.")
+    finally:
+        if conn:
+            conn.close()
+
+@app.on_event("startup")
+def start_model_watcher():
+    global model_watcher
+    model_watcher = ModelWatcher(swap_model, MODEL_REGISTRY_DIR, MODEL_WATCH_INTERVAL_SECONDS)
+    model_watcher.start(active.version if active else None)
+
+def set_shadow_candidate(record):
+    """Candidate ModelWatcher callback: loads and warms up the registry's candidate, then shadows it."""
+    if SHADOW_FRACTION <= 0:
+        return
+    if active is not None and record["version"] == active.version:
+        shadow.set_candidate(None)
+        return
+    print(f"[API] Candidate model version {record['version']} published; loading it for shadow scoring...")
+    candidate = load_version(record["version"])
+    shadow.set_candidate(candidate)
+    print(f"[API] Shadow scoring {SHADOW_FRACTION:.0%} of the traffic with version {candidate.version} "
+          f"(load {candidate.load_ms:.1f} ms, warm-up {candidate.warmup_ms:.1f} ms).")
+
+def clear_shadow_candidate():
+    if shadow.candidate is not None:
+        print(f"[API] Candidate model version {shadow.candidate.version} withdrawn; shadow scoring stopped.")
+    shadow.set_candidate(None)
+
+@app.on_event("startup")
+def start_shadow_scoring():
+    global candidate_watcher
+    if SHADOW_FRACTION <= 0:
+        return
+    shadow.start()
+    if SHADOW_MODEL:
+        # A fixed candidate: a registry version, else a model file
+        try:
+            if os.path.isdir(version_path(MODEL_REGISTRY_DIR, SHADOW_MODEL, "")):
+                candidate = load_version(SHADOW_MODEL)
+            else:
+                candidate = load_version(filename=SHADOW_MODEL)
+            shadow.set_candidate(candidate)
+            print(f"[API] Shadow scoring {SHADOW_FRACTION:.0%} of the traffic with '{candidate.version}'.")
+        except Exception as e:
+            print(f"[API] WARNING: Could not load the shadow model '{SHADOW_MODEL}' ({e}); shadow scoring is off.")
+        return
+    candidate_watcher = ModelWatcher(set_shadow_candidate, MODEL_REGISTRY_DIR, MODEL_WATCH_INTERVAL_SECONDS,
+                                     pointer=CANDIDATE_FILENAME, on_removed=clear_shadow_candidate)
+    candidate_watcher.check()  # a candidate published before start-up is loaded right away
+    candidate_watcher.start(candidate_watcher.seen_version)
+
+@app.on_event("startup")
+async def start_batcher():
+    queue_buffer.start()
+    batcher.start()
+    print(f"[API] Micro-batcher started (max {BATCH_MAX_SIZE} requests or {BATCH_MAX_WAIT_MS} ms per batch).")
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+    await queue_buffer.stop()  # writes out whatever is still buffered before the queue is closed
+
+@app.on_event("shutdown")
+def stop_model_watcher():
+    if model_watcher is not None:
+        model_watcher.stop()
+    if candidate_watcher is not None:
+        candidate_watcher.stop()
+    shadow.stop()
+
+@app.on_event("shutdown")
+def close_queue():
+    queue_writer.close()
+
 @app.post("/predict")
-def predict(transaction: Transaction):
-    if not model:
+async def predict(transaction: Transaction):
+    if not active:
         print("[API] ERROR: Predict called but model is not available.")
         raise HTTPException(status_code=500, detail="Model is not available, check server logs.")
+    observe_parse_validate()
+    shed_if_ingestion_is_behind()
 
     try:
-        # --- Prediction Logic (THE FIX IS HERE) ---
-        transaction_dict = transaction.model_dump()
-        input_df = pd.DataFrame([transaction_dict])
-
-        # === THE FIX: Define all possible categories before encoding ===
-        # This ensures that all possible dummy columns are always created.
-        input_df['age'] = pd.Categorical(input_df['age'], categories=['0', '1', '2', '3', '4', '5', '6', 'U'])
-        input_df['gender'] = pd.Categorical(input_df['gender'], categories=['E', 'F', 'M', 'U'])
-        # ==============================================================
-
-        # Now, get_dummies will create all columns, filling missing ones with 0
-        final_df = pd.get_dummies(input_df, columns=['age', 'gender'], drop_first=True)
-        
-        # Align columns just in case, to be perfectly safe
-        final_df = final_df.reindex(columns=model.feature_names_in_, fill_value=0)
-
-        prediction_result = model.predict(final_df)
-        is_fraud = int(prediction_result[0])
-        
-        # --- Save to Queue File ---
-        transaction_to_log = transaction.model_dump()
-        transaction_to_log['fraud'] = is_fraud
-        
-        with open(TRANSACTION_QUEUE_FILE, 'a') as f:
-            f.write(json.dumps(transaction_to_log) + '\n')
-        
-        return {"prediction": "Fraudulent" if is_fraud == 1 else "Benign"}
+        # --- Prediction Logic: scored (and queued) together with concurrent requests ---
+        is_fraud = await batcher.submit(transaction.model_dump())
+        return {"prediction": label_for(is_fraud)}
 
+    except (BatcherOverloaded, BatcherStopped) as e:
+        print(f"[API] WARNING: {e}")
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         import traceback
         print(f"[API] ERROR during prediction: {e}")
         traceback.print_exc() # Print full error for debugging
         raise HTTPException(status_code=500, detail=f"An error occurred during prediction: {e}")
+
+@app.post("/predict/batch")
+async def predict_batch(transactions: List[Transaction]):
+    if not active:
+        print("[API] ERROR: Batch predict called but model is not available.")
+        raise HTTPException(status_code=500, detail="Model is not available, check server logs.")
+    if not transactions:
+        raise HTTPException(status_code=422, detail="The batch must contain at least one transaction.")
+    observe_parse_validate()
+    shed_if_ingestion_is_behind()
+
+    try:
+        started = time.perf_counter()
+
+        # --- Prediction Logic: one encoding pass and one model call for the whole batch, ---
+        # --- off the event loop; the queue append is buffered and written in the background ---
+        records = [transaction.model_dump() for transaction in transactions]
+        labels, fraud_probabilities = await asyncio.get_running_loop().run_in_executor(
+            scoring_executor, score_and_queue_batch, records, not QUEUE_WRITE_BEFORE_REPLY)
+        if QUEUE_WRITE_BEFORE_REPLY:
+            await queue_buffer.append_and_wait(records)
+
+        elapsed = time.perf_counter() - started
+        throughput = len(records) / elapsed if elapsed > 0 else float('inf')
+        print(f"[API] Scored batch of {len(records)} in {elapsed * 1000:.2f} ms ({throughput:.0f} tx/s).")
+
+        return {
+            "predictions": [
+                {"prediction": label_for(int(is_fraud)), "fraud_probability": float(probability)}
+                for is_fraud, probability in zip(labels, fraud_probabilities)
+            ],
+            "batch_size": len(records),
+            "latency_ms": round(elapsed * 1000, 3),
+            "throughput_tps": round(throughput, 1),
+        }
+
+    except Exception as e:
+        import traceback
+        print(f"[API] ERROR during batch prediction: {e}")
+        traceback.print_exc() # Print full error for debugging
+        raise HTTPException(status_code=500, detail=f"An error occurred during batch prediction: {e}")
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+def request_profile(profile_id: str):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile {profile_id} (only the most recent ones are kept).")
+    return PlainTextResponse(profile)
+
+@app.get("/stats/batcher")
+def batcher_stats():
+    return batcher.stats()
+
+@app.get("/stats/cache")
+def cache_stats():
+    return prediction_cache.stats()
+
+@app.get("/stats/velocity")
+def velocity_stats():
+    return velocity.stats() if velocity is not None else {"enabled": False}
+
+@app.get("/stats/queue")
+def queue_stats():
+    return {
+        "worker": queue_status.get(),
+        "buffer": queue_buffer.stats(),
+        "max_backlog_bytes": QUEUE_MAX_BACKLOG_BYTES,
+        "behind": ingestion_is_behind(),
+        "shedding": QUEUE_SHED_WHEN_BEHIND and ingestion_is_behind(),
+    }
+
+@app.get("/stats/shadow")
+def shadow_stats():
+    return shadow.stats()
+
+@app.get("/admin/model")
+def model_info():
+    return {
+        "active": active.describe() if active else None,
+        "published": current_version(MODEL_REGISTRY_DIR),
+        "candidate": candidate_version(MODEL_REGISTRY_DIR),
+        "watcher": {
+            "interval_seconds": MODEL_WATCH_INTERVAL_SECONDS,
+            "last_checked": model_watcher.last_checked if model_watcher else None,
+            "last_error": model_watcher.last_error if model_watcher else None,
+        },
+    }
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model administration is disabled; set FRAUD_ADMIN_TOKEN to enable it.")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Missing or wrong X-Admin-Token header.")
+
+@app.post("/admin/model/promote", dependencies=[Depends(require_admin_token)])
+def promote_model():
+    """Makes the registry's candidate the published version; every API process swaps to it within a watch interval."""
+    evidence = shadow.stats()
+    record = promote_candidate(MODEL_REGISTRY_DIR)
+    if record is None:
+        raise HTTPException(status_code=404, detail="There is no candidate model to promote.")
+    print(f"[API] Candidate model version {record['version']} promoted "
+          f"(disagreement rate {evidence['disagreement_rate']} over {evidence['compared_rows']} shadow rows).")
+    return {"promoted": record, "shadow": evidence}
+
+@app.delete("/admin/model/candidate", dependencies=[Depends(require_admin_token)])
+def withdraw_candidate():
+    record = candidate_version(MODEL_REGISTRY_DIR)
+    if record is None:
+        raise HTTPException(status_code=404, detail="There is no candidate model.")
+    discard_candidate(MODEL_REGISTRY_DIR)
+    return {"withdrawn": record, "shadow": shadow.stats()}
@@ -0,0 +1,136 @@
+# metrics.py
+#
+# Low-overhead instrumentation for the API and the database worker, and its Prometheus
+# text exposition (served by the API on GET /metrics).
+#
+# Recording is a perf_counter() difference and a Histogram.observe() (a bisect and a few
+# additions under an uncontended lock, well under a microsecond); everything else - gauges, counters kept by other
+# components, the worker's published histograms - is only read when /metrics is scraped.
+
+import bisect
+import math
+import threading
+
+# --- Configuration ---
+STAGE_MS_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 1000.0]
+
+
+class Histogram:
+    """Cumulative-bucket histogram (the layout Prometheus expects).
+
+    Observed from the event loop and the scoring threads at once, so updates and
+    snapshots hold a lock: a scrape never sees a count that disagrees with the buckets.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def snapshot(self):
+        with self.lock:
+            counts, total, count, largest = list(self.counts), self.sum, self.count, self.max
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + ['+Inf'], counts):
+            running += bucket_count
+            cumulative[str(bound)] = running
+        return {
+            "count": count,
+            "sum": round(total, 3),
+            "mean": round(total / count, 3) if count else 0.0,
+            "max": round(largest, 3),
+            "buckets": cumulative,
+        }
+
+
+def merge_snapshots(snapshots):
+    """One Histogram.snapshot() from several over the same buckets (e.g. from several processes)."""
+    count = sum(snapshot["count"] for snapshot in snapshots)
+    total = sum(snapshot["sum"] for snapshot in snapshots)
+    buckets = {}
+    for snapshot in snapshots:
+        for bound, running in snapshot["buckets"].items():
+            buckets[bound] = buckets.get(bound, 0) + running
+    return {
+        "count": count,
+        "sum": round(total, 3),
+        "mean": round(total / count, 3) if count else 0.0,
+        "max": max((snapshot["max"] for snapshot in snapshots), default=0.0),
+        "buckets": buckets,
+    }
+
+
+def _labels(labels, extra=None):
+    pairs = list(labels.items()) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+
+class MetricsRegistry:
+    """A set of metric families rendered together in the Prometheus text format.
+
+    Histograms are registered as objects (or as callables returning a Histogram.snapshot()),
+    gauges and counters as callables, so nothing is copied until a scrape.
+    """
+
+    def __init__(self):
+        self._families = {}  # name -> [type, help, [(labels, source)]]
+
+    def _add(self, kind, name, help_text, source, labels):
+        family = self._families.setdefault(name, [kind, help_text, []])
+        family[2].append((labels, source))
+
+    def histogram(self, name, help_text, buckets=STAGE_MS_BUCKETS, **labels):
+        histogram = Histogram(buckets)
+        self._add("histogram", name, help_text, histogram, labels)
+        return histogram
+
+    def register_histogram(self, name, help_text, source, **labels):
+        self._add("histogram", name, help_text, source, labels)
+
+    def gauge(self, name, help_text, source, **labels):
+        self._add("gauge", name, help_text, source, labels)
+
+    def counter(self, name, help_text, source, **labels):
+        self._add("counter", name, help_text, source, labels)
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, members) in self._families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, source in members:
+                if kind == "histogram":
+                    snapshot = source.snapshot() if isinstance(source, Histogram) else source()
+                    if not snapshot:
+                        continue
+                    for bound, count in snapshot["buckets"].items():
+                        lines.append(f"{name}_bucket{_labels(labels, ('le', bound))} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {_number(float(snapshot['sum']))}")
+                    lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+                else:
+                    value = source()
+                    if value is not None:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,188 @@
+# micro_batcher.py
+#
+# Collects concurrent single-transaction requests for a short window and scores them
+# together, so the forest's fixed per-call cost is paid once per batch instead of once
+# per request. Every caller still gets back only its own result.
+
+import asyncio
+import time
+
+from prediction_service.metrics import Histogram
+
+# --- Default Configuration ---
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT_MS = 2.0
+DEFAULT_MAX_QUEUE_DEPTH = 1024
+DEFAULT_MAX_CONCURRENT_BATCHES = 1
+
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+WAIT_MS_BUCKETS = [0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 25.0, 100.0]
+
+
+class BatcherOverloaded(Exception):
+    """Raised when the request queue is full; the caller should shed the request."""
+
+
+class BatcherStopped(Exception):
+    """Raised to requests that were still waiting for a batch when the batcher stopped."""
+
+
+class _Pending:
+    __slots__ = ("record", "future", "enqueued")
+
+    def __init__(self, record, future, enqueued):
+        self.record = record
+        self.future = future
+        self.enqueued = enqueued
+
+
+class MicroBatcher:
+    """Async micro-batcher in front of a blocking `batch_function(records) -> results`.
+
+    A batch is dispatched as soon as it holds `max_batch_size` requests or its oldest
+    request has waited `max_wait_ms`. The batch function runs in an executor so the
+    event loop keeps accepting (and batching) requests while a batch is being scored.
+    Up to `max_concurrent_batches` batches (the executor's thread count) are scored at
+    once; while they all are, the next batch keeps collecting requests.
+    """
+
+    def __init__(self, batch_function, max_batch_size=DEFAULT_MAX_BATCH_SIZE,
+                 max_wait_ms=DEFAULT_MAX_WAIT_MS, max_queue_depth=DEFAULT_MAX_QUEUE_DEPTH, executor=None,
+                 max_concurrent_batches=DEFAULT_MAX_CONCURRENT_BATCHES):
+        self.batch_function = batch_function
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_depth = max_queue_depth
+        self.executor = executor
+        self.max_concurrent_batches = max(max_concurrent_batches, 1)
+
+        self.batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self.wait_ms = Histogram(WAIT_MS_BUCKETS)
+        self.rejected = 0
+
+        self._queue = None
+        self._task = None
+        self._slots = None
+        self._in_flight = set()
+
+    def start(self):
+        if self._task is None:
+            self._queue = asyncio.Queue(maxsize=self.max_queue_depth)
+            self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stops collecting; batches already being scored still get their results.
+
+        Requests that were still queued (or in a batch not yet dispatched) fail with
+        BatcherStopped instead of waiting forever.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            while True:
+                try:
+                    pending = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                self._fail(pending)
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    async def submit(self, record):
+        """Queues one record and waits for its own result."""
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_Pending(record, future, time.perf_counter()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise BatcherOverloaded(f"Prediction queue is full ({self.max_queue_depth} pending requests).")
+        return await future
+
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "max_queue_depth": self.max_queue_depth,
+            "queue_depth": self.queue_depth(),
+            "max_concurrent_batches": self.max_concurrent_batches,
+            "batches_in_flight": len(self._in_flight),
+            "rejected": self.rejected,
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_ms": self.wait_ms.snapshot(),
+        }
+
+    @staticmethod
+    def _fail(pending):
+        if not pending.future.done():
+            pending.future.set_exception(BatcherStopped("The prediction service is shutting down."))
+
+    async def _collect(self):
+        first = await self._queue.get()
+        batch = [first]
+        deadline = first.enqueued + self.max_wait
+        try:
+            while len(batch) < self.max_batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            # Stopped while this batch was still open: its requests are already off the queue
+            for pending in batch:
+                self._fail(pending)
+            raise
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Wait for a free scoring slot first, so requests arriving meanwhile join this batch
+            await self._slots.acquire()
+            try:
+                batch = await self._collect()
+            except BaseException:
+                self._slots.release()
+                raise
+
+            dispatched = time.perf_counter()
+            self.batch_sizes.observe(len(batch))
+            for pending in batch:
+                self.wait_ms.observe((dispatched - pending.enqueued) * 1000.0)
+
+            task = loop.create_task(self._score(loop, batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+    async def _score(self, loop, batch):
+        """Scores one batch in the executor and resolves its callers' futures."""
+        try:
+            results = await loop.run_in_executor(
+                self.executor, self.batch_function, [pending.record for pending in batch])
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        finally:
+            self._slots.release()
+
+        for pending, result in zip(batch, results):
+            if not pending.future.done():
+                pending.future.set_result(result)
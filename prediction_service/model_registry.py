@@ -0,0 +1,194 @@
+# model_registry.py
+#
+# Versioned model artifacts, published atomically, and the watcher the API uses to pick
+# up a new version without a restart.
+#
+# Layout:
+#     model_registry/
+#         CURRENT                                   {"version": "v000004", "published": ...}
+#         CANDIDATE                                 (optional) a version the API shadow-scores but doesn't serve
+#         v000004/fraud_detection_model.joblib
+#         v000004/fraud_detection_model.forest/    (memory-mapped .npy node arrays; forests only)
+#
+# A version directory is written under a temporary name and renamed into place once it
+# is complete, and CURRENT is only switched (write + os.replace) after that. A reader
+# following CURRENT therefore never sees a half-written model, and the files of a version
+# it is still loading are never overwritten.
+#
+# A version published as a candidate is pointed to by CANDIDATE instead of CURRENT: the
+# API scores a sample of live traffic with it in the background (shadow.py), and it only
+# goes live when it is promoted (CANDIDATE becomes CURRENT).
+
+import json
+import os
+import shutil
+import threading
+import time
+import joblib
+
+from prediction_service.flat_forest import export_flat_forest, COMPACT_MODEL_FILENAME
+
+# --- Configuration ---
+MODEL_REGISTRY_DIR = "model_registry"
+CURRENT_FILENAME = "CURRENT"
+CANDIDATE_FILENAME = "CANDIDATE"
+MODEL_FILENAME = "fraud_detection_model.joblib"
+KEEP_VERSIONS = 3  # older versions are removed when a new one is published
+
+
+def atomic_joblib_dump(model, filename):
+    """joblib.dump that never leaves a partially written file under `filename`."""
+    temporary = filename + '.tmp'
+    joblib.dump(model, temporary)
+    os.replace(temporary, filename)
+
+
+def read_pointer(registry_dir, pointer):
+    try:
+        with open(os.path.join(registry_dir, pointer), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_pointer(registry_dir, pointer, record):
+    temporary = os.path.join(registry_dir, pointer + '.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(record, f)
+    os.replace(temporary, os.path.join(registry_dir, pointer))
+
+
+def current_version(registry_dir=MODEL_REGISTRY_DIR):
+    """The published version's record, or None when nothing has been published yet."""
+    return read_pointer(registry_dir, CURRENT_FILENAME)
+
+
+def candidate_version(registry_dir=MODEL_REGISTRY_DIR):
+    """The candidate version's record, or None when there is no candidate."""
+    return read_pointer(registry_dir, CANDIDATE_FILENAME)
+
+
+def version_path(registry_dir, version, filename):
+    return os.path.join(registry_dir, version, filename)
+
+
+def list_versions(registry_dir=MODEL_REGISTRY_DIR):
+    if not os.path.isdir(registry_dir):
+        return []
+    return sorted(name for name in os.listdir(registry_dir)
+                  if name.startswith('v') and name[1:].isdigit() and os.path.isdir(os.path.join(registry_dir, name)))
+
+
+def publish_model(model, registry_dir=MODEL_REGISTRY_DIR, keep=KEEP_VERSIONS, forest=None, as_candidate=False):
+    """Writes the pickled (and, for forests, compiled) model as a new version and makes it
+    current, or with `as_candidate` the candidate (replacing any earlier one).
+
+    `forest` is an already compiled FlatForest (e.g. a quantized one) to publish instead
+    of compiling `model`.
+    """
+    os.makedirs(registry_dir, exist_ok=True)
+    versions = list_versions(registry_dir)
+    version = f"v{(int(versions[-1][1:]) + 1) if versions else 1:06d}"
+
+    building = os.path.join(registry_dir, f".{version}.building")
+    shutil.rmtree(building, ignore_errors=True)
+    os.makedirs(building)
+    joblib.dump(model, os.path.join(building, MODEL_FILENAME))
+    is_forest = hasattr(model, 'estimators_')
+    if forest is not None:
+        forest.save(os.path.join(building, COMPACT_MODEL_FILENAME))
+    elif is_forest:  # other model families (e.g. gradient boosting) are served pickled
+        export_flat_forest(model, os.path.join(building, COMPACT_MODEL_FILENAME))
+    os.replace(building, os.path.join(registry_dir, version))
+
+    record = {"version": version, "published": time.time(), "family": type(model).__name__,
+              "n_estimators": len(model.estimators_) if is_forest else None}
+    write_pointer(registry_dir, CANDIDATE_FILENAME if as_candidate else CURRENT_FILENAME, record)
+
+    # A watcher may still be loading the previous version, so a few are kept around;
+    # the current and candidate versions are never removed, however old they are
+    pinned = {(read_pointer(registry_dir, pointer) or {}).get("version") for pointer in (CURRENT_FILENAME, CANDIDATE_FILENAME)}
+    for old in list_versions(registry_dir)[:-keep]:
+        if old not in pinned:
+            shutil.rmtree(os.path.join(registry_dir, old), ignore_errors=True)
+    return version
+
+
+def promote_candidate(registry_dir=MODEL_REGISTRY_DIR):
+    """Makes the candidate version current (the API swaps to it). Returns its record, or None without a candidate."""
+    record = candidate_version(registry_dir)
+    if record is None:
+        return None
+    record = dict(record, promoted=time.time())
+    write_pointer(registry_dir, CURRENT_FILENAME, record)
+    discard_candidate(registry_dir)
+    return record
+
+
+def discard_candidate(registry_dir=MODEL_REGISTRY_DIR):
+    """Stops shadowing the candidate; its version is left to be pruned like any other."""
+    try:
+        os.remove(os.path.join(registry_dir, CANDIDATE_FILENAME))
+    except FileNotFoundError:
+        pass
+
+
+class ModelWatcher:
+    """Polls CURRENT (or another pointer, e.g. CANDIDATE) in a background thread and hands
+    every new version to `on_new_version`.
+
+    `on_new_version(record)` runs on the watcher thread (off the request path) and should
+    load, warm up and then swap the model in. If it raises, the error is kept for the admin
+    endpoint and that version is not retried until the pointer changes again. When the
+    pointer is removed, `on_removed()` (if given) is called once.
+    """
+
+    def __init__(self, on_new_version, registry_dir=MODEL_REGISTRY_DIR, interval_seconds=2.0,
+                 pointer=CURRENT_FILENAME, on_removed=None):
+        self.on_new_version = on_new_version
+        self.registry_dir = registry_dir
+        self.interval_seconds = interval_seconds
+        self.pointer = pointer
+        self.on_removed = on_removed
+        self.seen_version = None
+        self.last_error = None
+        self.last_checked = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, active_version):
+        self.seen_version = active_version
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="model-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self):
+        """Loads the published version if it is new. Returns True if a swap happened."""
+        self.last_checked = time.time()
+        record = read_pointer(self.registry_dir, self.pointer)
+        if record is None:
+            if self.seen_version is not None and self.on_removed is not None:
+                self.on_removed()
+            self.seen_version = None
+            return False
+        if record.get("version") == self.seen_version:
+            return False
+        self.seen_version = record["version"]
+        try:
+            self.on_new_version(record)
+            self.last_error = None
+            return True
+        except Exception as e:
+            self.last_error = {"version": record["version"], "error": str(e), "at": time.time()}
+            print(f"[API] ERROR: Could not load model version {record['version']}: {e}")
+            return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            self.check()
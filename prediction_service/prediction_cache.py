@@ -0,0 +1,97 @@
+# prediction_cache.py
+#
+# In-process LRU/TTL cache of prediction results.
+#
+# The model only sees step, amount, age and gender, so retries and repeated feature
+# tuples are common and would otherwise re-run the whole forest. Entries are keyed on
+# the model version together with the encoded feature row (its raw bytes), so a result
+# is only ever served for exactly the vector and the model that produced it. The API
+# also clears the cache whenever it swaps in a new model version.
+
+import threading
+import time
+from collections import OrderedDict
+
+# --- Default Configuration ---
+DEFAULT_MAX_ENTRIES = 100000
+DEFAULT_TTL_SECONDS = 300.0
+
+
+class PredictionCache:
+    """Size-bounded, thread-safe LRU cache with a per-entry time to live.
+
+    Values are (label, fraud_probability) pairs.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (expires_at, label, probability)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    @staticmethod
+    def keys_for(version, features):
+        """One key per row of an encoded feature matrix."""
+        return [(version, row.tobytes()) for row in features]
+
+    def get_many(self, keys):
+        """Returns a list with the cached (label, probability) or None for every key."""
+        now = time.monotonic()
+        results = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] < now:
+                    del self._entries[key]
+                    self.expired += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    results.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    results.append(entry[1:])
+        return results
+
+    def put_many(self, keys, labels, probabilities):
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            for key, label, probability in zip(keys, labels, probabilities):
+                self._entries[key] = (expires_at, int(label), float(probability))
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,87 @@
+# profiling.py
+#
+# A small sampling profiler for individual API requests.
+#
+# While a profiled request runs, a background thread snapshots the stacks of all other
+# threads (sys._current_frames) every few hundred microseconds. Work for one request
+# spans the event loop and a scoring thread, so every thread is sampled; concurrent
+# requests show up in the same profile. The result is kept in "collapsed stack" form
+# (`frame;frame;frame count` per line), which flamegraph.pl and speedscope read directly.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+
+# --- Default Configuration ---
+DEFAULT_INTERVAL_MS = 0.5
+DEFAULT_KEEP_PROFILES = 20
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+class SamplingProfiler:
+    """Samples the stacks of every other thread until stopped."""
+
+    def __init__(self, interval_ms=DEFAULT_INTERVAL_MS):
+        self.interval = interval_ms / 1000.0
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+            self.sample_count += 1
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+class ProfileStore:
+    """The most recent profiles, by id."""
+
+    def __init__(self, keep=DEFAULT_KEEP_PROFILES):
+        self.keep = keep
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+    def new_id(self):
+        with self._lock:
+            self._next_id += 1
+            return f"{os.getpid()}-{self._next_id}"
+
+    def put(self, profile_id, profiler, duration_ms):
+        header = (f"# request profile {profile_id}: {duration_ms:.3f} ms, "
+                  f"{profiler.sample_count} samples every {profiler.interval * 1000:.2f} ms, taken {time.ctime()}\n")
+        with self._lock:
+            self._profiles[profile_id] = header + profiler.collapsed()
+            while len(self._profiles) > self.keep:
+                self._profiles.popitem(last=False)
+
+    def get(self, profile_id):
+        return self._profiles.get(profile_id)
@@ -0,0 +1,149 @@
+# queue_buffer.py
+#
+# In-memory buffer between scoring and the transaction queue.
+#
+# Scoring threads hand their scored records to the buffer and return immediately; a
+# background task on the event loop takes everything that has accumulated and writes it
+# with one append on a dedicated I/O thread. Neither the event loop nor a scoring thread
+# ever waits for the disk, and under load many batches are coalesced into one write.
+#
+# Records spend at most one flush cycle (normally well under a millisecond) in memory.
+# When the buffer grows past its limit because the disk cannot keep up, `is_full()`
+# lets the API shed new requests instead of growing without bound.
+#
+# The tradeoff: a caller that returns after `append` has answered for records that are
+# not written yet. If the process dies, the buffered records are lost: normally one flush
+# cycle's worth, at most `max_buffered_records`. (Once written they survive a process crash;
+# an OS crash can also lose the appends of the last fsync interval, see segment_log.py.)
+# Callers that must not answer before the write use `append_and_wait`.
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from prediction_service.metrics import Histogram, STAGE_MS_BUCKETS
+
+# --- Default Configuration ---
+DEFAULT_MAX_BUFFERED_RECORDS = 100000
+RETRY_DELAY_SECONDS = 0.5
+
+
+class QueueBuffer:
+    """Thread-safe record buffer flushed by an asyncio task through `flush_function(records)`."""
+
+    def __init__(self, flush_function, max_buffered_records=DEFAULT_MAX_BUFFERED_RECORDS):
+        self.flush_function = flush_function
+        self.max_buffered_records = max_buffered_records
+        self.flushes = 0
+        self.flushed_records = 0
+        self.flush_errors = 0
+        self.last_flush_ms = 0.0
+        self.flush_ms = Histogram(STAGE_MS_BUCKETS)
+
+        self._pending = []
+        self._waiters = []  # futures of append_and_wait() callers whose records are in _pending
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wake = None
+        self._task = None
+        self._executor = None
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._wake = asyncio.Event()
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="queue-io")
+            self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        """Stops the flusher after writing out everything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._loop = None
+            try:
+                await self._flush()
+            finally:
+                self._executor.shutdown(wait=True)
+
+    def append(self, records):
+        """Buffers scored records. Safe to call from any thread; never blocks on I/O.
+
+        Without a running flusher (e.g. when called outside the API) it writes directly.
+        """
+        loop = self._loop
+        if loop is None:
+            self.flush_function(records)
+            return
+        with self._lock:
+            self._pending.extend(records)
+        loop.call_soon_threadsafe(self._wake.set)
+
+    async def append_and_wait(self, records):
+        """Buffers scored records and returns once they have been written. Call it on the event loop."""
+        if self._loop is None:
+            await asyncio.get_running_loop().run_in_executor(None, self.flush_function, records)
+            return
+        written = self._loop.create_future()
+        with self._lock:
+            self._pending.extend(records)
+            self._waiters.append(written)
+        self._wake.set()
+        await written
+
+    def buffered(self):
+        return len(self._pending)
+
+    def is_full(self):
+        return len(self._pending) >= self.max_buffered_records
+
+    def stats(self):
+        return {
+            "buffered_records": self.buffered(),
+            "max_buffered_records": self.max_buffered_records,
+            "flushes": self.flushes,
+            "flushed_records": self.flushed_records,
+            "mean_records_per_flush": round(self.flushed_records / self.flushes, 1) if self.flushes else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "flush_errors": self.flush_errors,
+        }
+
+    async def _flush(self):
+        with self._lock:
+            records, self._pending = self._pending, []
+            waiters, self._waiters = self._waiters, []
+        if not records:
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self.flush_function, records)
+        except Exception as e:
+            # Put the records back in front, so nothing is lost or reordered, and retry later
+            self.flush_errors += 1
+            print(f"[API] ERROR: Could not write {len(records)} records to the transaction queue: {e}")
+            with self._lock:
+                self._pending[:0] = records
+                self._waiters[:0] = waiters
+            raise
+        for written in waiters:
+            if not written.done():
+                written.set_result(None)
+        self.flushes += 1
+        self.flushed_records += len(records)
+        self.last_flush_ms = (time.perf_counter() - started) * 1000
+        self.flush_ms.observe(self.last_flush_ms)
+
+    async def _run(self):
+        while True:
+            await self._wake.wait()
+            self._wake.clear()
+            try:
+                await self._flush()
+            except Exception:
+                await asyncio.sleep(RETRY_DELAY_SECONDS)
+                self._wake.set()
@@ -0,0 +1,105 @@
+# queue_notify.py
+#
+# Lets the database worker react to new queue records instead of polling on a timer.
+#
+# - The API sends a tiny UDP datagram to the worker after every append (fire-and-forget:
+#   if no worker is listening, nothing happens and nothing blocks).
+# - The worker publishes its backlog to a small status file after every flush, which the
+#   API reads (cached) to report - and optionally react to - ingestion falling behind.
+#
+# UDP on localhost is used rather than a Unix socket or inotify so the same code runs
+# on Windows and Linux.
+
+import json
+import os
+import select
+import socket
+import struct
+import time
+
+# --- Configuration ---
+DEFAULT_NOTIFY_HOST = "127.0.0.1"
+DEFAULT_NOTIFY_PORT = 8765
+STATUS_FILENAME = "database_worker.status"
+STATUS_CACHE_SECONDS = 0.5
+
+NOTIFICATION = struct.Struct('<I')  # number of records appended
+
+
+class QueueNotifier:
+    """API side: tells the worker that records were appended. Never raises, never blocks."""
+
+    def __init__(self, host=DEFAULT_NOTIFY_HOST, port=DEFAULT_NOTIFY_PORT):
+        self.address = (host, port)
+        self._socket = None
+        self._pid = None
+
+    def notify(self, record_count):
+        try:
+            if self._pid != os.getpid():  # one socket per (forked) process
+                self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._socket.setblocking(False)
+                self._pid = os.getpid()
+            self._socket.sendto(NOTIFICATION.pack(record_count), self.address)
+        except OSError:
+            pass
+
+
+class QueueListener:
+    """Worker side: waits for append notifications."""
+
+    def __init__(self, host=DEFAULT_NOTIFY_HOST, port=DEFAULT_NOTIFY_PORT):
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((host, port))
+        self._socket.setblocking(False)
+
+    def wait(self, timeout):
+        """Waits up to `timeout` seconds; returns the number of records announced meanwhile."""
+        readable, _, _ = select.select([self._socket], [], [], max(timeout, 0))
+        if not readable:
+            return 0
+        announced = 0
+        while True:
+            try:
+                data = self._socket.recv(64)
+            except (BlockingIOError, InterruptedError):
+                return announced
+            except OSError:  # e.g. Windows reporting an ICMP error on a UDP socket
+                continue
+            if len(data) == NOTIFICATION.size:
+                announced += NOTIFICATION.unpack(data)[0]
+
+    def close(self):
+        self._socket.close()
+
+
+def write_status(queue_directory, status):
+    """Atomically publishes the worker's status next to the queue it consumes."""
+    path = os.path.join(queue_directory, STATUS_FILENAME)
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(dict(status, updated=time.time()), f)
+    os.replace(temporary, path)
+
+
+class QueueStatus:
+    """API side: cached view of the worker's last published status."""
+
+    def __init__(self, queue_directory):
+        self.path = os.path.join(queue_directory, STATUS_FILENAME)
+        self._status = {}
+        self._read_at = 0.0
+
+    def get(self):
+        now = time.monotonic()
+        if now - self._read_at >= STATUS_CACHE_SECONDS:
+            self._read_at = now
+            try:
+                with open(self.path, 'r') as f:
+                    self._status = json.load(f)
+            except (OSError, ValueError):
+                self._status = {}
+        return self._status
+
+    def backlog_bytes(self):
+        return self.get().get("backlog_bytes", 0)
@@ -0,0 +1,333 @@
+# segment_log.py
+#
+# A durable, append-only transaction queue that replaces transactions_queue.log.
+#
+# Layout on disk:
+#     transactions_queue/
+#         <writer id>/00000000000000000000.seg   one partition per API worker process,
+#         <writer id>/00000000000000052311.seg   split into segments named after their
+#         <writer id>/CLOSED                     first record number
+#         database_worker.checkpoint             committed read position per partition
+#
+# Every record is framed as <payload length, crc32, payload>. Each API process owns its
+# partition, so writers never contend with each other or with the reader: the reader
+# only ever reads, and the API never waits for it. The database worker streams from its
+# last committed position and deletes segments once they have been fully committed.
+# A partition is removed once it is fully committed and its writer is finished: either it
+# wrote the CLOSED marker, or (for a writer that crashed or was killed) the process whose
+# pid starts the writer id no longer exists.
+#
+# Payloads are opaque bytes here; prediction_service/record_codec.py defines what the API
+# writes into them (binary batches of records, or JSON lines).
+#
+# How to inspect the unconsumed records as JSON lines (from the project root):
+#     python prediction_service/segment_log.py transactions_queue
+
+import json
+import os
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.record_codec import decode_records
+
+# --- Configuration ---
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+DEFAULT_FSYNC_INTERVAL_MS = 50   # 0 = fsync after every append
+READ_CHUNK_BYTES = 1024 * 1024
+
+FRAME_HEADER = struct.Struct('<II')  # payload length, crc32(payload)
+SEGMENT_SUFFIX = '.seg'
+CLOSED_MARKER = 'CLOSED'
+
+
+def encode_frames(payloads):
+    return b''.join(FRAME_HEADER.pack(len(payload), zlib.crc32(payload)) + payload for payload in payloads)
+
+
+def decode_frames(buffer, max_records, record_count=None):
+    """Decodes whole frames from the start of `buffer`.
+
+    Returns (payloads, records, bytes consumed); `record_count(payload)` tells how many
+    records a payload holds (default: one). Decoding stops once `max_records` are reached
+    or at the first frame that is not complete yet (or fails its checksum), which is left
+    for the next read.
+    """
+    payloads, records, position, end = [], 0, 0, len(buffer)
+    while records < max_records and position + FRAME_HEADER.size <= end:
+        length, checksum = FRAME_HEADER.unpack_from(buffer, position)
+        start = position + FRAME_HEADER.size
+        if start + length > end:
+            break
+        payload = bytes(buffer[start:start + length])
+        if zlib.crc32(payload) != checksum:
+            break
+        payloads.append(payload)
+        records += record_count(payload) if record_count else 1
+        position = start + length
+    return payloads, records, position
+
+
+def _write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+
+def _segments(partition):
+    return sorted(name for name in os.listdir(partition) if name.endswith(SEGMENT_SUFFIX))
+
+
+def _writer_alive(writer_id):
+    """Whether the process that owns a partition (the pid in its writer id) may still append to it.
+
+    A reused pid only delays the clean-up. Where signal 0 can't probe a process (Windows)
+    every writer counts as alive, so only CLOSED partitions are removed there.
+    """
+    if os.name != 'posix':
+        return True
+    try:
+        pid = int(writer_id.split('-', 1)[0])
+        os.kill(pid, 0)
+    except ValueError:
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True  # it exists, under another user
+    return True
+
+
+class SegmentLogWriter:
+    """Long-lived, thread-safe appender owned by one process.
+
+    The partition is opened lazily on the first append, and reopened under a new writer
+    id if the process has forked since, so a writer created before forking API workers
+    is still safe to use in each of them. Appends go straight to the page cache (they
+    survive a process crash); a background thread fsyncs them every
+    `fsync_interval_ms` so the request path never waits for the disk.
+    """
+
+    def __init__(self, directory, segment_bytes=DEFAULT_SEGMENT_BYTES, fsync_interval_ms=DEFAULT_FSYNC_INTERVAL_MS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        self.writer_id = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._fd = None
+        self._dirty = False
+        if hasattr(os, 'register_at_fork'):
+            # The lock may have been held by another thread at the moment of forking
+            os.register_at_fork(after_in_child=self._reset_lock)
+
+    def _reset_lock(self):
+        self._lock = threading.Lock()
+
+    def _open(self):
+        self._pid = os.getpid()
+        self._fd = None
+        self.writer_id = f"{self._pid}-{time.time_ns() // 1000}"
+        self.partition = os.path.join(self.directory, self.writer_id)
+        os.makedirs(self.partition, exist_ok=True)
+        self._records = 0
+        self._roll()
+        if self.fsync_interval > 0:
+            threading.Thread(target=self._sync_loop, args=(self._pid,), daemon=True,
+                             name=f"segment-log-fsync-{self.writer_id}").start()
+
+    def _roll(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        path = os.path.join(self.partition, f"{self._records:020d}{SEGMENT_SUFFIX}")
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._segment_size = os.fstat(self._fd).st_size
+
+    def append(self, payloads):
+        """Appends a list of byte payloads in a single write. Returns the record count."""
+        data = encode_frames(payloads)
+        with self._lock:
+            if self._pid != os.getpid():
+                self._open()
+            if self._segment_size and self._segment_size + len(data) > self.segment_bytes:
+                self._roll()
+            _write_all(self._fd, data)
+            self._segment_size += len(data)
+            self._records += len(payloads)
+            if self.fsync_interval > 0:
+                self._dirty = True
+            else:
+                os.fsync(self._fd)
+        return len(payloads)
+
+    def sync(self):
+        """Flushes appended records to disk without holding up concurrent appends."""
+        with self._lock:
+            if not self._dirty or self._fd is None or self._pid != os.getpid():
+                return
+            self._dirty = False
+            fd = os.dup(self._fd)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _sync_loop(self, pid):
+        while self._pid == pid and self._fd is not None:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    def close(self):
+        """Syncs and closes the partition and marks it as finished for the reader."""
+        with self._lock:
+            if self._fd is None or self._pid != os.getpid():
+                return
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+            open(os.path.join(self.partition, CLOSED_MARKER), 'w').close()
+
+
+class SegmentLogReader:
+    """Streams records from every partition, starting at the last committed position.
+
+    `read()` only advances a pending position; `commit()` makes it durable once the
+    records have been stored, so a crash in between replays them (at-least-once).
+    When a payload can hold several records, `record_count(payload)` says how many, so
+    the `max_records` budget of a read counts records rather than payloads.
+    """
+
+    def __init__(self, directory, consumer="database_worker", record_count=None):
+        self.directory = directory
+        self.record_count = record_count
+        self.checkpoint_file = os.path.join(directory, f"{consumer}.checkpoint")
+        os.makedirs(directory, exist_ok=True)
+        self._committed = self._load_checkpoint()
+        self._pending = dict(self._committed)
+
+    def _load_checkpoint(self):
+        if not os.path.exists(self.checkpoint_file):
+            return {}
+        with open(self.checkpoint_file, 'r') as f:
+            return {writer_id: tuple(position) for writer_id, position in json.load(f).items()}
+
+    def _partitions(self):
+        return sorted(name for name in os.listdir(self.directory)
+                      if os.path.isdir(os.path.join(self.directory, name)))
+
+    def read(self, max_records=10000):
+        """Returns payloads that have not been committed yet, holding up to about `max_records` records."""
+        payloads, records = [], 0
+        for writer_id in self._partitions():
+            if records >= max_records:
+                break
+            partition = os.path.join(self.directory, writer_id)
+            segments = _segments(partition)
+            if not segments:
+                continue
+
+            segment, position = self._pending.get(writer_id, (segments[0], 0))
+            if segment not in segments:
+                segment, position = segments[0], 0
+            index = segments.index(segment)
+
+            while True:
+                segment_payloads, segment_records, position, leftover = self._read_segment(
+                    os.path.join(partition, segment), position, max_records - records)
+                payloads.extend(segment_payloads)
+                records += segment_records
+                if records >= max_records or index + 1 == len(segments):
+                    break
+                # A newer segment exists, so the writer has finished with this one.
+                if leftover:
+                    print(f"[Queue] WARNING: Skipping {leftover} unreadable byte(s) at the end of {writer_id}/{segment}.")
+                index += 1
+                segment, position = segments[index], 0
+
+            self._pending[writer_id] = (segment, position)
+        return payloads
+
+    def _read_segment(self, path, position, max_records):
+        payloads, records, buffer = [], 0, b''
+        with open(path, 'rb') as f:
+            f.seek(position)
+            while records < max_records:
+                chunk = f.read(READ_CHUNK_BYTES)
+                if not chunk:
+                    break
+                buffer += chunk
+                chunk_payloads, chunk_records, consumed = decode_frames(buffer, max_records - records, self.record_count)
+                payloads.extend(chunk_payloads)
+                records += chunk_records
+                position += consumed
+                buffer = buffer[consumed:]
+        return payloads, records, position, len(buffer)
+
+    def rewind(self):
+        """Forgets everything read since the last commit, so it is read again."""
+        self._pending = dict(self._committed)
+
+    def commit(self):
+        """Durably records the read position and deletes fully consumed segments."""
+        self._committed = dict(self._pending)
+        temporary = self.checkpoint_file + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(self._committed, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.checkpoint_file)
+        self._remove_consumed()
+
+    def _remove_consumed(self):
+        for writer_id, (segment, position) in list(self._committed.items()):
+            partition = os.path.join(self.directory, writer_id)
+            if not os.path.isdir(partition):
+                continue
+            segments = _segments(partition)
+            for older in segments:
+                if older >= segment:
+                    break
+                os.remove(os.path.join(partition, older))
+            if not segments or segments[-1] != segment:
+                continue
+            leftover = os.path.getsize(os.path.join(partition, segment)) - position
+            if os.path.exists(os.path.join(partition, CLOSED_MARKER)):
+                consumed = leftover == 0
+            elif not _writer_alive(writer_id):
+                # Nothing will be appended any more; an undecodable tail is a torn last write
+                consumed = leftover == 0 or not self._read_segment(os.path.join(partition, segment), position, 1)[0]
+                if consumed and leftover:
+                    print(f"[Queue] WARNING: Skipping {leftover} unreadable byte(s) at the end of {writer_id}/{segment}.")
+            else:
+                consumed = False
+            if consumed:
+                shutil.rmtree(partition)
+                del self._committed[writer_id]
+                self._pending.pop(writer_id, None)
+
+    def backlog_bytes(self):
+        """Bytes appended but not read yet, across all partitions."""
+        total = 0
+        for writer_id in self._partitions():
+            partition = os.path.join(self.directory, writer_id)
+            segment, position = self._pending.get(writer_id, (None, 0))
+            for name in _segments(partition):
+                if segment is None or name > segment:
+                    total += os.path.getsize(os.path.join(partition, name))
+                elif name == segment:
+                    total += max(os.path.getsize(os.path.join(partition, name)) - position, 0)
+        return total
+
+
+if __name__ == "__main__":
+    queue_directory = sys.argv[1] if len(sys.argv) > 1 else "transactions_queue"
+    reader = SegmentLogReader(queue_directory)
+    records = [record for payload in reader.read(max_records=sys.maxsize) for record in decode_records(payload)]
+    for record in records:
+        print(json.dumps(record))
+    print(f"--- {len(records)} unconsumed record(s) in '{queue_directory}' ---")
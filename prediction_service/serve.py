@@ -0,0 +1,136 @@
+# serve.py
+#
+# Multi-process serving mode for the prediction API.
+#
+# The model is loaded and warmed up once in a parent process, which then binds the
+# listening socket and forks the workers. Every worker therefore starts already holding
+# the model (shared copy-on-write with the parent, or through the page cache for the
+# memory-mapped compact format) and accepts connections on the same socket, so one
+# container uses all of its cores. Each worker runs its own event loop, micro-batcher,
+# model watcher and queue partition: appends from different workers never share a file.
+# The parent only supervises: it restarts workers that die and stops them all on
+# SIGTERM / SIGINT.
+#
+# On platforms without fork (Windows) this falls back to uvicorn's own multi-process
+# mode, where every worker loads the model itself.
+#
+# Velocity features (FRAUD_VELOCITY_FEATURES=1) keep their windows in process memory, and
+# a merchant's window needs all of that merchant's traffic: split across N workers, every
+# count and sum would be about 1/N of what training computed. With them enabled, a single
+# worker is started whatever --workers says.
+#
+# How to run (from the project root):
+#     python -m prediction_service.serve --workers 4 --host 0.0.0.0 --port 8000
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from prediction_service.velocity import VELOCITY_FEATURES_ENABLED
+
+# --- Configuration ---
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_WORKERS = int(os.environ.get("FRAUD_API_WORKERS", str(os.cpu_count() or 1)))
+RESTART_BACKOFF_SECONDS = 1.0
+APP = "prediction_service.main:app"
+
+
+def worker_count(requested):
+    """The number of workers to start: one when velocity features are enabled."""
+    requested = max(requested, 1)
+    if VELOCITY_FEATURES_ENABLED and requested > 1:
+        print(f"[API] WARNING: Velocity features keep per-process windows, which would each see only 1/{requested} "
+              f"of the traffic; starting 1 worker instead of {requested} (set FRAUD_VELOCITY_FEATURES=0 to use more).")
+        return 1
+    return requested
+
+
+def bind_socket(host, port):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_child(sock, app):
+    """Worker process: serves the inherited socket until told to stop."""
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning"))
+    server.run(sockets=[sock])
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def spawn(sock, app):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            run_child(sock, app)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def serve_forked(host, port, workers):
+    from prediction_service import main
+
+    # Load and warm up once, before forking, so workers start with the model in place
+    started = time.perf_counter()
+    main.load_model()
+    print(f"[API] Model {main.active.version} loaded and warmed up in "
+          f"{(time.perf_counter() - started) * 1000:.1f} ms; starting {workers} worker(s) on {host}:{port}.")
+
+    sock = bind_socket(host, port)
+    children = {spawn(sock, main.app) for _ in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"[API] WARNING: Worker {pid} exited (status {status}); starting a replacement.")
+            time.sleep(RESTART_BACKOFF_SECONDS)
+            children.add(spawn(sock, main.app))
+    sock.close()
+    print("[API] All workers stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the prediction API with several worker processes.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="number of worker processes (default: FRAUD_API_WORKERS or the number of cores)")
+    args = parser.parse_args()
+
+    workers = worker_count(args.workers)
+    if hasattr(os, "fork"):
+        serve_forked(args.host, args.port, workers)
+    else:
+        uvicorn.run(APP, host=args.host, port=args.port, workers=workers)
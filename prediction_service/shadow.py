@@ -0,0 +1,320 @@
+# shadow.py
+#
+# Shadow scoring: a candidate model scores a sample of live traffic next to the active
+# model, so it can be promoted on evidence from real requests instead of going live blind.
+#
+# After a batch has been scored and queued, the scoring thread draws a fraction of its
+# rows and hands them (with their velocity features and the labels and probabilities
+# just served) to a queue; that is the only work on the request path. One background
+# thread wakes up every ROUND_INTERVAL_SECONDS, takes everything queued and scores it
+# with the candidate in one call (per-call overhead dominates single-row scoring), then
+# compares the candidate's answers with the ones production actually gave.
+#
+# For latency, one round in ACTIVE_TIMING_EVERY_ROUNDS is also re-scored with the active
+# model, on the same rows and the same thread, so the two are like for like. Latency is
+# the thread's CPU time, so time spent waiting for the GIL behind live requests is not
+# counted against either model.
+#
+# Nothing waits for the shadow thread: beyond max_queued_rows, or while the API says it
+# is under load (at hand-off or when a round starts), samples are dropped and counted.
+# The statistics always describe one (active, candidate) pair; they start over when
+# either model changes.
+#
+# Every API worker shadows its own share of the traffic. With a `stats_dir`, each one
+# writes its raw counters to <stats_dir>/<pid>.json after every round, and stats() adds
+# up those of all workers (dead ones included: their rows were really compared) that
+# describe the same pair, so promotion evidence covers the whole sample.
+
+import json
+import os
+import queue
+import random
+import threading
+import time
+import numpy as np
+
+from prediction_service.metrics import Histogram, merge_snapshots, STAGE_MS_BUCKETS
+
+# --- Default Configuration ---
+DEFAULT_FRACTION = 0.1
+DEFAULT_MAX_QUEUED_ROWS = 4096
+ROUND_INTERVAL_SECONDS = 0.5
+ACTIVE_TIMING_EVERY_ROUNDS = 10
+MODELS = ("active", "candidate")
+
+
+def summarize(workers):
+    """Comparison statistics from the counters() of one or more workers shadowing the same pair."""
+    def total(name):
+        return sum(worker[name] for worker in workers)
+
+    def per_model(name):
+        return {model: sum(worker[name][model] for worker in workers) for model in MODELS}
+
+    compared, fraud, timed_rows, timed_ms = total("compared_rows"), per_model("fraud_rows"), per_model("timed_rows"), per_model("timed_ms")
+    errors = [worker["last_error"] for worker in workers if worker["last_error"]]
+    return {
+        "active_version": workers[0]["active_version"],
+        "candidate_version": workers[0]["candidate_version"],
+        "workers": len(workers),
+        "since": min(worker["since"] for worker in workers),
+        "queued_rows": total("queued_rows"),
+        "sampled_rows": total("sampled_rows"),
+        "dropped_queue_full": total("dropped_queue_full"),
+        "dropped_overloaded": total("dropped_overloaded"),
+        "compared_rows": compared,
+        "disagreements": total("disagreements"),
+        "disagreement_rate": total("disagreements") / compared if compared else None,
+        "fraud_rate": {model: fraud[model] / compared if compared else None for model in MODELS},
+        "fraud_only": per_model("fraud_only"),
+        "mean_probability_difference": total("probability_difference_sum") / compared if compared else None,
+        "cpu_us_per_row": {model: round(timed_ms[model] / timed_rows[model] * 1000, 3)
+                           if timed_rows[model] else None for model in MODELS},
+        "latency_ms": {model: merge_snapshots([worker["latency_ms"][model] for worker in workers]) for model in MODELS},
+        "errors": total("errors"),
+        "last_error": max(errors, key=lambda error: error["at"]) if errors else None,
+    }
+
+
+class ShadowScorer:
+    """Scores sampled traffic with a candidate model in a background thread.
+
+    `score_function(records, extra, loaded)` encodes and scores records with one loaded
+    model and returns (labels, fraud probabilities). `overloaded()`, if given, is asked
+    before every hand-off and every round; while it returns True samples are dropped.
+    With `stats_dir`, the counters are shared with the other workers through that directory.
+    """
+
+    def __init__(self, score_function, fraction=DEFAULT_FRACTION, max_queued_rows=DEFAULT_MAX_QUEUED_ROWS,
+                 overloaded=None, stats_dir=None):
+        self.score_function = score_function
+        self.fraction = fraction
+        self.max_queued_rows = max_queued_rows
+        self.overloaded = overloaded
+        self.stats_dir = stats_dir
+        self.candidate = None
+
+        self._queue = queue.SimpleQueue()
+        self._queued_rows = 0
+        self._rounds = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.reset()
+
+    def reset(self, pair=(None, None)):
+        with self._lock:
+            self._reset(pair)
+
+    def _reset(self, pair):
+        """Starts the statistics over; the caller holds the lock."""
+        self.pair = pair
+        self.since = time.time()
+        self.sampled = 0
+        self.dropped_queue_full = 0
+        self.dropped_overloaded = 0
+        self.compared = 0
+        self.disagreements = 0
+        self.fraud = dict.fromkeys(MODELS, 0)
+        self.fraud_only = dict.fromkeys(MODELS, 0)  # flagged by this model and not the other
+        self.probability_difference_sum = 0.0
+        self.errors = 0
+        self.last_error = None
+        self.latency_ms = {model: Histogram(STAGE_MS_BUCKETS) for model in MODELS}
+        self.timed_rows = dict.fromkeys(MODELS, 0)
+        self.timed_ms = dict.fromkeys(MODELS, 0.0)
+
+    def set_candidate(self, candidate):
+        """Starts shadowing `candidate` (a LoadedModel), or stops with None. Queued samples of the previous one are skipped."""
+        self.candidate = candidate
+        self.reset()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="shadow-scoring", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.candidate = None  # whatever is still queued is skipped
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def offer(self, records, extra, labels, probabilities, active):
+        """Hands a sample of records scored by `active` (and what it answered) to the shadow thread. Never blocks."""
+        candidate = self.candidate
+        if candidate is None or self.fraction <= 0 or self._thread is None:
+            return
+        if self.fraction < 1:
+            rows = [row for row in range(len(records)) if random.random() < self.fraction]
+            if not rows:
+                return
+            records = [records[row] for row in rows]
+            extra = extra[rows] if extra is not None else None
+            labels, probabilities = labels[rows], probabilities[rows]
+        # Counters are only changed under the lock: several scoring threads offer at once
+        overloaded = self.overloaded is not None and self.overloaded()
+        with self._lock:
+            self.sampled += len(records)
+            if overloaded:
+                self.dropped_overloaded += len(records)
+                return
+            if self._queued_rows + len(records) > self.max_queued_rows:
+                self.dropped_queue_full += len(records)
+                return
+            self._queued_rows += len(records)
+        self._queue.put((records, extra, labels, probabilities, active, candidate))
+
+    def counters(self):
+        """This worker's raw counters, in the form summarize() adds up."""
+        with self._lock:
+            active_version, candidate_version = self.pair
+            return {
+                "pid": os.getpid(),
+                "active_version": active_version,
+                "candidate_version": candidate_version,
+                "since": self.since,
+                "queued_rows": self._queued_rows,
+                "sampled_rows": self.sampled,
+                "dropped_queue_full": self.dropped_queue_full,
+                "dropped_overloaded": self.dropped_overloaded,
+                "compared_rows": self.compared,
+                "disagreements": self.disagreements,
+                "fraud_rows": dict(self.fraud),
+                "fraud_only": dict(self.fraud_only),
+                "probability_difference_sum": self.probability_difference_sum,
+                "timed_rows": dict(self.timed_rows),
+                "timed_ms": dict(self.timed_ms),
+                "latency_ms": {model: self.latency_ms[model].snapshot() for model in MODELS},
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
+
+    def stats(self):
+        """The comparison so far, across every worker that shadowed the same (active, candidate) pair."""
+        own = self.counters()
+        workers = [own] + [other for other in self._published() if other["pid"] != own["pid"] and self._same_pair(own, other)]
+        return {
+            "candidate": self.candidate.describe() if self.candidate else None,
+            "fraction": self.fraction,
+            "max_queued_rows": self.max_queued_rows,
+            **summarize(workers),
+        }
+
+    def _same_pair(self, own, other):
+        if own["candidate_version"] is not None:
+            return (other["active_version"], other["candidate_version"]) == (own["active_version"], own["candidate_version"])
+        # No comparison here yet: the candidate is known, the active model it will be compared with not
+        return self.candidate is not None and other["candidate_version"] == self.candidate.version
+
+    def _published(self):
+        """The counters other workers wrote to stats_dir."""
+        if not self.stats_dir or not os.path.isdir(self.stats_dir):
+            return []
+        published = []
+        for name in os.listdir(self.stats_dir):
+            if name.endswith(".json"):
+                try:
+                    with open(os.path.join(self.stats_dir, name), 'r') as f:
+                        published.append(json.load(f))
+                except (OSError, ValueError):
+                    continue  # removed or replaced while listing
+        return published
+
+    def publish(self):
+        """Writes this worker's counters to stats_dir (atomically, so readers never see half a file)."""
+        if not self.stats_dir:
+            return
+        counters = self.counters()
+        if counters["candidate_version"] is None:
+            return  # nothing compared yet
+        os.makedirs(self.stats_dir, exist_ok=True)
+        path = os.path.join(self.stats_dir, f"{counters['pid']}.json")
+        with open(path + '.tmp', 'w') as f:
+            json.dump(counters, f)
+        os.replace(path + '.tmp', path)
+
+    def _score(self, model, records, extra, loaded):
+        """Scores with one model and records its CPU time. Returns (labels, fraud probabilities)."""
+        started = time.thread_time()
+        labels, probabilities = self.score_function(records, extra, loaded)
+        elapsed_ms = (time.thread_time() - started) * 1000
+        with self._lock:
+            self.latency_ms[model].observe(elapsed_ms)
+            self.timed_rows[model] += len(records)
+            self.timed_ms[model] += elapsed_ms
+        return np.asarray(labels), np.asarray(probabilities)
+
+    def _compare(self, served_labels, served_probabilities, candidate_labels, candidate_probabilities):
+        active_fraud, candidate_fraud = served_labels == 1, candidate_labels == 1
+        with self._lock:
+            self.compared += len(served_labels)
+            self.disagreements += int(np.count_nonzero(served_labels != candidate_labels))
+            self.fraud["active"] += int(np.count_nonzero(active_fraud))
+            self.fraud["candidate"] += int(np.count_nonzero(candidate_fraud))
+            self.fraud_only["active"] += int(np.count_nonzero(active_fraud & ~candidate_fraud))
+            self.fraud_only["candidate"] += int(np.count_nonzero(candidate_fraud & ~active_fraud))
+            self.probability_difference_sum += float(np.abs(served_probabilities - candidate_probabilities).sum())
+
+    def _take_round(self):
+        """Blocks for the next sample, then takes whatever else is queued.
+
+        Returns {(active, candidate): [sample, ...]}, or None when stopping.
+        """
+        items = [self._queue.get()]
+        while items[-1] is not None:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        with self._lock:
+            self._queued_rows -= sum(len(item[0]) for item in items if item is not None)
+        groups = {}
+        for item in items:
+            if item is None:
+                return None
+            active, candidate = item[4], item[5]
+            if candidate is self.candidate:  # else it was replaced or removed since this sample was taken
+                groups.setdefault((active, candidate), []).append(item[:4])
+        return groups
+
+    def _shadow(self, active, candidate, samples):
+        pair = (active.version, candidate.version)
+        with self._lock:
+            if self.pair == (None, None):
+                self.pair = pair  # the first comparison since set_candidate()
+            elif self.pair != pair:
+                self._reset(pair)  # the active model changed
+        records = [record for sample in samples for record in sample[0]]
+        extra = None if samples[0][1] is None else np.concatenate([sample[1] for sample in samples])
+        served_labels = np.concatenate([sample[2] for sample in samples])
+        served_probabilities = np.concatenate([sample[3] for sample in samples])
+        candidate_labels, candidate_probabilities = self._score("candidate", records, extra, candidate)
+        self._compare(served_labels, served_probabilities, candidate_labels, candidate_probabilities)
+        if self._rounds % ACTIVE_TIMING_EVERY_ROUNDS == 0:
+            self._score("active", records, extra, active)
+
+    def _run(self):
+        while True:
+            groups = self._take_round()
+            if groups is None:
+                return
+            if groups and self.overloaded is not None and self.overloaded():
+                with self._lock:
+                    self.dropped_overloaded += sum(len(sample[0]) for samples in groups.values() for sample in samples)
+                groups = {}
+            for (active, candidate), samples in groups.items():
+                try:
+                    self._shadow(active, candidate, samples)
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                        self.last_error = {"error": str(e), "at": time.time()}
+            if groups:
+                self._rounds += 1
+                try:
+                    self.publish()
+                except OSError as e:
+                    with self._lock:
+                        self.last_error = {"error": f"Could not publish shadow statistics: {e}", "at": time.time()}
+            time.sleep(ROUND_INTERVAL_SECONDS)
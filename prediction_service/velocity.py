@@ -0,0 +1,282 @@
+# velocity.py
+#
+# Sliding-window activity ("velocity") features per customer and per merchant: over the
+# last VELOCITY_WINDOW_STEPS steps, how many transactions the customer made, their total
+# and largest amount and how many distinct merchants they paid, and the same count, total
+# and largest amount for the merchant.
+#
+# The state is array-backed. Every key (a customer or a merchant) owns a fixed slot in flat
+# arrays holding one bucket per step of the window, used as a ring (bucket = step % window).
+# Recording a transaction touches one bucket and reading a key's features scans its
+# `window` buckets, so both are O(1) in the length of the history. Memory is bounded by
+# max_keys * window buckets per table: when a table is full, keys with no activity inside
+# the window (whose features are all zero anyway) are evicted first, and only if there are
+# too few of those the least recently active ones.
+#
+# The merchants a customer paid are a 64-bit set per bucket (MERCHANT_SET_BITS), so they
+# take one machine word whatever the number of merchants. The first 64 merchants seen get
+# a bit of their own, which makes the count exact for BankSim's ~50 merchants. Any further
+# merchant shares a bit chosen by hashing its id, so with more than 64 merchants a
+# customer's count can come out low (never high) when two of their merchants collide.
+#
+# Features describe the activity *before* a transaction, which is then recorded. The API
+# does this for every transaction it scores, and the training side (the streaming loader,
+# the feature store snapshot and the backtest replay) feeds fraud_data through the same
+# code in (step, TransactionID) order, so training and serving see identical values.
+
+import json
+import os
+import threading
+import zlib
+from array import array
+import numpy as np
+
+# --- Configuration ---
+# Opt-in: training then streams fraud_data in (step, TransactionID) order and every row goes
+# through Python-level window updates, and the API serves from a single worker (serve.py)
+VELOCITY_FEATURES_ENABLED = os.environ.get("FRAUD_VELOCITY_FEATURES", "0") == "1"
+VELOCITY_WINDOW_STEPS = int(os.environ.get("FRAUD_VELOCITY_WINDOW_STEPS", "7"))
+VELOCITY_MAX_CUSTOMERS = int(os.environ.get("FRAUD_VELOCITY_MAX_CUSTOMERS", "200000"))
+VELOCITY_MAX_MERCHANTS = int(os.environ.get("FRAUD_VELOCITY_MAX_MERCHANTS", "20000"))
+# Width of a customer's merchant set: one uint64 per bucket
+MERCHANT_SET_BITS = 64
+# Share of a full table freed at once when no key has left the window yet
+EVICTION_FRACTION = 1 / 16
+STATE_ARRAYS_FILE = "velocity_state.npz"
+STATE_KEYS_FILE = "velocity_keys.json"
+# The last window of fraud_data, replayed into the API's state at start-up (FRAUD_VELOCITY_WARM_UP=1)
+WARM_UP_QUERY = ("SELECT customer, merchant, step, amount FROM fraud_data "
+                 "WHERE step > (SELECT MAX(step) FROM fraud_data) - ? ORDER BY step, TransactionID;")
+
+
+def velocity_feature_names(window=VELOCITY_WINDOW_STEPS):
+    """Model column names; they carry the window, so a model can't be served with another one."""
+    return [f"customer_txn_count_{window}", f"customer_amount_sum_{window}", f"customer_amount_max_{window}",
+            f"customer_merchants_{window}", f"merchant_txn_count_{window}", f"merchant_amount_sum_{window}",
+            f"merchant_amount_max_{window}"]
+
+
+VELOCITY_FEATURES = velocity_feature_names()
+
+
+def _normalise(value):
+    """The raw dataset quotes ids ("'C1093826151'"), the API does not ('C1093826151')."""
+    return str(value).strip("'")
+
+
+class SlidingWindowTable:
+    """Per-key count, sum and max of amounts (and optionally a 64-bit merchant set) over the
+    last `window` steps, in preallocated arrays of max_keys * window buckets."""
+
+    def __init__(self, max_keys, window=VELOCITY_WINDOW_STEPS, track_merchants=False):
+        self.max_keys = max_keys
+        self.window = window
+        self.slots = {}                  # key -> slot
+        self.keys = [None] * max_keys    # slot -> key
+        self.free = list(range(max_keys - 1, -1, -1))
+        self.newest_step = 0
+        self.evictions = 0
+
+        # array.array gives fast scalar access on the per-transaction path, and the NumPy
+        # views over the same memory make eviction and saving vectorized.
+        buckets = max_keys * window
+        self.steps = array('q', bytes(8 * buckets))
+        self.counts = array('q', bytes(8 * buckets))
+        self.sums = array('d', bytes(8 * buckets))
+        self.maxima = array('d', bytes(8 * buckets))
+        self.merchants = array('Q', bytes(8 * buckets)) if track_merchants else None
+        self.last_step = array('q', bytes(8 * max_keys))
+
+    def _views(self):
+        """2-D NumPy views (max_keys, window) of the bucket arrays, sharing their memory."""
+        arrays = {"steps": self.steps, "counts": self.counts, "sums": self.sums, "maxima": self.maxima}
+        if self.merchants is not None:
+            arrays["merchants"] = self.merchants
+        return {name: np.frombuffer(values, dtype=values.typecode).reshape(self.max_keys, self.window)
+                for name, values in arrays.items()}
+
+    def observe(self, key, step, amount, merchant=0):
+        """(count, sum, max, merchant set) of the key's transactions in steps (step - window, step],
+        then records this transaction in the key's bucket for `step`. `merchant` is the merchant's bit."""
+        slot = self.slots.get(key)
+        if slot is None:
+            if not self.free:
+                self._evict()
+            slot = self.free.pop()
+            self.slots[key] = slot
+            self.keys[slot] = key
+        window = self.window
+        start = slot * window
+        end = start + window
+        steps, counts, sums, maxima, merchants = self.steps, self.counts, self.sums, self.maxima, self.merchants
+
+        count, total, largest, seen = 0, 0.0, 0.0, 0
+        oldest = step - window
+        for bucket in range(start, end):
+            if oldest < steps[bucket] <= step:
+                count += counts[bucket]
+                total += sums[bucket]
+                if maxima[bucket] > largest:
+                    largest = maxima[bucket]
+                if merchants is not None:
+                    seen |= merchants[bucket]
+
+        bucket = start + step % window
+        current = steps[bucket]
+        if current > step:
+            # A newer step already reuses this bucket: the transaction is outside every window it could count in
+            return count, total, largest, seen
+        if current < step:
+            steps[bucket] = step
+            counts[bucket] = 1
+            sums[bucket] = amount
+            maxima[bucket] = amount
+            if merchants is not None:
+                merchants[bucket] = merchant
+        else:
+            counts[bucket] += 1
+            sums[bucket] += amount
+            if amount > maxima[bucket]:
+                maxima[bucket] = amount
+            if merchants is not None:
+                merchants[bucket] |= merchant
+        if step > self.last_step[slot]:
+            self.last_step[slot] = step
+        if step > self.newest_step:
+            self.newest_step = step
+        return count, total, largest, seen
+
+    def _evict(self):
+        """Frees the slots of keys that left the window, or else of the least recently active keys."""
+        last_step = np.frombuffer(self.last_step, dtype=np.int64)
+        victims = np.flatnonzero(last_step <= self.newest_step - self.window)
+        batch = max(int(self.max_keys * EVICTION_FRACTION), 1)
+        if len(victims) < batch:
+            victims = np.argpartition(last_step, batch - 1)[:batch]
+        for view in self._views().values():
+            view[victims] = 0
+        last_step[victims] = 0
+        for slot in victims.tolist():
+            del self.slots[self.keys[slot]]
+            self.keys[slot] = None
+            self.free.append(slot)
+        self.evictions += len(victims)
+
+    def stats(self):
+        arrays = [self.steps, self.counts, self.sums, self.maxima, self.last_step]
+        if self.merchants is not None:
+            arrays.append(self.merchants)
+        return {"keys": len(self.slots), "max_keys": self.max_keys, "evictions": self.evictions,
+                "bytes": sum(values.itemsize * len(values) for values in arrays)}
+
+    def state(self):
+        """The occupied slots as NumPy arrays plus their keys, for saving."""
+        occupied = np.array(sorted(self.slots.values()), dtype=np.int64)
+        arrays = {name: view[occupied] for name, view in self._views().items()}
+        arrays["last_step"] = np.frombuffer(self.last_step, dtype=np.int64)[occupied]
+        return arrays, [self.keys[slot] for slot in occupied.tolist()], self.newest_step
+
+    def restore(self, arrays, keys, newest_step):
+        if len(keys) > self.max_keys:
+            raise ValueError(f"Saved velocity state has {len(keys)} keys, more than the {self.max_keys} allowed.")
+        slots = np.arange(len(keys))
+        for name, view in self._views().items():
+            view[slots] = arrays[name]
+        np.frombuffer(self.last_step, dtype=np.int64)[slots] = arrays["last_step"]
+        self.slots = {key: slot for slot, key in enumerate(keys)}
+        self.keys = list(keys) + [None] * (self.max_keys - len(keys))
+        self.free = list(range(self.max_keys - 1, len(keys) - 1, -1))
+        self.newest_step = newest_step
+
+
+class VelocityFeatures:
+    """The customer and merchant tables behind the VELOCITY_FEATURES columns.
+
+    observe_* return the features of each transaction and then record it; calls are
+    serialized by a lock, so the API's scoring threads can share one instance.
+    """
+
+    def __init__(self, window=VELOCITY_WINDOW_STEPS, max_customers=VELOCITY_MAX_CUSTOMERS,
+                 max_merchants=VELOCITY_MAX_MERCHANTS):
+        self.window = window
+        self.feature_names = velocity_feature_names(window)
+        self.customers = SlidingWindowTable(max_customers, window, track_merchants=True)
+        self.merchants = SlidingWindowTable(max_merchants, window)
+        self.merchant_ids = {}  # merchant -> its own bit in the customers' merchant sets (at most MERCHANT_SET_BITS)
+        self._lock = threading.Lock()
+
+    def observe(self, customer, merchant, step, amount):
+        """Features of one transaction (a tuple in VELOCITY_FEATURES order), then records it."""
+        customer, merchant, step, amount = _normalise(customer), _normalise(merchant), int(step), float(amount)
+        count, total, largest, seen = self.customers.observe(customer, step, amount, self.merchant_bit(merchant))
+        merchant_count, merchant_total, merchant_largest, _ = self.merchants.observe(merchant, step, amount)
+        return count, total, largest, seen.bit_count(), merchant_count, merchant_total, merchant_largest
+
+    def merchant_bit(self, merchant):
+        """The merchant's bit: its own while there are free ones, else one picked by hashing (shared)."""
+        merchant_id = self.merchant_ids.get(merchant)
+        if merchant_id is None:
+            if len(self.merchant_ids) >= MERCHANT_SET_BITS:
+                return 1 << (zlib.crc32(merchant.encode('utf-8')) % MERCHANT_SET_BITS)
+            merchant_id = self.merchant_ids[merchant] = len(self.merchant_ids)
+        return 1 << merchant_id
+
+    def observe_many(self, records):
+        """Features of a list of transaction dicts, in order, as an (n, 7) matrix."""
+        observe = self.observe
+        with self._lock:
+            rows = [observe(r['customer'], r['merchant'], r['step'], r['amount']) for r in records]
+        return np.array(rows, dtype=np.float64).reshape(len(rows), len(self.feature_names))
+
+    def observe_columns(self, customers, merchants, steps, amounts):
+        """The batch form of observe_many, for column arrays already in (step, TransactionID) order."""
+        observe = self.observe
+        with self._lock:
+            rows = [observe(*values) for values in zip(customers, merchants, steps, amounts)]
+        return np.array(rows, dtype=np.float64).reshape(len(rows), len(self.feature_names))
+
+    def add_to_frame(self, df):
+        """Adds the VELOCITY_FEATURES columns to a fraud_data chunk (rows in step order)."""
+        features = self.observe_columns(df['customer'].tolist(), df['merchant'].tolist(),
+                                        df['step'].tolist(), df['amount'].tolist())
+        for index, name in enumerate(self.feature_names):
+            df[name] = features[:, index]
+        return df
+
+    def stats(self):
+        return {"window_steps": self.window, "customers": self.customers.stats(), "merchants": self.merchants.stats()}
+
+    def save(self, directory):
+        """Writes both tables to `directory`, so a later run can continue the stream."""
+        os.makedirs(directory, exist_ok=True)
+        arrays, keys = {}, {"window": self.window, "merchant_set_bits": MERCHANT_SET_BITS,
+                            "merchant_ids": list(self.merchant_ids)}
+        for prefix, table in (("customers", self.customers), ("merchants", self.merchants)):
+            table_arrays, keys[prefix], keys[f"{prefix}_newest_step"] = table.state()
+            arrays.update({f"{prefix}.{name}": values for name, values in table_arrays.items()})
+        np.savez(os.path.join(directory, STATE_ARRAYS_FILE), **arrays)
+        temporary = os.path.join(directory, STATE_KEYS_FILE + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(keys, f)
+        os.replace(temporary, os.path.join(directory, STATE_KEYS_FILE))
+
+    @classmethod
+    def load(cls, directory, **limits):
+        """Restores saved tables, or returns None if there are none for this window (or they
+        hold merchant sets of another layout)."""
+        keys_path = os.path.join(directory, STATE_KEYS_FILE)
+        arrays_path = os.path.join(directory, STATE_ARRAYS_FILE)
+        if not (os.path.exists(keys_path) and os.path.exists(arrays_path)):
+            return None
+        with open(keys_path, 'r') as f:
+            keys = json.load(f)
+        if keys["window"] != limits.get("window", VELOCITY_WINDOW_STEPS) or keys.get("merchant_set_bits") != MERCHANT_SET_BITS:
+            return None
+        velocity = cls(**limits)
+        velocity.merchant_ids = {merchant: index for index, merchant in enumerate(keys["merchant_ids"])}
+        with np.load(arrays_path) as arrays:
+            for prefix, table in (("customers", velocity.customers), ("merchants", velocity.merchants)):
+                table.restore({name: arrays[f"{prefix}.{name}"] for name in
+                               ("steps", "counts", "sums", "maxima", "merchants", "last_step") if f"{prefix}.{name}" in arrays},
+                              keys[prefix], keys[f"{prefix}_newest_step"])
+        return velocity
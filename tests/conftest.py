@@ -0,0 +1,10 @@
+# conftest.py
+#
+# Makes the project packages (prediction_service, data_ingestion_and_retraining)
+# importable when pytest is run from the project root:
+#     python -m pytest -q
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
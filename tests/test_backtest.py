@@ -0,0 +1,69 @@
+# test_backtest.py
+#
+# AUC and average precision from the merged per-chunk score histograms agree with
+# scikit-learn's on the raw probabilities: exactly for forest-like (1/n_trees) scores,
+# within the histogram's bin width otherwise.
+
+import numpy as np
+import pytest
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+from data_ingestion_and_retraining import backtest
+from data_ingestion_and_retraining.backtest import SCORE_BINS, Tally
+
+
+class ScoreColumn:
+    """Stands in for a model: the fraud probability is the first feature."""
+
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        return np.column_stack([1 - X[:, 0], X[:, 0]])
+
+
+@pytest.fixture
+def scored(monkeypatch):
+    monkeypatch.setattr(backtest, "_worker", {"models": {"model": (ScoreColumn(), [0], 1)}})
+
+    def score(probabilities, labels, chunks=3):
+        """Scores the rows chunk by chunk, as the pool does, and merges them into one Tally."""
+        tally = Tally()
+        steps = np.arange(len(labels)) // 100
+        for rows in np.array_split(np.arange(len(labels)), chunks):
+            task = {"steps": steps[rows], "X": probabilities[rows, None], "y": labels[rows], "window_steps": 10}
+            for window in backtest._score_chunk(task)["windows"].values():
+                tally.add(window["model"])
+        return tally.metrics()
+    return score
+
+
+def noisy_labels(probabilities, rng):
+    return (rng.random(len(probabilities)) < probabilities ** 2).astype(np.int8)
+
+
+def test_forest_scores_match_sklearn_exactly(scored):
+    rng = np.random.default_rng(0)
+    probabilities = rng.integers(0, 51, 5000) / 50  # a 50-tree forest, with many ties
+    labels = noisy_labels(probabilities, rng)
+    metrics = scored(probabilities, labels)
+    assert metrics["rows"] == 5000 and metrics["fraud_rows"] == labels.sum()
+    assert metrics["roc_auc"] == pytest.approx(roc_auc_score(labels, probabilities), abs=1e-12)
+    assert metrics["average_precision"] == pytest.approx(average_precision_score(labels, probabilities), abs=1e-12)
+
+
+def test_continuous_scores_match_sklearn_within_the_bin_width(scored):
+    rng = np.random.default_rng(1)
+    probabilities = rng.random(20000)
+    labels = noisy_labels(probabilities, rng)
+    metrics = scored(probabilities, labels, chunks=7)
+    # Only pairs of rows within one bin (1 / SCORE_BINS) of each other can be ranked differently
+    assert metrics["roc_auc"] == pytest.approx(roc_auc_score(labels, probabilities), abs=1 / SCORE_BINS)
+    assert metrics["average_precision"] == pytest.approx(average_precision_score(labels, probabilities), abs=1 / SCORE_BINS)
+
+
+def test_confusion_counts_use_the_models_own_decision(scored):
+    probabilities = np.array([0.9, 0.8, 0.2, 0.6, 0.1, 0.4])
+    labels = np.array([1, 0, 1, 1, 0, 0], dtype=np.int8)
+    metrics = scored(probabilities, labels, chunks=2)
+    assert metrics["precision"] == pytest.approx(2 / 3)  # flagged: 0.9, 0.8, 0.6
+    assert metrics["recall"] == pytest.approx(2 / 3)
@@ -0,0 +1,93 @@
+# test_balancing.py
+#
+# The balancing strategies: class counts after resampling, and synthetic rows that never mix categories.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_ingestion_and_retraining.balancing import (balance, chunked_smote, forest_params, one_hot_columns,
+                                                     undersample)
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.velocity import velocity_feature_names
+
+FEATURE_NAMES = FeatureEncoder.for_training().feature_names
+
+
+def training_frame(rows=400, fraud_rows=40, seed=0):
+    """Rows in the FeatureEncoder.for_training() layout: step, amount, then one-hot age and gender."""
+    rng = np.random.default_rng(seed)
+    categorical = one_hot_columns(FEATURE_NAMES)
+    ages = [c for c in categorical if FEATURE_NAMES[c].startswith("age_")]
+    genders = [c for c in categorical if FEATURE_NAMES[c].startswith("gender_")]
+    X = np.zeros((rows, len(FEATURE_NAMES)), dtype=np.float32)
+    X[:, 0] = rng.integers(0, 100, rows)
+    X[:, 1] = rng.gamma(2.0, 30.0, rows)
+    X[np.arange(rows), rng.choice(ages, rows)] = 1
+    X[np.arange(rows), rng.choice(genders, rows)] = 1
+    y = np.zeros(rows, dtype=np.int64)
+    y[rng.choice(rows, fraud_rows, replace=False)] = 1
+    return pd.DataFrame(X, columns=FEATURE_NAMES), y
+
+
+def test_one_hot_columns_come_from_the_encoder_layout():
+    assert [FEATURE_NAMES[c] for c in one_hot_columns(FEATURE_NAMES)] == FEATURE_NAMES[2:]
+    with_velocity = FEATURE_NAMES + velocity_feature_names(7)
+    assert one_hot_columns(with_velocity) == one_hot_columns(FEATURE_NAMES)
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 7])
+def test_chunked_smote_balances_without_mixing_categories(chunk_size):
+    X, y = training_frame()
+    categorical = one_hot_columns(FEATURE_NAMES)
+    X_out, y_out = chunked_smote(X.to_numpy(), y, categorical, chunk_size=chunk_size)
+
+    assert (y_out == 1).sum() == (y_out == 0).sum() == 360
+    np.testing.assert_array_equal(X_out[:len(X)], X.to_numpy())
+    synthetic = X_out[len(X):]
+    fraud = X.to_numpy()[y == 1]
+    # Every synthetic row has the exact one-hot pattern of a real fraud row ...
+    patterns = {tuple(row) for row in fraud[:, categorical]}
+    assert {tuple(row) for row in synthetic[:, categorical]} <= patterns
+    # ... and numeric values between those of real fraud rows
+    numeric = [0, 1]
+    assert (synthetic[:, numeric] >= fraud[:, numeric].min(axis=0)).all()
+    assert (synthetic[:, numeric] <= fraud[:, numeric].max(axis=0)).all()
+
+
+def test_chunked_smote_copies_a_fraud_row_that_has_no_neighbours():
+    X, y = training_frame(rows=50, fraud_rows=1)
+    X_out, y_out = chunked_smote(X.to_numpy(), y, one_hot_columns(FEATURE_NAMES))
+    assert (y_out == 1).sum() == 49
+    assert (X_out[len(X):] == X.to_numpy()[y == 1]).all()
+
+
+def test_undersample_keeps_every_fraud_row():
+    X, y = training_frame()
+    X_out, y_out = undersample(X.to_numpy(), y, ratio=2.0)
+    assert (y_out == 1).sum() == 40 and (y_out == 0).sum() == 80
+    fraud = {tuple(row) for row in X.to_numpy()[y == 1]}
+    assert fraud <= {tuple(row) for row in X_out}
+
+
+@pytest.mark.parametrize("strategy", ["smote", "chunked_smote", "undersample", "class_weight"])
+def test_balance_keeps_data_frame_columns(strategy):
+    X, y = training_frame()
+    X_out, y_out = balance(X, y, strategy)
+    assert isinstance(X_out, pd.DataFrame) and list(X_out.columns) == FEATURE_NAMES
+    assert len(X_out) == len(y_out)
+    if strategy == "class_weight":
+        assert len(X_out) == len(X)
+        assert forest_params(strategy) == {"class_weight": "balanced_subsample"}
+    else:
+        assert (y_out == 1).sum() == (y_out == 0).sum()
+        assert forest_params(strategy) == {"class_weight": None}
+
+
+def test_balance_rejects_unknown_strategies_and_unnamed_columns():
+    X, y = training_frame()
+    with pytest.raises(ValueError, match="Unknown balancing strategy"):
+        balance(X, y, "oversample")
+    unnamed = np.column_stack([X.to_numpy(), np.zeros(len(X))])
+    with pytest.raises(ValueError, match="feature names"):
+        balance(unnamed, y, "chunked_smote")
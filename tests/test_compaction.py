@@ -0,0 +1,73 @@
+# test_compaction.py
+#
+# The one-traversal (depth cap x tree count) grid must agree with actually pruned forests.
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from data_ingestion_and_retraining.compaction import (DEPTH_CAPS, cap_tree_depth, choose, compact_model, evaluate_grid,
+                                                      node_depths, precision_recall, prune_model)
+from prediction_service.flat_forest import FlatForest
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    rng = np.random.default_rng(1)
+    X = pd.DataFrame(rng.normal(size=(1500, 4)).astype(np.float32), columns=["a", "b", "c", "d"])
+    y = ((X["a"] * X["b"] + X["c"] + rng.normal(scale=0.7, size=len(X))) > 1.0).astype(int).to_numpy()
+    model = RandomForestClassifier(n_estimators=8, max_depth=9, random_state=0).fit(X[:1000], y[:1000])
+    return model, X[1000:], y[1000:]
+
+
+def test_capped_tree_scores_like_a_tree_cut_at_that_depth(fitted):
+    model, X, _ = fitted
+    estimator = model.estimators_[0]
+    capped = cap_tree_depth(estimator, 3)
+    assert capped.tree_.max_depth == 3
+    # The capped tree's leaf for a row is the full tree's node at depth 3 on the same path
+    rows = X.to_numpy()
+    path = estimator.decision_path(rows).toarray().astype(bool)
+    depth = node_depths(FlatForest.from_sklearn(model))[:estimator.tree_.node_count]
+    at_cap = [np.flatnonzero(row & (depth <= 3))[-1] for row in path]
+    value = estimator.tree_.value[at_cap, 0, :]
+    np.testing.assert_allclose(capped.predict_proba(rows), value / value.sum(axis=1, keepdims=True))
+    assert cap_tree_depth(estimator, 100).tree_.node_count == estimator.tree_.node_count
+
+
+def test_grid_matches_pruned_forests(fitted):
+    model, X, y = fitted
+    grid = evaluate_grid(FlatForest.from_sklearn(model), X, y)
+    caps = [cap for cap in DEPTH_CAPS if cap < 9] + [None]
+    assert len(grid) == len(caps) * model.n_estimators
+    for entry in grid:
+        pruned = prune_model(model, entry["n_trees"], entry["max_depth"])
+        predicted = pruned.predict(X) == 1
+        precision, recall = precision_recall((predicted & (y == 1)).sum(), predicted.sum(), int((y == 1).sum()))
+        assert entry["precision"] == pytest.approx(float(precision))
+        assert entry["recall"] == pytest.approx(recall)
+        assert entry["nodes"] == len(FlatForest.from_sklearn(pruned).left)
+
+
+def test_choose_takes_the_smallest_forest_within_tolerance():
+    grid = [{"max_depth": 4, "n_trees": 1, "nodes": 10, "precision": 0.5, "recall": 0.9},
+            {"max_depth": 4, "n_trees": 2, "nodes": 20, "precision": 0.795, "recall": 0.7},
+            {"max_depth": None, "n_trees": 1, "nodes": 30, "precision": 0.8, "recall": 0.69},
+            {"max_depth": None, "n_trees": 2, "nodes": 60, "precision": 0.8, "recall": 0.7}]
+    full, chosen = choose(grid, tolerance=0.01)
+    assert full is grid[-1]
+    assert chosen is grid[1]
+    assert choose(grid, tolerance=0.0)[1] is grid[-1]
+
+
+def test_compact_model_returns_a_matching_pruned_model_and_forest(fitted):
+    model, X, y = fitted
+    pruned, compacted, report = compact_model(model, X, y, tolerance=0.05)
+    chosen = report["chosen"]
+    assert pruned.n_estimators == chosen["n_trees"] <= model.n_estimators
+    assert len(compacted.left) == chosen["nodes"]
+    assert compacted.value.dtype == np.float32 and compacted.threshold.dtype == np.float32
+    np.testing.assert_allclose(compacted.predict_proba(X.to_numpy()), pruned.predict_proba(X), atol=1e-6)
+    assert report["after"]["nodes"] <= report["before"]["nodes"]
+    assert report["after"]["precision"] >= report["before"]["precision"] - 0.05
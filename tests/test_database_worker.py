@@ -0,0 +1,195 @@
+# test_database_worker.py
+#
+# The database worker against the SQLite stand-in: bulk inserts, replay after a database
+# error, dead-lettering of bad records, and the size/latency flush triggers.
+
+import json
+import sqlite3
+import time
+
+import pytest
+
+from prediction_service import database_worker as worker
+from prediction_service.db_connection import FRAUD_DATA_COLUMNS, DatabaseConnection, connect_sqlite
+from prediction_service.record_codec import encode_records
+from prediction_service.segment_log import SegmentLogWriter
+
+
+def make_records(count, start=0):
+    return [{"customer": f"C{index}", "step": index, "age": "3", "gender": "M", "zipcodeOri": "28007",
+             "merchant": "M1", "zipMerchant": "28007", "category": "es_food", "amount": 10.0 + index,
+             "fraud": index % 2} for index in range(start, start + count)]
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """A fresh queue, dead-letter file and SQLite database for the worker's module state."""
+    monkeypatch.chdir(tmp_path)
+    database_path = str(tmp_path / "fraud.db")
+    monkeypatch.setattr(worker, "reader", None)
+    monkeypatch.setattr(worker, "database", DatabaseConnection(lambda: connect_sqlite(database_path)))
+    monkeypatch.setattr(worker, "totals", dict.fromkeys(worker.totals, 0))
+    yield tmp_path
+    worker.database.close()
+
+
+def enqueue(payloads):
+    writer = SegmentLogWriter(worker.TRANSACTION_QUEUE_DIR, fsync_interval_ms=0)
+    writer.append(payloads)
+    writer.close()
+
+
+def stored_rows(workspace):
+    conn = sqlite3.connect(str(workspace / "fraud.db"))
+    try:
+        return conn.execute(f"SELECT {', '.join(FRAUD_DATA_COLUMNS)} FROM fraud_data ORDER BY TransactionID").fetchall()
+    finally:
+        conn.close()
+
+
+def dead_letters(workspace):
+    path = workspace / worker.DEAD_LETTER_FILE
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+
+class CountingConnection:
+    """Wraps a sqlite3 connection to count executemany calls and their rows."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.batches = []
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __init__(self, cursor):
+                self.cursor = cursor
+
+            def executemany(self, sql, rows):
+                connection.batches.append(len(rows))
+                return self.cursor.executemany(sql, rows)
+
+            def execute(self, sql, row):
+                return self.cursor.execute(sql, row)
+
+        return Cursor(self.conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_rows_are_inserted_with_one_executemany_per_chunk(workspace):
+    conn = CountingConnection(connect_sqlite(str(workspace / "fraud.db")))
+    rows = [tuple(record[column] for column in FRAUD_DATA_COLUMNS) for record in make_records(2500)]
+    assert worker.insert_rows(conn, rows, chunk_size=1000) == []
+    conn.commit()
+    conn.close()
+    assert conn.batches == [1000, 1000, 500]
+    assert stored_rows(workspace) == rows
+
+
+def test_process_queue_stores_binary_and_json_payloads(workspace):
+    records = make_records(30)
+    enqueue(encode_records(records[:20], "binary") + encode_records(records[20:], "json"))
+
+    report = worker.process_queue()
+    assert (report["records"], report["rows"], report["dead_letters"], report["failed"]) == (30, 30, 0, False)
+    assert stored_rows(workspace) == [tuple(record[column] for column in FRAUD_DATA_COLUMNS) for record in records]
+    assert worker.totals["rows_inserted"] == 30 and worker.totals["fraud_rows"] == 15
+    assert worker.process_queue() is None  # committed: nothing is read twice
+
+
+def test_a_database_error_leaves_the_records_for_the_next_attempt(workspace, monkeypatch):
+    enqueue(encode_records(make_records(5), "binary"))
+    attempts = []
+
+    def unreachable():
+        attempts.append(1)
+        raise sqlite3.OperationalError("unable to open database file")
+
+    monkeypatch.setattr(worker.database, "connect", unreachable)
+    report = worker.process_queue()
+    assert report["failed"] and report["rows"] == 0
+    assert worker.totals["failed_flushes"] == 1
+    assert worker.process_queue()["failed"] and len(attempts) == 2  # rewound, so read again
+
+    monkeypatch.setattr(worker.database, "connect", lambda: connect_sqlite(str(workspace / "fraud.db")))
+    assert worker.process_queue()["rows"] == 5
+    assert len(stored_rows(workspace)) == 5
+    assert worker.process_queue() is None
+
+
+def test_bad_records_go_to_the_dead_letter_file_without_blocking_the_batch(workspace):
+    # Negative amounts violate a constraint of this table, as bad values would in SQL Server
+    conn = sqlite3.connect(str(workspace / "fraud.db"))
+    conn.execute("CREATE TABLE fraud_data (TransactionID INTEGER PRIMARY KEY AUTOINCREMENT, customer TEXT, "
+                 "step INTEGER, age TEXT, gender TEXT, zipcodeOri TEXT, merchant TEXT, zipMerchant TEXT, "
+                 "category TEXT, amount REAL CHECK (amount >= 0), fraud INTEGER)")
+    conn.commit()
+    conn.close()
+    records = make_records(6)
+    records[2]["amount"] = -1.0
+    enqueue(encode_records(records, "binary") + [b'{"customer": "C9"', b'{"customer": "C10"}'])
+
+    report = worker.process_queue()
+    assert report["rows"] == 5 and report["dead_letters"] == 3
+    assert [row[0] for row in stored_rows(workspace)] == ["C0", "C1", "C3", "C4", "C5"]
+    letters = dead_letters(workspace)
+    assert [letter["reason"].split(":")[0] for letter in letters] == ["JSONDecodeError", "KeyError", "IntegrityError"]
+    assert json.loads(letters[2]["record"])["customer"] == "C2"
+    assert worker.process_queue() is None
+
+
+class ScriptedListener:
+    """Stands in for QueueListener: announces counts from a script, then sleeps out the timeout."""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.timeouts = []
+
+    def wait(self, timeout):
+        self.timeouts.append(timeout)
+        if self.script:
+            return self.script.pop(0)
+        time.sleep(max(timeout, 0))
+        return 0
+
+    def close(self):
+        pass
+
+
+class Stop(Exception):
+    pass
+
+
+def run_until_flushes(monkeypatch, script, flushes):
+    """Runs run_worker until it has drained the queue `flushes` times; returns (flush times, start)."""
+    listener = ScriptedListener(script)
+    monkeypatch.setattr(worker, "QueueListener", lambda port: listener)
+    monkeypatch.setattr(worker, "POLL_INTERVAL_SECONDS", 10.0)
+    drained = []
+
+    def drain_queue():
+        drained.append(time.monotonic())
+        if len(drained) == flushes:
+            raise Stop()
+        return True
+
+    monkeypatch.setattr(worker, "drain_queue", drain_queue)
+    started = time.monotonic()
+    with pytest.raises(Stop):
+        worker.run_worker()
+    return drained, started
+
+
+def test_enough_announced_records_flush_at_once(monkeypatch):
+    drained, started = run_until_flushes(monkeypatch, [worker.FLUSH_SIZE_THRESHOLD // 2, worker.FLUSH_SIZE_THRESHOLD], 2)
+    # The first one is the start-up poll; the second needs no latency wait
+    assert drained[1] - started < worker.FLUSH_MAX_LATENCY_MS / 1000.0
+
+
+def test_a_few_records_flush_after_the_maximum_latency(monkeypatch):
+    drained, started = run_until_flushes(monkeypatch, [0, 1], 2)
+    max_latency = worker.FLUSH_MAX_LATENCY_MS / 1000.0
+    assert max_latency <= drained[1] - started < worker.POLL_INTERVAL_SECONDS
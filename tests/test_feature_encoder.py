@@ -0,0 +1,68 @@
+# test_feature_encoder.py
+#
+# The encoder must produce the same matrix as the pandas path it replaced
+# (pd.Categorical + pd.get_dummies(drop_first=True) + reindex to the model's columns).
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from prediction_service.feature_encoder import CATEGORICAL_FEATURES, FeatureEncoder
+from prediction_service.velocity import velocity_feature_names
+
+RECORDS = [
+    {"step": 1, "amount": 4.55, "age": "'4'", "gender": "'M'"},
+    {"step": 2, "amount": 39.68, "age": "2", "gender": "F"},
+    {"step": 3, "amount": 26.89, "age": "0", "gender": "E"},  # both dropped (drop_first) categories
+    {"step": 4, "amount": 17.25, "age": "9", "gender": "X"},  # unknown values
+    {"step": 5, "amount": 35.72, "age": "U", "gender": "U"},
+]
+
+
+def pandas_encoding(records, feature_names):
+    df = pd.DataFrame(records)
+    for column, values in CATEGORICAL_FEATURES.items():
+        values_seen = df[column].astype(str).str.strip("'")
+        df[column] = pd.Categorical(values_seen.where(values_seen.isin(values)), categories=values)
+    encoded = pd.get_dummies(df, columns=list(CATEGORICAL_FEATURES), drop_first=True)
+    return encoded.reindex(columns=feature_names, fill_value=0).to_numpy(dtype=np.float64)
+
+
+@pytest.fixture
+def encoder():
+    return FeatureEncoder.for_training(extra=[])
+
+
+def test_training_layout_drops_the_first_category():
+    assert FeatureEncoder.for_training(extra=[]).feature_names == [
+        "step", "amount", "age_1", "age_2", "age_3", "age_4", "age_5", "age_6", "age_U",
+        "gender_F", "gender_M", "gender_U"]
+    assert FeatureEncoder.for_training(extra=velocity_feature_names(7)).feature_names[2:9] == velocity_feature_names(7)
+
+
+def test_every_path_matches_pandas(encoder):
+    expected = pandas_encoding(RECORDS, encoder.feature_names)
+    np.testing.assert_array_equal(encoder.encode_many(RECORDS), expected)
+    np.testing.assert_array_equal(encoder.encode_frame(pd.DataFrame(RECORDS)), expected)
+    for record, row in zip(RECORDS, expected):
+        np.testing.assert_array_equal(encoder.encode_one(record)[0], row)
+
+
+def test_layout_follows_the_model_columns_in_any_order():
+    feature_names = ["gender_M", "amount", "age_4", "step", "gender_F"]
+    encoder = FeatureEncoder(feature_names, extra=[])
+    np.testing.assert_array_equal(encoder.encode_many(RECORDS), pandas_encoding(RECORDS, feature_names))
+
+
+def test_extra_features_are_copied_into_their_columns():
+    extra_names = velocity_feature_names(3)
+    encoder = FeatureEncoder.for_training(extra=extra_names)
+    extra = np.arange(len(RECORDS) * len(extra_names), dtype=np.float64).reshape(len(RECORDS), len(extra_names))
+    offsets = [encoder.feature_names.index(name) for name in extra_names]
+
+    np.testing.assert_array_equal(encoder.encode_many(RECORDS, extra)[:, offsets], extra)
+    np.testing.assert_array_equal(encoder.encode_one(RECORDS[1], extra[1:2])[0, offsets], extra[1])
+    frame = pd.DataFrame(RECORDS).assign(**{name: extra[:, index] for index, name in enumerate(extra_names)})
+    np.testing.assert_array_equal(encoder.encode_frame(frame), encoder.encode_many(RECORDS, extra))
+    # Without the matrix the columns stay at 0
+    assert not encoder.encode_many(RECORDS)[:, offsets].any()
@@ -0,0 +1,72 @@
+# test_feature_store.py
+#
+# A snapshot split over several step partitions reads back as the same matrix the encoder
+# builds from the table, whole, by step range or by sampled rows.
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_ingestion_and_retraining.feature_store import ID_COLUMN, FeatureStore, snapshot
+from data_ingestion_and_retraining.streaming_loader import STREAMING_QUERY
+from prediction_service.db_connection import INSERT_SQL, connect_sqlite
+from prediction_service.feature_encoder import FeatureEncoder
+
+
+@pytest.fixture
+def store(tmp_path):
+    """1000 rows over steps 0-35 (four partitions of 10 steps), written in chunks that straddle them."""
+    rng = np.random.default_rng(0)
+    steps = np.sort(rng.integers(0, 36, 1000))
+    conn = connect_sqlite(str(tmp_path / "fraud.db"))
+    conn.executemany(INSERT_SQL, [("C1", int(step), str(rng.integers(0, 7)), str(rng.choice(["F", "M"])), "28007",
+                                   "M1", "28007", "es_food", float(rng.uniform(1, 500)), int(rng.random() < 0.1))
+                                  for step in steps])
+    conn.commit()
+    directory = str(tmp_path / "feature_store")
+    stats = snapshot(conn, directory, partition_steps=10, chunk_size=77)
+    table = pd.read_sql(STREAMING_QUERY, conn).set_index(ID_COLUMN, drop=False)
+    conn.close()
+    assert stats == {**stats, "rows": 1000, "partitions": 4}
+    return FeatureStore(directory), table
+
+
+def expected(store, table, steps=None):
+    """The table's rows in the store's order (partition by partition), encoded directly."""
+    ids = np.concatenate([store.column(partition, ID_COLUMN) for partition in store.partitions(steps)])
+    rows = table.loc[ids]
+    return FeatureEncoder.for_training().encode_frame(rows).astype(np.float32), rows["fraud"].to_numpy()
+
+
+def test_load_matrix_concatenates_every_partition(store):
+    store, table = store
+    assert [p["name"] for p in store.partitions()] == [
+        "steps_000000-000009", "steps_000010-000019", "steps_000020-000029", "steps_000030-000039"]
+    X, y = store.load_matrix()
+    X_expected, y_expected = expected(store, table)
+    assert X.shape == (1000, len(store.feature_names))
+    np.testing.assert_array_equal(X, X_expected)
+    np.testing.assert_array_equal(y, y_expected)
+    np.testing.assert_array_equal(store.labels(), y_expected)
+
+
+def test_load_matrix_selects_partitions_by_step_range(store):
+    store, table = store
+    X, y = store.load_matrix(steps=(12, 27))
+    assert [p["first_step"] for p in store.partitions((12, 27))] == [10, 20]
+    X_expected, y_expected = expected(store, table, steps=(12, 27))
+    np.testing.assert_array_equal(X, X_expected)
+    np.testing.assert_array_equal(y, y_expected)
+    assert set(X[:, store.feature_names.index("step")]) <= set(range(10, 30))
+
+
+def test_load_matrix_gathers_rows_across_partitions(store):
+    store, _ = store
+    X_all, y_all = store.load_matrix()
+    rows = np.random.default_rng(1).choice(1000, 150, replace=False)
+    X, y = store.load_matrix(rows=rows)
+    ordered = np.sort(rows)  # rows come back in store order
+    np.testing.assert_array_equal(X, X_all[ordered])
+    np.testing.assert_array_equal(y, y_all[ordered])
+    steps = X[:, store.feature_names.index("step")]
+    assert len({int(step) // 10 for step in steps}) == 4
@@ -0,0 +1,63 @@
+# test_flat_forest.py
+#
+# The compiled forest must score exactly like the sklearn model it was built from.
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from prediction_service.flat_forest import FlatForest, SCORING_CHUNK_ROWS, export_flat_forest
+
+
+@pytest.fixture(scope="module")
+def fitted():
+    rng = np.random.default_rng(7)
+    X = pd.DataFrame(rng.normal(size=(600, 5)), columns=[f"f{i}" for i in range(5)])
+    y = ((X["f0"] + X["f1"] * X["f2"] + rng.normal(scale=0.5, size=len(X))) > 0.5).astype(int)
+    model = RandomForestClassifier(n_estimators=15, max_depth=8, random_state=0).fit(X, y)
+    return model, X
+
+
+def test_predict_proba_matches_sklearn(fitted):
+    model, X = fitted
+    forest = FlatForest.from_sklearn(model)
+    np.testing.assert_array_equal(forest.predict_proba(X.to_numpy()), model.predict_proba(X))
+    np.testing.assert_array_equal(forest.predict(X.to_numpy()), model.predict(X))
+    assert list(forest.feature_names_in_) == list(X.columns)
+
+
+def test_scoring_in_chunks_and_single_rows(fitted):
+    model, X = fitted
+    forest = FlatForest.from_sklearn(model)
+    rows = np.tile(X.to_numpy(), (SCORING_CHUNK_ROWS // len(X) + 2, 1))
+    np.testing.assert_array_equal(forest.predict_proba(rows), model.predict_proba(pd.DataFrame(rows, columns=X.columns)))
+    np.testing.assert_array_equal(forest.predict_proba(X.to_numpy()[0]), model.predict_proba(X.iloc[:1]))
+
+
+def test_save_and_memory_mapped_load(fitted, tmp_path):
+    model, X = fitted
+    path = str(tmp_path / "model.forest")
+    export_flat_forest(model, path)
+    export_flat_forest(model, path)  # replaces an existing directory
+    loaded = FlatForest.load(path)
+    assert loaded.n_estimators == model.n_estimators
+    assert loaded.max_depth == max(estimator.tree_.max_depth for estimator in model.estimators_)
+    np.testing.assert_array_equal(loaded.classes_, model.classes_)
+    np.testing.assert_array_equal(loaded.predict_proba(X.to_numpy()), model.predict_proba(X))
+
+
+def test_quantized_forest_takes_the_same_branches_for_float32_inputs(fitted):
+    model, X = fitted
+    forest = FlatForest.from_sklearn(model)
+    quantized = forest.quantized(np.float64)
+    assert quantized.threshold.dtype == np.float32
+    np.testing.assert_array_equal(quantized.predict_proba(X.to_numpy()), forest.predict_proba(X.to_numpy()))
+
+
+def test_multi_output_forests_are_rejected(fitted):
+    _, X = fitted
+    y = np.column_stack([X["f0"] > 0, X["f1"] > 0]).astype(int)
+    model = RandomForestClassifier(n_estimators=2, random_state=0).fit(X, y)
+    with pytest.raises(ValueError):
+        FlatForest.from_sklearn(model)
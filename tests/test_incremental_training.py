@@ -0,0 +1,76 @@
+# test_incremental_training.py
+#
+# Incremental retraining against the SQLite stand-in: each update streams only the new
+# rows, adds NEW_TREES_PER_UPDATE trees and retires the oldest ones beyond MAX_TREES.
+
+import joblib
+import numpy as np
+import pytest
+
+from data_ingestion_and_retraining import training_pipeline
+from data_ingestion_and_retraining.streaming_loader import TrainingSample
+from prediction_service.db_connection import INSERT_SQL, connect_sqlite
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """A small, fast training configuration; the model, cache and registry go to the working directory."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(training_pipeline, "SAMPLE_SIZE", 300)
+    monkeypatch.setattr(training_pipeline, "N_ESTIMATORS", 10)
+    monkeypatch.setattr(training_pipeline, "NEW_TREES_PER_UPDATE", 5)
+    monkeypatch.setattr(training_pipeline, "MAX_TREES", 18)
+    monkeypatch.setattr(training_pipeline, "TRAINING_N_JOBS", 1)
+    monkeypatch.setattr(training_pipeline, "COMPACTION_ENABLED", False)
+    return tmp_path
+
+
+def insert_rows(workspace, count, seed):
+    rng = np.random.default_rng(seed)
+    fraud = rng.random(count) < 0.2
+    amounts = np.where(fraud, rng.uniform(500, 2000, count), rng.uniform(1, 200, count))
+    conn = connect_sqlite(str(workspace / "fraud.db"))
+    conn.executemany(INSERT_SQL, [("C1", int(step), "3", "M", "28007", "M1", "28007", "es_food", float(amount), int(label))
+                                  for step, amount, label in zip(rng.integers(0, 100, count), amounts, fraud)])
+    conn.commit()
+    conn.close()
+
+
+def train(workspace):
+    assert training_pipeline.run_incremental_training(lambda: connect_sqlite(str(workspace / "fraud.db")))
+    return joblib.load(training_pipeline.MODEL_FILENAME)
+
+
+def thresholds(trees):
+    return [tree.tree_.threshold for tree in trees]
+
+
+def test_updates_add_new_trees_and_retire_the_oldest(workspace):
+    insert_rows(workspace, 1000, seed=0)
+    first = train(workspace)  # no cache yet: a full training run
+    assert len(first.estimators_) == 10
+    assert TrainingSample.saved_high_water_mark(training_pipeline.TRAINING_CACHE_DIR) == 1000
+
+    insert_rows(workspace, 400, seed=1)
+    second = train(workspace)
+    assert len(second.estimators_) == 15
+    assert TrainingSample.saved_high_water_mark(training_pipeline.TRAINING_CACHE_DIR) == 1400
+    for kept, previous in zip(thresholds(second.estimators_[:10]), thresholds(first.estimators_)):
+        np.testing.assert_array_equal(kept, previous)
+
+    insert_rows(workspace, 400, seed=2)
+    third = train(workspace)
+    # 15 + 5 trees, capped at 18: the two oldest go, the newest five are last
+    assert len(third.estimators_) == 18
+    assert third.n_estimators == 18 and not third.warm_start
+    for kept, previous in zip(thresholds(third.estimators_[:13]), thresholds(second.estimators_[2:])):
+        np.testing.assert_array_equal(kept, previous)
+
+
+def test_no_new_rows_leaves_the_model_alone(workspace):
+    insert_rows(workspace, 1000, seed=0)
+    train(workspace)
+    saved = (workspace / training_pipeline.MODEL_FILENAME).stat().st_mtime_ns
+    model = train(workspace)
+    assert len(model.estimators_) == 10
+    assert (workspace / training_pipeline.MODEL_FILENAME).stat().st_mtime_ns == saved
@@ -0,0 +1,95 @@
+# test_metrics.py
+#
+# The Prometheus exposition: buckets are cumulative, every histogram's _count matches its
+# +Inf bucket, and concurrent observations are not lost.
+
+import re
+import threading
+
+from prediction_service.metrics import Histogram, MetricsRegistry
+
+SAMPLE_LINE = re.compile(r'^(?P<name>[a-z_]+)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+
+
+def parse(text):
+    """{(name, frozenset of label pairs): value} for every sample line of a scrape."""
+    samples = {}
+    for line in text.splitlines():
+        if not line or line.startswith("#"):
+            continue
+        match = SAMPLE_LINE.match(line)
+        assert match, f"not a Prometheus sample line: {line!r}"
+        labels = frozenset(re.findall(r'(\w+)="([^"]*)"', match["labels"] or ""))
+        samples[(match["name"], labels)] = float(match["value"])
+    return samples
+
+
+def check_histograms(samples):
+    """Asserts the invariants of every histogram in a scrape; returns how many there were."""
+    checked = 0
+    for (name, labels), count in samples.items():
+        if not name.endswith("_count"):
+            continue
+        family = name[:-len("_count")]
+        buckets = []
+        for (bucket_name, bucket_labels), value in samples.items():
+            bound = dict(bucket_labels).get("le")
+            if bucket_name == family + "_bucket" and bucket_labels - {("le", bound)} == labels:
+                buckets.append((float(bound), value))
+        buckets.sort()
+        assert buckets, f"{family} has no buckets"
+        values = [value for _, value in buckets]
+        assert values == sorted(values), f"{family} buckets are not cumulative"
+        assert buckets[-1][0] == float("inf")
+        assert buckets[-1][1] == count
+        checked += 1
+    return checked
+
+
+def test_rendered_histograms_are_cumulative_and_consistent():
+    registry = MetricsRegistry()
+    latency = {stage: registry.histogram("test_stage_milliseconds", "Stage latency.", buckets=[1.0, 5.0, 10.0], stage=stage)
+               for stage in ("encode", "score")}
+    registry.gauge("test_queue_depth", "Queue depth.", lambda: 3)
+    registry.gauge("test_unknown", "Not measured yet.", lambda: None)
+    for value in (0.5, 1.0, 2.0, 7.5, 40.0):
+        latency["encode"].observe(value)
+    latency["score"].observe(3.0)
+
+    samples = parse(registry.render())
+    assert check_histograms(samples) == 2
+    encode = frozenset({("stage", "encode")})
+    assert samples[("test_stage_milliseconds_bucket", encode | {("le", "1.0")})] == 2  # le: 0.5 and 1.0
+    assert samples[("test_stage_milliseconds_bucket", encode | {("le", "5.0")})] == 3
+    assert samples[("test_stage_milliseconds_bucket", encode | {("le", "10.0")})] == 4
+    assert samples[("test_stage_milliseconds_count", encode)] == 5
+    assert samples[("test_stage_milliseconds_sum", encode)] == 51.0
+    assert samples[("test_queue_depth", frozenset())] == 3
+    assert ("test_unknown", frozenset()) not in samples
+
+
+def test_concurrent_observations_are_all_counted():
+    histogram = Histogram([1.0, 10.0])
+    threads = [threading.Thread(target=lambda: [histogram.observe(value % 20) for value in range(20000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == snapshot["buckets"]["+Inf"] == 160000
+    assert snapshot["buckets"]["1.0"] == 8 * 2000  # 0 and 1
+    assert snapshot["sum"] == 8 * 1000 * sum(range(20))
+
+
+def test_the_api_metrics_endpoint(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from prediction_service import main
+
+    for value in (0.02, 0.3, 4.0):
+        main.stage_ms["encode"].observe(value)
+    samples = parse(main.prometheus_metrics().body.decode())
+    assert check_histograms(samples) >= len(main.stage_ms)
+    encode = frozenset({("stage", "encode")})
+    assert samples[("fraud_api_stage_milliseconds_count", encode)] >= 3
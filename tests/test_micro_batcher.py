@@ -0,0 +1,174 @@
+# test_micro_batcher.py
+#
+# Concurrent submissions are scored together, each caller gets its own result, a full
+# queue sheds load instead of growing, and stopping fails the requests it leaves behind.
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from prediction_service.micro_batcher import BatcherOverloaded, BatcherStopped, MicroBatcher
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_concurrent_requests_are_scored_in_one_batch():
+    batches = []
+
+    def double(records):
+        batches.append(list(records))
+        return [record * 2 for record in records]
+
+    async def scenario():
+        batcher = MicroBatcher(double, max_batch_size=8, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(value) for value in range(5)))
+        await batcher.stop()
+        return results, batcher.stats()
+
+    results, stats = run(scenario())
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [[0, 1, 2, 3, 4]]
+    assert stats["batch_size"]["count"] == 1
+
+
+def test_batches_are_cut_at_the_maximum_size():
+    sizes = []
+
+    def score(records):
+        sizes.append(len(records))
+        return records
+
+    async def scenario():
+        batcher = MicroBatcher(score, max_batch_size=4, max_wait_ms=50)
+        results = await asyncio.gather(*(batcher.submit(value) for value in range(10)))
+        await batcher.stop()
+        return results
+
+    assert run(scenario()) == list(range(10))
+    assert sizes == [4, 4, 2]
+
+
+def test_a_failing_batch_fails_only_its_own_callers():
+    def score(records):
+        if "bad" in records:
+            raise ValueError("cannot score")
+        return records
+
+    async def scenario():
+        batcher = MicroBatcher(score, max_batch_size=2, max_wait_ms=50)
+        outcomes = await asyncio.gather(*(batcher.submit(value) for value in ("bad", "a", "b", "c")),
+                                        return_exceptions=True)
+        await batcher.stop()
+        return outcomes
+
+    outcomes = run(scenario())
+    assert isinstance(outcomes[0], ValueError) and isinstance(outcomes[1], ValueError)
+    assert outcomes[2:] == ["b", "c"]
+
+
+def test_a_full_queue_rejects_requests():
+    release = threading.Event()
+
+    def slow(records):
+        release.wait(5)
+        return records
+
+    async def scenario():
+        batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0, max_queue_depth=2)
+        first = asyncio.ensure_future(batcher.submit(0))
+        await asyncio.sleep(0.05)  # the first request is being scored
+        queued = [asyncio.ensure_future(batcher.submit(value)) for value in (1, 2)]
+        await asyncio.sleep(0)
+        with pytest.raises(BatcherOverloaded):
+            await batcher.submit(3)
+        release.set()
+        results = await asyncio.gather(first, *queued)
+        await batcher.stop()
+        return results, batcher.stats()["rejected"]
+
+    assert run(scenario()) == ([0, 1, 2], 1)
+
+
+def test_batches_are_scored_concurrently_up_to_the_limit():
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def score(records):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.05)
+        with lock:
+            active[0] -= 1
+        return records
+
+    async def scenario(concurrent):
+        executor = ThreadPoolExecutor(max_workers=4)
+        batcher = MicroBatcher(score, max_batch_size=1, max_wait_ms=0, executor=executor,
+                               max_concurrent_batches=concurrent)
+        results = await asyncio.gather(*(batcher.submit(value) for value in range(8)))
+        await batcher.stop()
+        executor.shutdown()
+        return results
+
+    assert run(scenario(1)) == list(range(8))
+    assert peak[0] == 1
+    peak[0] = 0
+    assert run(scenario(4)) == list(range(8))
+    assert 1 < peak[0] <= 4
+
+
+def test_stop_waits_for_batches_being_scored():
+    def slow(records):
+        time.sleep(0.05)
+        return records
+
+    async def scenario():
+        batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0)
+        pending = asyncio.ensure_future(batcher.submit("kept"))
+        await asyncio.sleep(0.01)
+        await batcher.stop()
+        assert pending.done()
+        return pending.result()
+
+    assert run(scenario()) == "kept"
+
+
+def test_stop_fails_requests_still_in_the_queue():
+    def slow(records):
+        time.sleep(0.05)
+        return records
+
+    async def scenario():
+        batcher = MicroBatcher(slow, max_batch_size=1, max_wait_ms=0)
+        scored = asyncio.ensure_future(batcher.submit("kept"))
+        await asyncio.sleep(0.01)  # being scored, so the next requests wait in the queue
+        queued = [asyncio.ensure_future(batcher.submit(value)) for value in ("a", "b")]
+        await asyncio.sleep(0)
+        assert batcher.queue_depth() == 2
+        await batcher.stop()
+        assert batcher.queue_depth() == 0
+        return await asyncio.wait_for(asyncio.gather(scored, *queued, return_exceptions=True), 1)
+
+    outcomes = run(scenario())
+    assert outcomes[0] == "kept"
+    assert all(isinstance(outcome, BatcherStopped) for outcome in outcomes[1:])
+
+
+def test_stop_fails_a_batch_still_being_collected():
+    scored = []
+
+    async def scenario():
+        batcher = MicroBatcher(scored.extend, max_batch_size=8, max_wait_ms=5000)
+        pending = [asyncio.ensure_future(batcher.submit(value)) for value in range(3)]
+        await asyncio.sleep(0.01)  # taken off the queue, waiting for the batch to fill
+        assert batcher.queue_depth() == 0
+        await batcher.stop()
+        return await asyncio.wait_for(asyncio.gather(*pending, return_exceptions=True), 1)
+
+    assert all(isinstance(outcome, BatcherStopped) for outcome in run(scenario()))
+    assert scored == []
@@ -0,0 +1,145 @@
+# test_model_registry.py
+#
+# Publishing versions, pruning old ones, candidates and their promotion, and the watcher that hands new ones to the API.
+
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+
+from prediction_service.flat_forest import COMPACT_MODEL_FILENAME, FlatForest
+from prediction_service.model_registry import (CANDIDATE_FILENAME, MODEL_FILENAME, ModelWatcher, candidate_version,
+                                               current_version, discard_candidate, list_versions, promote_candidate,
+                                               publish_model, version_path)
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(3)
+    X = pd.DataFrame(rng.normal(size=(200, 3)), columns=["a", "b", "c"])
+    return X, (X["a"] > 0).astype(int)
+
+
+@pytest.fixture(scope="module")
+def forest(data):
+    return RandomForestClassifier(n_estimators=3, max_depth=4, random_state=0).fit(*data)
+
+
+def test_publish_writes_a_complete_version_and_moves_current(tmp_path, forest, data):
+    registry = str(tmp_path)
+    assert current_version(registry) is None
+    assert publish_model(forest, registry) == "v000001"
+    assert publish_model(forest, registry) == "v000002"
+
+    record = current_version(registry)
+    assert record["version"] == "v000002"
+    assert record["family"] == "RandomForestClassifier"
+    assert record["n_estimators"] == 3
+    assert not [name for name in os.listdir(registry) if name.endswith(('.building', '.tmp'))]
+
+    X, _ = data
+    loaded = joblib.load(version_path(registry, "v000002", MODEL_FILENAME))
+    compact = FlatForest.load(version_path(registry, "v000002", COMPACT_MODEL_FILENAME))
+    np.testing.assert_array_equal(compact.predict_proba(X.to_numpy()), loaded.predict_proba(X))
+
+
+def test_other_model_families_are_published_pickled_only(tmp_path, data):
+    registry = str(tmp_path)
+    version = publish_model(LogisticRegression().fit(*data), registry)
+    assert os.path.exists(version_path(registry, version, MODEL_FILENAME))
+    assert not os.path.exists(version_path(registry, version, COMPACT_MODEL_FILENAME))
+    assert current_version(registry)["n_estimators"] is None
+
+
+def test_old_versions_are_pruned(tmp_path, forest):
+    registry = str(tmp_path)
+    for _ in range(5):
+        publish_model(forest, registry, keep=2)
+    assert list_versions(registry) == ["v000004", "v000005"]
+    # Numbering continues after pruning
+    assert publish_model(forest, registry, keep=2) == "v000006"
+
+
+def test_watcher_hands_each_new_version_over_once(tmp_path, forest):
+    registry = str(tmp_path)
+    publish_model(forest, registry)
+    loaded = []
+    watcher = ModelWatcher(lambda record: loaded.append(record["version"]), registry_dir=registry)
+    watcher.seen_version = current_version(registry)["version"]
+
+    assert not watcher.check()
+    publish_model(forest, registry)
+    assert watcher.check()
+    assert not watcher.check()
+    assert loaded == ["v000002"]
+
+
+def test_watcher_keeps_the_error_of_a_version_that_fails_to_load(tmp_path, forest):
+    registry = str(tmp_path)
+    publish_model(forest, registry)
+
+    def fail(record):
+        raise RuntimeError("corrupt artifact")
+
+    watcher = ModelWatcher(fail, registry_dir=registry)
+    assert not watcher.check()
+    assert watcher.last_error["version"] == "v000001"
+    assert "corrupt artifact" in watcher.last_error["error"]
+    assert not watcher.check()  # not retried until the pointer changes
+
+
+def test_candidate_is_published_without_going_live(tmp_path, forest):
+    registry = str(tmp_path)
+    publish_model(forest, registry)
+    assert publish_model(forest, registry, as_candidate=True) == "v000002"
+    assert current_version(registry)["version"] == "v000001"
+    assert candidate_version(registry)["version"] == "v000002"
+
+
+def test_promotion_makes_the_candidate_current(tmp_path, forest):
+    registry = str(tmp_path)
+    assert promote_candidate(registry) is None
+    publish_model(forest, registry)
+    publish_model(forest, registry, as_candidate=True)
+
+    record = promote_candidate(registry)
+    assert record["version"] == "v000002" and "promoted" in record
+    assert current_version(registry)["version"] == "v000002"
+    assert candidate_version(registry) is None
+
+
+def test_discarding_the_candidate_keeps_current(tmp_path, forest):
+    registry = str(tmp_path)
+    publish_model(forest, registry)
+    publish_model(forest, registry, as_candidate=True)
+    discard_candidate(registry)
+    discard_candidate(registry)  # already gone
+    assert candidate_version(registry) is None
+    assert current_version(registry)["version"] == "v000001"
+
+
+def test_pruning_never_removes_the_current_or_candidate_version(tmp_path, forest):
+    registry = str(tmp_path)
+    publish_model(forest, registry)
+    publish_model(forest, registry, as_candidate=True)
+    for _ in range(3):
+        publish_model(forest, registry, keep=1, as_candidate=True)
+    assert list_versions(registry) == ["v000001", "v000005"]
+    assert current_version(registry)["version"] == "v000001"
+
+
+def test_candidate_watcher_reports_a_withdrawn_candidate(tmp_path, forest):
+    registry = str(tmp_path)
+    seen, removed = [], []
+    watcher = ModelWatcher(lambda record: seen.append(record["version"]), registry_dir=registry,
+                           pointer=CANDIDATE_FILENAME, on_removed=lambda: removed.append(True))
+    publish_model(forest, registry, as_candidate=True)
+    assert watcher.check()
+    discard_candidate(registry)
+    assert not watcher.check()
+    assert not watcher.check()
+    assert seen == ["v000001"] and removed == [True]
@@ -0,0 +1,113 @@
+# test_prediction_cache.py
+#
+# LRU eviction, TTL expiry, and keys that tie a cached score to the model version that
+# produced it, so a hot-swapped model never serves a stale result.
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+from prediction_service import prediction_cache as prediction_cache_module
+from prediction_service.feature_encoder import FeatureEncoder
+from prediction_service.model_registry import MODEL_REGISTRY_DIR, publish_model
+from prediction_service.prediction_cache import PredictionCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prediction_cache_module, "time", clock)
+    return clock
+
+
+def keys(version, rows):
+    return PredictionCache.keys_for(version, np.asarray(rows, dtype=np.float64))
+
+
+def test_hits_and_misses():
+    cache = PredictionCache(max_entries=10)
+    first, second = keys("v1", [[1.0, 2.0], [3.0, 4.0]])
+    cache.put_many([first], [1], [0.9])
+    assert cache.get_many([first, second]) == [(1, 0.9), None]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_least_recently_used_entries_are_evicted_at_capacity():
+    cache = PredictionCache(max_entries=2)
+    a, b, c = keys("v1", [[1.0], [2.0], [3.0]])
+    cache.put_many([a, b], [0, 0], [0.1, 0.2])
+    cache.get_many([a])  # b is now the least recently used
+    cache.put_many([c], [1], [0.7])
+    assert len(cache) == 2
+    assert cache.get_many([a, b, c]) == [(0, 0.1), None, (1, 0.7)]
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = PredictionCache(max_entries=10, ttl_seconds=5.0)
+    key, = keys("v1", [[1.0]])
+    cache.put_many([key], [1], [0.8])
+    clock.now += 4.9
+    assert cache.get_many([key]) == [(1, 0.8)]
+    clock.now += 0.2
+    assert cache.get_many([key]) == [None]
+    assert len(cache) == 0 and cache.stats()["expired"] == 1
+
+
+def test_keys_depend_on_the_model_version_and_the_exact_row():
+    cache = PredictionCache(max_entries=10)
+    row = [[20.0, 2500.0, 1.0]]
+    cache.put_many(keys("v1", row), [1], [0.9])
+    assert cache.get_many(keys("v2", row)) == [None]
+    assert cache.get_many(keys("v1", [[20.0, 2500.0000001, 1.0]])) == [None]
+    assert cache.get_many(keys("v1", row)) == [(1, 0.9)]
+
+
+def test_a_zero_size_cache_is_disabled():
+    assert not PredictionCache(max_entries=0).enabled
+
+
+def test_clear_counts_an_invalidation():
+    cache = PredictionCache(max_entries=10)
+    cache.put_many(keys("v1", [[1.0]]), [0], [0.1])
+    cache.clear()
+    assert len(cache) == 0 and cache.stats()["invalidations"] == 1
+
+
+def test_a_hot_swap_never_serves_the_previous_models_scores(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    from prediction_service import main
+
+    feature_names = FeatureEncoder.for_training(extra=[]).feature_names
+    rng = np.random.default_rng(0)
+    X = pd.DataFrame(np.zeros((200, len(feature_names))), columns=feature_names)
+    X["amount"] = rng.random(len(X))  # the only column the trees can split on
+    y = (X["amount"] > 0.5).astype(int)
+    publish_model(RandomForestClassifier(n_estimators=3, random_state=0).fit(X, y), MODEL_REGISTRY_DIR)
+    monkeypatch.setattr(main, "active", None)
+    monkeypatch.setattr(main, "prediction_cache", PredictionCache(max_entries=100))
+    main.load_model()
+
+    transaction = dict(main.WARMUP_TRANSACTION, amount=0.9)
+    features = main.encode_transactions([transaction], main.active, observe=False)
+    assert main.score_cached(features, main.active)[0].tolist() == [1]
+    assert main.score_cached(features, main.active)[0].tolist() == [1]
+    assert main.prediction_cache.hits == 1
+
+    # The new version labels everything the other way round
+    flipped = RandomForestClassifier(n_estimators=3, random_state=0).fit(X, 1 - y)
+    main.swap_model({"version": publish_model(flipped, MODEL_REGISTRY_DIR)})
+    assert len(main.prediction_cache) == 0
+    assert main.prediction_cache.stats()["invalidations"] == 1
+    features = main.encode_transactions([transaction], main.active, observe=False)
+    assert main.score_cached(features, main.active)[0].tolist() == [0]
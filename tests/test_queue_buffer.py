@@ -0,0 +1,100 @@
+# test_queue_buffer.py
+#
+# Buffered queue writes: coalescing, retry without loss or reordering, and append_and_wait.
+
+import asyncio
+import threading
+
+from prediction_service import queue_buffer as queue_buffer_module
+from prediction_service.queue_buffer import QueueBuffer
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_without_a_flusher_records_are_written_directly():
+    written = []
+    buffer = QueueBuffer(written.extend)
+    buffer.append([1, 2])
+    assert written == [1, 2]
+    run(buffer.append_and_wait([3]))
+    assert written == [1, 2, 3]
+
+
+def test_appends_from_scoring_threads_are_coalesced():
+    flushes = []
+
+    async def scenario():
+        buffer = QueueBuffer(lambda records: flushes.append(list(records)))
+        buffer.start()
+        threads = [threading.Thread(target=buffer.append, args=([value],)) for value in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        await buffer.stop()
+        return buffer.stats()
+
+    stats = run(scenario())
+    assert sorted(record for flush in flushes for record in flush) == list(range(20))
+    assert stats["flushed_records"] == 20 and stats["buffered_records"] == 0
+    assert stats["flushes"] == len(flushes)
+
+
+def test_failed_writes_are_retried_in_order(monkeypatch):
+    monkeypatch.setattr(queue_buffer_module, "RETRY_DELAY_SECONDS", 0.01)
+    written, failures = [], [2]
+
+    def flaky(records):
+        if failures[0]:
+            failures[0] -= 1
+            raise OSError("disk full")
+        written.extend(records)
+
+    async def scenario():
+        buffer = QueueBuffer(flaky)
+        buffer.start()
+        buffer.append([1, 2])
+        await asyncio.sleep(0)
+        buffer.append([3])
+        await buffer.append_and_wait([4])
+        await buffer.stop()
+        return buffer.stats()
+
+    stats = run(scenario())
+    assert written == [1, 2, 3, 4]
+    assert stats["flush_errors"] == 2
+
+
+def test_append_and_wait_returns_after_the_write():
+    release, written = threading.Event(), []
+
+    def slow(records):
+        release.wait(5)
+        written.extend(records)
+
+    async def scenario():
+        buffer = QueueBuffer(slow)
+        buffer.start()
+        waiting = asyncio.ensure_future(buffer.append_and_wait(["a"]))
+        await asyncio.sleep(0.05)
+        assert not waiting.done() and written == []
+        release.set()
+        await waiting
+        assert written == ["a"]
+        await buffer.stop()
+
+    run(scenario())
+
+
+def test_a_full_buffer_reports_it():
+    async def scenario():
+        buffer = QueueBuffer(lambda records: None, max_buffered_records=3)
+        buffer.start()
+        buffer.append([1, 2, 3])
+        full = buffer.is_full()
+        await buffer.stop()
+        return full, buffer.is_full()
+
+    assert run(scenario()) == (True, False)
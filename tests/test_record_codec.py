@@ -0,0 +1,113 @@
+# test_record_codec.py
+#
+# Round-trips of queue payloads in both record formats, and rejection of damaged binary frames.
+
+import base64
+import json
+import struct
+
+import pytest
+
+from prediction_service.db_connection import FRAUD_DATA_COLUMNS
+from prediction_service.record_codec import (RECORDS_PER_FRAME, decode_frame, decode_records, encode_records,
+                                             is_binary, payload_text, record_count)
+
+
+def make_records(count):
+    return [{"customer": f"C{index % 7}", "step": index, "age": str(index % 6), "gender": "F",
+             "zipcodeOri": "28007", "merchant": f"M{index % 3}", "zipMerchant": "28007",
+             "category": "es_transportation", "amount": index * 1.25, "fraud": index % 2}
+            for index in range(count)]
+
+
+def test_binary_round_trip_keeps_values_and_types():
+    records = make_records(50)
+    payloads = encode_records(records, "binary")
+    assert len(payloads) == 1 and is_binary(payloads[0])
+    assert record_count(payloads[0]) == 50
+    decoded = decode_records(payloads[0])
+    assert decoded == records
+    assert list(decoded[0]) == list(FRAUD_DATA_COLUMNS)
+    assert type(decoded[3]["step"]) is int and type(decoded[3]["amount"]) is float
+
+
+def test_binary_frames_are_columns_for_the_worker():
+    records = make_records(4)
+    columns = decode_frame(encode_records(records, "binary")[0])
+    assert columns["merchant"] == ["M0", "M1", "M2", "M0"]
+    assert columns["fraud"] == [0, 1, 0, 1]
+
+
+def test_binary_is_smaller_than_json():
+    records = make_records(100)
+    binary = sum(map(len, encode_records(records, "binary")))
+    assert binary * 3 < sum(map(len, encode_records(records, "json")))
+
+
+def test_non_ascii_strings_and_large_dictionaries():
+    records = make_records(3)
+    records[0]["merchant"] = "Müller & Söhne"
+    records[1]["category"] = "x" * 1000
+    assert decode_records(encode_records(records, "binary")[0]) == records
+
+    # More distinct strings than a uint16 code can index
+    many = make_records(12000)
+    for index, record in enumerate(many):
+        record["customer"], record["merchant"] = f"C{index}", f"M{index}"
+    payloads = encode_records(many, "binary")
+    assert [record for payload in payloads for record in decode_records(payload)] == many
+
+
+def test_large_flushes_are_split_into_frames():
+    records = make_records(RECORDS_PER_FRAME * 2 + 1)
+    payloads = encode_records(records, "binary")
+    assert [record_count(payload) for payload in payloads] == [RECORDS_PER_FRAME, RECORDS_PER_FRAME, 1]
+    assert [record for payload in payloads for record in decode_records(payload)] == records
+
+
+def test_json_format_writes_one_record_per_payload():
+    records = make_records(3)
+    payloads = encode_records(records, "json")
+    assert [json.loads(payload) for payload in payloads] == records
+    assert [record_count(payload) for payload in payloads] == [1, 1, 1]
+    assert decode_records(payloads[1]) == [records[1]]
+
+
+def test_records_the_binary_format_cannot_hold_fall_back_to_json():
+    records = make_records(2)
+    del records[1]["merchant"]
+    payloads = encode_records(records, "binary")
+    assert not any(map(is_binary, payloads))
+    assert [json.loads(payload) for payload in payloads] == records
+
+    records = make_records(1)
+    records[0]["step"] = 2 ** 40
+    assert not is_binary(encode_records(records, "binary")[0])
+
+
+@pytest.mark.parametrize("damage", [
+    lambda payload: payload[:3],                          # truncated header
+    lambda payload: payload[:-1],                         # truncated dictionary
+    lambda payload: payload + b"x",                       # trailing bytes
+    lambda payload: payload[:1] + b"\x09" + payload[2:],  # unknown version
+])
+def test_damaged_frames_are_rejected(damage):
+    payload = encode_records(make_records(5), "binary")[0]
+    with pytest.raises(ValueError):
+        decode_frame(damage(payload))
+
+
+def test_codes_outside_the_dictionary_are_rejected():
+    payload = bytearray(encode_records(make_records(1), "binary")[0])
+    # The last code sits just before the dictionary strings
+    strings = sum(len(value.encode()) for value in set(decode_records(bytes(payload))[0].values()) if isinstance(value, str))
+    struct.pack_into('<H', payload, len(payload) - strings - 2, 500)
+    with pytest.raises(ValueError, match="outside its dictionary"):
+        decode_frame(bytes(payload))
+
+
+def test_payload_text_is_printable_for_both_formats():
+    binary = encode_records(make_records(2), "binary")[0]
+    assert base64.b64decode(payload_text(binary)[len("base64:"):]) == binary
+    json_payload = encode_records(make_records(1), "json")[0]
+    assert payload_text(json_payload) == json_payload.decode()
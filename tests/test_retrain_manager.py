@@ -0,0 +1,152 @@
+# test_retrain_manager.py
+#
+# When the retrain scheduler decides to train: from worker counters, from the high-water
+# mark when there are none, and by volume, time and drift.
+
+import json
+import time
+
+import pytest
+
+from data_ingestion_and_retraining import retrain_manager
+from data_ingestion_and_retraining.retrain_manager import RetrainScheduler, load_state
+from prediction_service.db_connection import FRAUD_DATA_COLUMNS, INSERT_SQL, connect_sqlite
+from prediction_service.queue_notify import write_status
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    """An empty SQLite stand-in and queue directory; training_cache/ is looked up in the working directory."""
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "queue").mkdir()
+    return tmp_path
+
+
+class FakeTraining:
+    def __init__(self, succeeds=True):
+        self.succeeds = succeeds
+        self.calls = []
+
+    def __call__(self, sqlite):
+        self.calls.append(sqlite)
+        return self.succeeds
+
+
+def scheduler(workspace, train):
+    database = str(workspace / "fraud.db")
+    return RetrainScheduler(connect=lambda: connect_sqlite(database), sqlite=database,
+                            state_file=str(workspace / "state.json"), queue_directory=str(workspace / "queue"),
+                            train=train)
+
+
+def worker_status(workspace, rows, fraud=0, amount=0.0, started_at=1.0):
+    write_status(str(workspace / "queue"), {"started_at": started_at, "rows_inserted": rows,
+                                            "fraud_rows": fraud, "amount_sum": amount})
+
+
+def insert_rows(workspace, count):
+    conn = connect_sqlite(str(workspace / "fraud.db"))
+    row = ("C1", 1, "2", "F", "28007", "M1", "28007", "es_food", 10.0, 0)
+    assert len(row) == len(FRAUD_DATA_COLUMNS)
+    conn.executemany(INSERT_SQL, [row] * count)
+    conn.commit()
+    conn.close()
+
+
+def test_worker_counters_trigger_a_volume_retrain(workspace, monkeypatch):
+    monkeypatch.setattr(retrain_manager, "RETRAIN_THRESHOLD", 100)
+    train = FakeTraining()
+    retrain = scheduler(workspace, train)
+    worker_status(workspace, rows=5000)  # earlier rows: only the baseline
+    assert not retrain.check()
+    worker_status(workspace, rows=5060)
+    assert not retrain.check()
+    assert retrain.state["since_training"]["rows"] == 60
+
+    worker_status(workspace, rows=5150)
+    assert retrain.check()
+    assert train.calls == [str(workspace / "fraud.db")]
+    saved = json.loads((workspace / "state.json").read_text())
+    assert saved["trainings"] == 1
+    assert saved["since_training"]["rows"] == 0
+    assert saved["last_training"]["reason"] == "volume: 150 new rows"
+
+
+def test_a_restarted_worker_becomes_the_new_baseline(workspace):
+    retrain = scheduler(workspace, FakeTraining())
+    worker_status(workspace, rows=500)
+    retrain.check()
+    worker_status(workspace, rows=20, started_at=2.0)
+    retrain.check()
+    assert retrain.state["since_training"]["rows"] == 0
+    worker_status(workspace, rows=50, started_at=2.0)
+    retrain.check()
+    assert retrain.state["since_training"]["rows"] == 30
+
+
+def test_without_a_worker_status_rows_come_from_the_high_water_mark(workspace, monkeypatch):
+    monkeypatch.setattr(retrain_manager, "RETRAIN_THRESHOLD", 100)
+    train = FakeTraining()
+    retrain = scheduler(workspace, train)
+    insert_rows(workspace, 40)
+    assert not retrain.check()
+    assert retrain.state["since_training"]["rows"] == 40
+
+    insert_rows(workspace, 70)
+    worker_status(workspace, rows=0)
+    status = json.loads((workspace / "queue" / "database_worker.status").read_text())
+    status["updated"] = time.time() - retrain_manager.STATUS_STALE_SECONDS - 1
+    (workspace / "queue" / "database_worker.status").write_text(json.dumps(status))
+    assert retrain.check()
+    assert len(train.calls) == 1
+
+
+def test_no_retrain_sooner_than_the_minimum_interval(workspace, monkeypatch):
+    monkeypatch.setattr(retrain_manager, "RETRAIN_THRESHOLD", 10)
+    retrain = scheduler(workspace, FakeTraining())
+    retrain.state["since_training"]["rows"] = 1000
+    retrain.state["trained_at"] = time.time() - retrain_manager.MIN_INTERVAL_SECONDS / 2
+    assert retrain.due() is None
+    assert retrain.due(now=retrain.state["trained_at"] + retrain_manager.MIN_INTERVAL_SECONDS) == "volume: 1000 new rows"
+
+
+def test_a_few_rows_trigger_a_retrain_after_the_maximum_interval(workspace):
+    retrain = scheduler(workspace, FakeTraining())
+    retrain.state["trained_at"] = time.time()
+    later = retrain.state["trained_at"] + retrain_manager.MAX_INTERVAL_SECONDS
+    assert retrain.due(now=later) is None
+    retrain.state["since_training"]["rows"] = 3
+    assert retrain.due(now=later).startswith("time: 3 new rows")
+
+
+def test_drift_from_the_previous_window_triggers_a_retrain(workspace, monkeypatch):
+    monkeypatch.setattr(retrain_manager, "DRIFT_MIN_ROWS", 100)
+    retrain = scheduler(workspace, FakeTraining())
+    worker_status(workspace, rows=0)
+    retrain.check()
+    worker_status(workspace, rows=200, fraud=2, amount=200 * 40.0)
+    retrain.observe_worker()
+    retrain.retrain("first")
+    assert retrain.state["reference"] == {"fraud_rate": 0.01, "mean_amount": 40.0}
+
+    retrain.state["trained_at"] -= retrain_manager.MIN_INTERVAL_SECONDS
+    worker_status(workspace, rows=400, fraud=4, amount=200 * 40.0 + 200 * 45.0)
+    retrain.observe_worker()
+    assert retrain.due() is None
+    worker_status(workspace, rows=600, fraud=24, amount=200 * 40.0 + 200 * 45.0 + 200 * 45.0)
+    retrain.observe_worker()
+    assert retrain.due() == "drift: fraud rate 0.01 -> 0.055"
+
+
+def test_a_failed_training_keeps_the_counts(workspace, monkeypatch):
+    monkeypatch.setattr(retrain_manager, "RETRAIN_THRESHOLD", 10)
+    train = FakeTraining(succeeds=False)
+    retrain = scheduler(workspace, train)
+    worker_status(workspace, rows=0)
+    retrain.check()
+    worker_status(workspace, rows=50)
+    assert not retrain.check()
+    state = load_state(str(workspace / "state.json"))
+    assert state["since_training"]["rows"] == 50
+    assert state["trainings"] == 0 and state["last_training"]["succeeded"] is False
+    assert not retrain.check() and len(train.calls) == 2  # retried on the next check
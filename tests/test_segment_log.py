@@ -0,0 +1,142 @@
+# test_segment_log.py
+#
+# Framing, checksums, torn-write recovery and checkpointing of the transaction queue.
+# Writers fsync on every append (fsync_interval_ms=0), so no background threads are left behind.
+
+import os
+import subprocess
+import sys
+
+from prediction_service.segment_log import (CLOSED_MARKER, FRAME_HEADER, SegmentLogReader, SegmentLogWriter,
+                                            _segments, decode_frames, encode_frames)
+
+
+def payloads(count, prefix=b"record"):
+    return [prefix + b"-%d" % index for index in range(count)]
+
+
+def writer(directory, **options):
+    return SegmentLogWriter(str(directory), fsync_interval_ms=0, **options)
+
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_frames_round_trip():
+    data = payloads(5)
+    decoded, records, consumed = decode_frames(encode_frames(data), max_records=100)
+    assert decoded == data
+    assert records == 5
+    assert consumed == len(encode_frames(data))
+
+
+def test_decoding_stops_at_a_corrupted_frame():
+    buffer = bytearray(encode_frames(payloads(3)))
+    second_payload = len(encode_frames(payloads(1))) + FRAME_HEADER.size
+    buffer[second_payload] ^= 0xFF
+    decoded, _, consumed = decode_frames(bytes(buffer), max_records=100)
+    assert decoded == payloads(1)
+    assert consumed == len(encode_frames(payloads(1)))
+
+
+def test_decoding_leaves_an_incomplete_frame_for_the_next_read():
+    buffer = encode_frames(payloads(2))
+    decoded, _, consumed = decode_frames(buffer[:-1], max_records=100)
+    assert decoded == payloads(1)
+    assert consumed == len(encode_frames(payloads(1)))
+
+
+def test_max_records_counts_records_not_payloads():
+    buffer = encode_frames([b"a", b"b", b"c"])
+    decoded, records, _ = decode_frames(buffer, max_records=4, record_count=lambda payload: 3)
+    assert decoded == [b"a", b"b"]
+    assert records == 6
+
+
+def test_reader_resumes_from_the_committed_checkpoint(tmp_path):
+    log = writer(tmp_path)
+    log.append(payloads(10))
+    reader = SegmentLogReader(str(tmp_path))
+    assert reader.read(max_records=4) == payloads(10)[:4]
+    reader.commit()
+    assert reader.read(max_records=3) == payloads(10)[4:7]
+
+    # Read but not committed: a new reader (e.g. after a crash) gets them again
+    restarted = SegmentLogReader(str(tmp_path))
+    assert restarted.read() == payloads(10)[4:]
+    restarted.rewind()
+    assert restarted.read() == payloads(10)[4:]
+    restarted.commit()
+    assert SegmentLogReader(str(tmp_path)).read() == []
+    log.close()
+
+
+def test_reads_across_rolled_segments_and_removes_consumed_ones(tmp_path):
+    log = writer(tmp_path, segment_bytes=64)
+    for batch in range(6):
+        log.append(payloads(3, prefix=b"batch%d" % batch))
+    partition = log.partition
+    assert len(_segments(partition)) > 1
+
+    reader = SegmentLogReader(str(tmp_path))
+    expected = [payload for batch in range(6) for payload in payloads(3, prefix=b"batch%d" % batch)]
+    assert reader.read() == expected
+    assert reader.backlog_bytes() == 0
+    reader.commit()
+    assert len(_segments(partition)) == 1  # the one still being written
+
+
+def test_closed_partition_is_removed_once_committed(tmp_path):
+    log = writer(tmp_path)
+    log.append(payloads(2))
+    log.close()
+    assert os.path.exists(os.path.join(log.partition, CLOSED_MARKER))
+
+    reader = SegmentLogReader(str(tmp_path))
+    assert reader.read() == payloads(2)
+    reader.commit()
+    assert not os.path.exists(log.partition)
+    assert SegmentLogReader(str(tmp_path)).read() == []
+
+
+def test_live_writer_keeps_its_partition_and_torn_tail(tmp_path):
+    log = writer(tmp_path)
+    log.append(payloads(2))
+    segment = os.path.join(log.partition, _segments(log.partition)[-1])
+    with open(segment, 'ab') as f:
+        f.write(encode_frames([b"half-written"])[:-3])
+
+    reader = SegmentLogReader(str(tmp_path))
+    assert reader.read() == payloads(2)
+    reader.commit()
+    assert os.path.exists(log.partition)  # the write may still complete
+    assert reader.backlog_bytes() > 0
+
+
+def test_dead_writer_partition_with_a_torn_tail_is_removed(tmp_path, capsys):
+    partition = tmp_path / f"{dead_pid()}-1"
+    partition.mkdir()
+    (partition / f"{0:020d}.seg").write_bytes(encode_frames(payloads(3)) + encode_frames([b"torn"])[:-2])
+
+    reader = SegmentLogReader(str(tmp_path))
+    assert reader.read() == payloads(3)
+    reader.commit()
+    assert not partition.exists()
+    assert "unreadable byte(s)" in capsys.readouterr().out
+
+
+def test_dead_writer_partition_with_unread_records_is_kept(tmp_path):
+    partition = tmp_path / f"{dead_pid()}-1"
+    partition.mkdir()
+    (partition / f"{0:020d}.seg").write_bytes(encode_frames(payloads(3)))
+
+    reader = SegmentLogReader(str(tmp_path))
+    assert reader.read(max_records=2) == payloads(2)
+    reader.commit()
+    assert partition.exists()
+    assert reader.read() == payloads(3)[2:]
+    reader.commit()
+    assert not partition.exists()
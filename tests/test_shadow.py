@@ -0,0 +1,149 @@
+# test_shadow.py
+#
+# The shadow scorer compares a candidate with the served answers off the request path, and
+# adds up the counters of every worker shadowing the same pair of models.
+
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from prediction_service import shadow as shadow_module
+from prediction_service.shadow import ShadowScorer, summarize
+
+
+class FakeModel:
+    """Stands in for main.LoadedModel: labels are fixed per record index."""
+
+    def __init__(self, version, labels):
+        self.version = version
+        self.labels = np.asarray(labels)
+
+    def describe(self):
+        return {"version": self.version}
+
+
+def score(records, extra, loaded):
+    labels = loaded.labels[records]
+    return labels, labels * 0.8
+
+
+@pytest.fixture(autouse=True)
+def fast_rounds(monkeypatch):
+    monkeypatch.setattr(shadow_module, "ROUND_INTERVAL_SECONDS", 0.01)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "shadow thread did not finish in time"
+        time.sleep(0.01)
+
+
+def offer_all(scorer, active, served):
+    records = list(range(len(served)))
+    labels = np.asarray(served)
+    scorer.offer(records, None, labels, labels * 0.6, active)
+
+
+def test_candidate_answers_are_compared_with_the_served_ones(tmp_path):
+    active, candidate = FakeModel("v1", [0, 1, 1, 0]), FakeModel("v2", [0, 1, 0, 1])
+    scorer = ShadowScorer(score, fraction=1.0, stats_dir=str(tmp_path))
+    scorer.set_candidate(candidate)
+    scorer.start()
+    try:
+        offer_all(scorer, active, [0, 1, 1, 0])
+        wait_for(lambda: scorer.compared == 4)
+    finally:
+        scorer.stop()
+
+    stats = scorer.stats()
+    assert (stats["active_version"], stats["candidate_version"]) == ("v1", "v2")
+    assert stats["disagreements"] == 2 and stats["disagreement_rate"] == 0.5
+    assert stats["fraud_only"] == {"active": 1, "candidate": 1}
+    assert stats["fraud_rate"] == {"active": 0.5, "candidate": 0.5}
+    assert stats["mean_probability_difference"] == pytest.approx((0.2 + 0.6 + 0.8) / 4)
+    assert stats["cpu_us_per_row"]["active"] is not None  # the first round also times the active model
+    assert os.path.exists(tmp_path / f"{os.getpid()}.json")
+
+
+def test_samples_are_dropped_when_overloaded_or_the_queue_is_full():
+    active, candidate = FakeModel("v1", [0] * 10), FakeModel("v2", [0] * 10)
+    overloaded = [True]
+    scorer = ShadowScorer(score, fraction=1.0, max_queued_rows=6, overloaded=lambda: overloaded[0])
+    scorer.set_candidate(candidate)
+    scorer._thread = object()  # accept samples without scoring them
+    offer_all(scorer, active, [0] * 5)
+    overloaded[0] = False
+    offer_all(scorer, active, [0] * 5)
+    offer_all(scorer, active, [0] * 5)
+
+    counters = scorer.counters()
+    assert counters["sampled_rows"] == 15
+    assert counters["dropped_overloaded"] == 5
+    assert counters["dropped_queue_full"] == 5
+    assert counters["queued_rows"] == 5
+
+
+def test_counters_add_up_with_concurrent_offers():
+    active, candidate = FakeModel("v1", [0] * 4), FakeModel("v2", [0] * 4)
+    scorer = ShadowScorer(score, fraction=1.0, max_queued_rows=10 ** 9,
+                          overloaded=lambda: threading.current_thread().name.endswith("odd"))
+    scorer.set_candidate(candidate)
+    scorer._thread = object()
+    threads = [threading.Thread(target=lambda: [offer_all(scorer, active, [0] * 4) for _ in range(2000)],
+                                name=f"offer-{index}-{'odd' if index % 2 else 'even'}") for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters = scorer.counters()
+    assert counters["sampled_rows"] == 8 * 2000 * 4
+    assert counters["dropped_overloaded"] == counters["queued_rows"] == 4 * 2000 * 4
+
+
+def test_nothing_is_sampled_without_a_candidate():
+    scorer = ShadowScorer(score, fraction=1.0)
+    scorer._thread = object()
+    offer_all(scorer, FakeModel("v1", [1]), [1])
+    assert scorer.counters()["sampled_rows"] == 0
+
+
+def published(scorer, pid, active_version, candidate_version, compared, disagreements):
+    counters = scorer.counters()
+    counters.update(pid=pid, active_version=active_version, candidate_version=candidate_version,
+                    compared_rows=compared, disagreements=disagreements)
+    return counters
+
+
+def test_stats_add_up_workers_shadowing_the_same_pair(tmp_path):
+    scorer = ShadowScorer(score, fraction=1.0, stats_dir=str(tmp_path))
+    scorer.set_candidate(FakeModel("v2", []))
+    scorer.reset(("v1", "v2"))
+    scorer.compared, scorer.disagreements = 10, 1
+    scorer.publish()
+
+    other = ShadowScorer(score, fraction=1.0, stats_dir=str(tmp_path))
+    for counters in (published(other, 1, "v1", "v2", 30, 3), published(other, 2, "v0", "v2", 50, 50)):
+        other.counters = lambda counters=counters: counters
+        other.publish()
+
+    stats = scorer.stats()
+    assert stats["workers"] == 2  # the worker that compared v2 with another active model is left out
+    assert stats["compared_rows"] == 40
+    assert stats["disagreement_rate"] == 0.1
+
+
+def test_summarize_keeps_the_latest_error():
+    scorer = ShadowScorer(score)
+    first, second = scorer.counters(), scorer.counters()
+    first["last_error"] = {"error": "old", "at": 1.0}
+    second["last_error"] = {"error": "new", "at": 2.0}
+    first["errors"], second["errors"] = 1, 2
+    summary = summarize([first, second])
+    assert summary["errors"] == 3
+    assert summary["last_error"]["error"] == "new"
+    assert summary["disagreement_rate"] is None
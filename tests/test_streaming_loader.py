@@ -0,0 +1,104 @@
+# test_streaming_loader.py
+#
+# The streamed training sample: the reservoirs stay uniform and within their capacity
+# however the stream is chunked, held-out rows never reach the training rows, and a saved
+# sample resumes exactly where it stopped.
+
+import numpy as np
+import pandas as pd
+
+from data_ingestion_and_retraining.streaming_loader import HOLDOUT_PERCENT, Reservoir, TrainingSample
+
+
+def make_chunk(transaction_ids, fraud_every=0):
+    """fraud_data rows whose amount is their TransactionID, so sampled rows can be traced back."""
+    transaction_ids = np.asarray(transaction_ids, dtype=np.int64)
+    fraud = (transaction_ids % fraud_every == 0).astype(int) if fraud_every else np.zeros(len(transaction_ids), dtype=int)
+    return pd.DataFrame({
+        "TransactionID": transaction_ids,
+        "step": transaction_ids // 10,
+        "amount": transaction_ids.astype(float),
+        "age": "'3'",
+        "gender": "'M'",
+        "fraud": fraud,
+    })
+
+
+def test_reservoir_never_exceeds_its_capacity():
+    reservoir = Reservoir(50, np.random.default_rng(0))
+    for start, count in ((0, 20), (20, 0), (20, 25), (45, 300), (345, 1)):
+        reservoir.add({"value": np.arange(start, start + count, dtype=np.int64)})
+        assert reservoir.size == min(start + count, 50)
+        assert reservoir.seen == start + count
+    values = reservoir.arrays()["value"]
+    assert len(values) == 50
+    assert len(np.unique(values)) == 50  # a row replaces a slot, it is never added twice
+    assert set(values) <= set(range(346))
+
+
+def test_reservoir_keeps_every_row_with_equal_probability():
+    capacity, stream, trials = 10, 100, 3000
+    rng = np.random.default_rng(7)
+    kept = np.zeros(stream)
+    for _ in range(trials):
+        reservoir = Reservoir(capacity, rng)
+        # Uneven chunks, including one that both fills the reservoir and starts replacing
+        for start, end in ((0, 3), (3, 30), (30, 31), (31, 100)):
+            reservoir.add({"value": np.arange(start, end)})
+        kept[reservoir.arrays()["value"]] += 1
+
+    frequencies = kept / trials
+    # Expected capacity / stream = 0.1 for every row; one standard deviation is about 0.0055
+    assert np.abs(frequencies - capacity / stream).max() < 0.03
+    assert abs(frequencies[:50].mean() - frequencies[50:].mean()) < 0.01
+
+
+def test_training_sample_keeps_fraud_rows_up_to_half_the_sample():
+    sample = TrainingSample(100, random_state=0)
+    for start in range(0, 5000, 700):
+        sample.add_chunk(make_chunk(range(start, min(start + 700, 5000)), fraud_every=20))
+
+    frame = sample.to_frame()
+    assert len(frame) == 100
+    assert sample.fraud.size == 50  # 150 fraud rows outside the hold-out, capped at half
+    assert int(frame["fraud"].sum()) == 50
+    assert sample.holdout.size == 30
+    assert sample.rows_seen == 5000
+
+
+def test_held_out_transaction_ids_never_reach_the_training_rows():
+    sample = TrainingSample(400, random_state=0)
+    for start in range(0, 20000, 3000):
+        sample.add_chunk(make_chunk(range(start, min(start + 3000, 20000)), fraud_every=7))
+
+    training_ids = sample.to_frame()["amount"].to_numpy().astype(np.int64)
+    holdout_ids = sample.holdout_frame()["amount"].to_numpy().astype(np.int64)
+    assert len(training_ids) == 400 and len(holdout_ids) == 120
+    assert (training_ids % 100 >= HOLDOUT_PERCENT).all()
+    assert (holdout_ids % 100 < HOLDOUT_PERCENT).all()
+    assert sample.holdout.seen == 6000
+
+
+def test_saved_sample_round_trips_with_its_high_water_mark(tmp_path):
+    directory = str(tmp_path / "training_cache")
+    assert TrainingSample.saved_high_water_mark(directory) is None
+    assert TrainingSample.load(directory) is None
+
+    sample = TrainingSample(200, random_state=3)
+    sample.add_chunk(make_chunk(range(1, 4001), fraud_every=9))
+    sample.save(directory)
+    assert TrainingSample.saved_high_water_mark(directory) == 4000
+
+    restored = TrainingSample.load(directory)
+    assert restored.high_water_mark == 4000
+    assert restored.rows_seen == sample.rows_seen == 4000
+    pd.testing.assert_frame_equal(restored.to_frame(), sample.to_frame())
+    pd.testing.assert_frame_equal(restored.holdout_frame(), sample.holdout_frame())
+
+    # The random state is restored too, so extending either one gives the same sample
+    new_rows = make_chunk(range(4001, 6001), fraud_every=9)
+    sample.add_chunk(new_rows)
+    restored.add_chunk(new_rows)
+    assert restored.high_water_mark == 6000
+    pd.testing.assert_frame_equal(restored.to_frame(), sample.to_frame())
+    pd.testing.assert_frame_equal(restored.holdout_frame(), sample.holdout_frame())
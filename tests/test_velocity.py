@@ -0,0 +1,122 @@
+# test_velocity.py
+#
+# Window expiry, exact distinct-merchant counts, eviction and saved state of the velocity features.
+
+import random
+
+import numpy as np
+import pandas as pd
+
+from prediction_service.velocity import (MERCHANT_SET_BITS, STATE_ARRAYS_FILE, SlidingWindowTable, VelocityFeatures,
+                                         velocity_feature_names)
+
+
+def brute_force(history, customer, merchant, step, window):
+    """The features of a transaction computed from the full history, for comparison."""
+    mine = [t for t in history if t[0] == customer and step - window < t[2] <= step]
+    theirs = [t for t in history if t[1] == merchant and step - window < t[2] <= step]
+    return (len(mine), sum(t[3] for t in mine), max((t[3] for t in mine), default=0.0), len({t[1] for t in mine}),
+            len(theirs), sum(t[3] for t in theirs), max((t[3] for t in theirs), default=0.0))
+
+
+def test_transactions_leave_the_window():
+    table = SlidingWindowTable(max_keys=4, window=3)
+    assert table.observe("c", 1, 10.0) == (0, 0.0, 0.0, 0)
+    assert table.observe("c", 2, 5.0) == (1, 10.0, 10.0, 0)
+    assert table.observe("c", 3, 1.0) == (2, 15.0, 10.0, 0)
+    # Step 1 is outside (4 - 3, 4]; its bucket is reused
+    assert table.observe("c", 4, 2.0) == (2, 6.0, 5.0, 0)
+    assert table.observe("c", 20, 1.0) == (0, 0.0, 0.0, 0)
+
+
+def test_a_transaction_older_than_its_bucket_is_not_recorded():
+    table = SlidingWindowTable(max_keys=2, window=3)
+    table.observe("c", 5, 1.0)
+    table.observe("c", 2, 100.0)  # same bucket as step 5
+    assert table.observe("c", 5, 1.0) == (1, 1.0, 1.0, 0)
+
+
+def test_features_match_a_brute_force_replay():
+    rng = random.Random(11)
+    window = 4
+    velocity = VelocityFeatures(window=window, max_customers=1000, max_merchants=1000)
+    history, rows, expected = [], [], []
+    for step in range(1, 30):
+        for _ in range(rng.randint(0, 8)):
+            # Up to 64 merchants, each with a bit of its own
+            transaction = (f"C{rng.randint(0, 5)}", f"M{rng.randint(0, 63)}", step, float(rng.randint(1, 500)))
+            expected.append(brute_force(history, *transaction[:3], window))
+            rows.append(dict(zip(("customer", "merchant", "step", "amount"), transaction)))
+            history.append(transaction)
+    np.testing.assert_allclose(velocity.observe_many(rows), np.array(expected))
+
+
+def test_merchants_beyond_the_set_width_share_bits():
+    velocity = VelocityFeatures(window=3, max_customers=10, max_merchants=1000)
+    for index in range(300):
+        velocity.observe("C1", f"M{index}", 1, 1.0)
+    count = velocity.observe("C1", "M0", 1, 1.0)[3]
+    assert MERCHANT_SET_BITS // 2 < count <= MERCHANT_SET_BITS
+    assert len(velocity.merchant_ids) == MERCHANT_SET_BITS
+
+
+def test_memory_does_not_grow_with_the_number_of_merchants(tmp_path):
+    def run(merchants):
+        velocity = VelocityFeatures(window=4, max_customers=50, max_merchants=50)
+        for index in range(5000):
+            velocity.observe(f"C{index % 40}", f"M{index % merchants}", index // 500, 1.0)
+        velocity.save(str(tmp_path / str(merchants)))
+        with np.load(tmp_path / str(merchants) / STATE_ARRAYS_FILE) as saved:
+            return velocity.stats(), len(velocity.merchant_ids), saved["customers.merchants"].nbytes
+
+    few, many = run(10), run(5000)
+    assert few[0]["customers"]["bytes"] == many[0]["customers"]["bytes"]
+    assert few[0]["merchants"]["bytes"] == many[0]["merchants"]["bytes"]
+    assert many[1] == MERCHANT_SET_BITS
+    assert few[2] == many[2]
+
+
+def test_quoted_ids_from_the_dataset_match_the_api_form():
+    velocity = VelocityFeatures(window=3, max_customers=10, max_merchants=10)
+    velocity.observe("'C1'", "'M1'", 1, 10.0)
+    assert velocity.observe("C1", "M1", 2, 1.0) == (1, 10.0, 10.0, 1, 1, 10.0, 10.0)
+
+
+def test_full_table_evicts_keys_outside_the_window_first():
+    table = SlidingWindowTable(max_keys=2, window=3)
+    table.observe("old", 1, 1.0)
+    table.observe("recent", 9, 1.0)
+    table.observe("new", 10, 1.0)
+    assert set(table.slots) == {"recent", "new"}
+    assert table.evictions == 1
+    assert table.observe("recent", 10, 1.0) == (1, 1.0, 1.0, 0)
+
+
+def test_add_to_frame_adds_the_named_columns():
+    velocity = VelocityFeatures(window=5, max_customers=10, max_merchants=10)
+    df = pd.DataFrame({"customer": ["C1", "C1"], "merchant": ["M1", "M2"], "step": [1, 2], "amount": [3.0, 4.0]})
+    velocity.add_to_frame(df)
+    assert list(df.columns[-7:]) == velocity_feature_names(5)
+    assert df.iloc[1][velocity_feature_names(5)].tolist() == [1, 3.0, 3.0, 1, 0, 0.0, 0.0]
+
+
+def test_saved_state_continues_the_stream(tmp_path):
+    rng = random.Random(5)
+    transactions = [(f"C{rng.randint(0, 9)}", f"M{rng.randint(0, 99)}", step, float(rng.randint(1, 50)))
+                    for step in range(1, 15) for _ in range(10)]
+    limits = dict(window=4, max_customers=100, max_merchants=200)
+    uninterrupted = VelocityFeatures(**limits)
+    resumed = VelocityFeatures(**limits)
+    for transaction in transactions[:80]:
+        uninterrupted.observe(*transaction)
+        resumed.observe(*transaction)
+    resumed.save(str(tmp_path))
+    resumed = VelocityFeatures.load(str(tmp_path), **limits)
+
+    assert [resumed.observe(*t) for t in transactions[80:]] == [uninterrupted.observe(*t) for t in transactions[80:]]
+
+
+def test_state_for_another_window_is_not_loaded(tmp_path):
+    VelocityFeatures(window=4, max_customers=10, max_merchants=10).save(str(tmp_path))
+    assert VelocityFeatures.load(str(tmp_path), window=5, max_customers=10, max_merchants=10) is None
+    assert VelocityFeatures.load(str(tmp_path / "missing"), window=4) is None